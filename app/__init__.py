@@ -3,37 +3,53 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 from flask_bcrypt import Bcrypt
 from flask_jwt_extended import JWTManager
-import os
-from datetime import timedelta
-from datetime import datetime
-
-# Change jwt_blocklist to use a dict to store token expiry
-jwt_blocklist = {}
+from collections.abc import Mapping
+from app.blocklist import TokenBlocklist
+from app.cache import ResponseCache
+from app.config import Config
+from app.database import engine_options, tune_sqlite
+from app.events import EventBroker
+from app.exports import ExportManager
+from app.hashing import PasswordHasher
+from app.identity import IdentityCache
+from app.metrics import Metrics
 
 db = SQLAlchemy()
 bcrypt = Bcrypt()
 jwt = JWTManager()
 login_manager = LoginManager()
+jwt_blocklist = TokenBlocklist()
+password_hasher = PasswordHasher(bcrypt)
+identity_cache = IdentityCache(jwt)
+response_cache = ResponseCache()
+metrics = Metrics()
+export_jobs = ExportManager()
+event_broker = EventBroker()
 
-def create_app():
+def create_app(config=None):
     app = Flask(__name__)
     
-    # Configuration
-    app.config['SECRET_KEY'] = os.urandom(32)
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///expense_sharing.db'
-    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-    app.config['JWT_SECRET_KEY'] = os.urandom(32)
-    app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(hours=1)
-    app.config['JWT_REFRESH_TOKEN_EXPIRES'] = timedelta(days=30)
-    # Add this configuration
-    app.config['JWT_ERROR_MESSAGE_KEY'] = 'error'
+    # Configuration: defaults and environment, then explicit overrides
+    app.config.from_object(Config)
+    if isinstance(config, Mapping):
+        app.config.update(config)
+    elif config is not None:
+        app.config.from_object(config)
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config)
     
     # Initialize extensions
     db.init_app(app)
     bcrypt.init_app(app)
+    password_hasher.init_app(app)
     jwt.init_app(app)
+    identity_cache.init_app(app)
     login_manager.init_app(app)
     login_manager.login_view = 'auth.login'
+    jwt_blocklist.init_app(app)
+    response_cache.init_app(app)
+    metrics.init_app(app)
+    export_jobs.init_app(app)
+    event_broker.init_app(app)
     
     # Register blueprints
     from app.auth import auth_bp
@@ -44,7 +60,23 @@ def create_app():
     app.register_blueprint(expenses_bp)
     app.register_blueprint(users_bp)
     
+    # Register CLI commands
+    from app.archive import archive_cli
+    from app.ledger import ledger_cli
+    from app.migrations import db_cli, upgrade
+    from app.provisioning import users_cli
+    from app.rollups import rollups_cli
+    
+    app.cli.add_command(ledger_cli)
+    app.cli.add_command(db_cli)
+    app.cli.add_command(rollups_cli)
+    app.cli.add_command(users_cli)
+    app.cli.add_command(archive_cli)
+    
     with app.app_context():
-        db.create_all()
+        tune_sqlite(db.engine, app.config)
+        metrics.instrument(db.engine)
+        # Bring the schema up to date; replaces db.create_all()
+        upgrade()
     
     return app
\ No newline at end of file
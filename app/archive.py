@@ -0,0 +1,174 @@
+import hashlib
+import click
+from flask.cli import AppGroup
+from sqlalchemy import delete, insert
+from sqlalchemy.dialects.sqlite import insert as upsert
+from .expenses import expense_tables, union_all
+from .ledger import compute_balances, expense_balances
+from .models import (BalanceCheckpoint, Expense, ExpenseArchive, ExpenseParticipant,
+                     ExpenseParticipantArchive, db)
+
+archive_cli = AppGroup('archive', help='Move old expenses to the archive tables.')
+
+ARCHIVE_BATCH_SIZE = 5000
+EXPENSE_COLUMNS = ['id', 'description', 'amount_cents', 'date', 'split_type', 'creator_id']
+PARTICIPANT_COLUMNS = ['id', 'expense_id', 'user_id', 'share_cents', 'share_percentage', 'expense_date']
+
+def archivable_ids(before):
+    """Select of live expense ids dated before the cutoff.
+
+    The newest expense always stays live: SQLite hands out max(id) + 1 for
+    new rows, so archiving it would let the next expense reuse an archived
+    id. The bound is read once, so expenses added meanwhile are never picked.
+    """
+    newest = db.session.query(db.func.max(Expense.id)).scalar() or 0
+    return db.select(Expense.id).where(Expense.date < before, Expense.id < newest)
+
+def archive_counts(ids):
+    return {
+        'expenses': db.session.query(db.func.count()).select_from(ids.subquery()).scalar(),
+        'participants': ExpenseParticipant.query.\
+            filter(ExpenseParticipant.expense_id.in_(ids)).count(),
+        'checkpoints': 0
+    }
+
+def ledger_balances():
+    """compute_balances() without the pairs that net to zero"""
+    return {pair: amount for pair, amount in compute_balances().items() if amount}
+
+def expenses_digest():
+    """Hash of every expense and participant row, live and archived, by id"""
+    digest = hashlib.sha256()
+    tables = expense_tables(include_archived=True)
+    expenses = union_all([
+        db.session.query(
+            expense.id, expense.description, expense.amount_cents,
+            expense.date, expense.split_type, expense.creator_id
+        ) for expense, _ in tables
+    ]).order_by(Expense.id)
+    participants = union_all([
+        db.session.query(
+            participant.id, participant.expense_id, participant.user_id,
+            participant.share_cents, participant.share_percentage
+        ) for _, participant in tables
+    ]).order_by(ExpenseParticipant.expense_id, ExpenseParticipant.id)
+    for query in (expenses, participants):
+        for row in query.execution_options(yield_per=ARCHIVE_BATCH_SIZE):
+            digest.update(repr(tuple(row)).encode('utf-8'))
+    return digest.hexdigest()
+
+def archive_expenses(before):
+    """Move expenses dated before the cutoff to the archive; returns the counts.
+
+    Runs in one transaction: the expenses' balances are folded into the
+    checkpoints, then their rows are copied with the same ids and deleted
+    from the live tables. The ledger recomputed from checkpoints plus live
+    expenses and a digest of the whole history, live and archived, must be
+    identical before and after, otherwise everything is rolled back. An
+    expense added while this runs also triggers the rollback; run it again.
+    """
+    ids = archivable_ids(before)
+    counts = archive_counts(ids)
+    if not counts['expenses']:
+        return counts
+
+    balances = ledger_balances()
+    digest = expenses_digest()
+    try:
+        deltas = {pair: amount for pair, amount in
+                  expense_balances(Expense, ExpenseParticipant, ids).items() if amount}
+        if deltas:
+            stmt = upsert(BalanceCheckpoint)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=['user_id', 'counterparty_id'],
+                set_={
+                    'amount_cents': BalanceCheckpoint.amount_cents + stmt.excluded.amount_cents,
+                    'archived_before': db.func.max(
+                        BalanceCheckpoint.archived_before, stmt.excluded.archived_before
+                    ),
+                }
+            )
+            db.session.execute(stmt, [{
+                'user_id': user_id,
+                'counterparty_id': counterparty_id,
+                'amount_cents': amount,
+                'archived_before': before
+            } for (user_id, counterparty_id), amount in deltas.items()])
+        counts['checkpoints'] = len(deltas)
+
+        db.session.execute(
+            insert(ExpenseArchive).from_select(
+                EXPENSE_COLUMNS,
+                db.select(*(getattr(Expense, name) for name in EXPENSE_COLUMNS)).
+                    where(Expense.id.in_(ids))
+            )
+        )
+        db.session.execute(
+            insert(ExpenseParticipantArchive).from_select(
+                PARTICIPANT_COLUMNS,
+                db.select(*(getattr(ExpenseParticipant, name) for name in PARTICIPANT_COLUMNS)).
+                    where(ExpenseParticipant.expense_id.in_(ids)).
+                    order_by(ExpenseParticipant.id)
+            )
+        )
+        db.session.execute(delete(ExpenseParticipant).where(ExpenseParticipant.expense_id.in_(ids)))
+        db.session.execute(delete(Expense).where(Expense.id.in_(ids)))
+
+        if ledger_balances() != balances:
+            raise click.ClickException('Balances changed while archiving; rolled back.')
+        if expenses_digest() != digest:
+            raise click.ClickException('Expense history changed while archiving; rolled back.')
+        db.session.commit()
+    except BaseException:
+        db.session.rollback()
+        raise
+    return counts
+
+def find_checkpoint_drift():
+    """(user_id, counterparty_id, stored, expected) for checkpoints that disagree
+    with the archived expenses"""
+    expected = {pair: amount for pair, amount in
+                expense_balances(ExpenseArchive, ExpenseParticipantArchive).items() if amount}
+    stored = {
+        (row.user_id, row.counterparty_id): row.amount_cents
+        for row in BalanceCheckpoint.query if row.amount_cents
+    }
+    return [
+        (pair[0], pair[1], stored.get(pair), expected.get(pair))
+        for pair in sorted(set(expected) | set(stored))
+        if stored.get(pair) != expected.get(pair)
+    ]
+
+@archive_cli.command('run')
+@click.option('--before', required=True, type=click.DateTime(formats=['%Y-%m-%d']),
+              help='Archive expenses dated before this day (YYYY-MM-DD).')
+@click.option('--dry-run', is_flag=True, help='Only report what would be archived.')
+def run_command(before, dry_run):
+    """Move expenses older than --before to the archive tables.
+
+    Their balances are kept as checkpoints, so /user/balance is unchanged.
+    They are still listed and exported with include_archived=1.
+    """
+    if dry_run:
+        counts = archive_counts(archivable_ids(before))
+        click.echo(f'Would archive {counts["expenses"]} expenses '
+                   f'with {counts["participants"]} participants.')
+        return
+
+    counts = archive_expenses(before)
+    click.echo(f'Archived {counts["expenses"]} expenses with {counts["participants"]} '
+               f'participants into {counts["checkpoints"]} checkpoint rows.')
+
+@archive_cli.command('verify')
+def verify_command():
+    """Check the checkpoints against the archived expenses."""
+    drift = find_checkpoint_drift()
+    for user_id, counterparty_id, stored, expected in drift:
+        click.echo(f'user {user_id} / {counterparty_id}: stored={stored} expected={expected}')
+    overlap = db.session.query(db.func.count(Expense.id)).\
+        join(ExpenseArchive, ExpenseArchive.id == Expense.id).scalar()
+    if overlap:
+        click.echo(f'{overlap} expense id(s) are both live and archived.')
+    if drift or overlap:
+        raise SystemExit(1)
+    click.echo('Checkpoints are consistent with the archived expenses.')
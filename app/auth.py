@@ -10,7 +10,6 @@ from flask_jwt_extended import (
 from .models import User, db
 import re
 from . import jwt_blocklist, jwt
-from datetime import datetime, timezone
 auth_bp = Blueprint('auth', __name__)
 
 def validate_password(password):
@@ -33,28 +32,41 @@ def validate_password(password):
         return False
     return True
 
-@auth_bp.route('/register', methods=['POST'])
-def register():
-    data = request.get_json()
-    
+EMAIL_PATTERN = re.compile(r'^[\w\.-]+@[\w\.-]+\.\w+$')
+MOBILE_PATTERN = re.compile(r'^\+?[\d\s-]{10,}$')
+REGISTRATION_FIELDS = ['email', 'name', 'mobile', 'password']
+
+def validate_registration(data):
+    """Check a registration's fields; returns an error message or None.
+
+    Shared by /register and "flask users import". Existing accounts are
+    checked separately by each caller.
+    """
     # Validate required fields
-    required_fields = ['email', 'name', 'mobile', 'password']
-    if not all(field in data for field in required_fields):
-        return jsonify({'error': 'Missing required fields'}), 400
+    if not isinstance(data, dict) or \
+            not all(isinstance(data.get(field), str) for field in REGISTRATION_FIELDS):
+        return 'Missing required fields'
     
     # Validate email format
-    if not re.match(r'^[\w\.-]+@[\w\.-]+\.\w+$', data['email']):
-        return jsonify({'error': 'Invalid email format'}), 400
+    if not EMAIL_PATTERN.match(data['email']):
+        return 'Invalid email format'
     
     # Validate mobile number
-    if not re.match(r'^\+?[\d\s-]{10,}$', data['mobile']):
-        return jsonify({'error': 'Invalid mobile number'}), 400
+    if not MOBILE_PATTERN.match(data['mobile']):
+        return 'Invalid mobile number'
     
     # Validate password strength
     if not validate_password(data['password']):
-        return jsonify({
-            'error': 'Password must be at least 8 characters long and contain uppercase, lowercase, numbers, and special characters'
-        }), 400
+        return 'Password must be at least 8 characters long and contain uppercase, lowercase, numbers, and special characters'
+    return None
+
+@auth_bp.route('/register', methods=['POST'])
+def register():
+    data = request.get_json()
+    
+    error = validate_registration(data)
+    if error:
+        return jsonify({'error': error}), 400
     
     # Check if user already exists
     if User.query.filter_by(email=data['email']).first():
@@ -74,7 +86,7 @@ def register():
     try:
         db.session.add(user)
         db.session.commit()
-        access_token = create_access_token(identity=user.id)
+        access_token = create_access_token(identity=str(user.id))
         return jsonify({
             'message': 'Registration successful',
             'access_token': access_token
@@ -94,7 +106,7 @@ def login():
     
     if user and user.check_password(data['password']):
         login_user(user)
-        access_token = create_access_token(identity=user.id)
+        access_token = create_access_token(identity=str(user.id))
         return jsonify({
             'message': 'Login successful',
             'access_token': access_token
@@ -104,16 +116,8 @@ def login():
 
 @jwt.token_in_blocklist_loader
 def check_if_token_revoked(jwt_header, jwt_payload):
-    jti = jwt_payload["jti"]
-    token_blocked = jwt_blocklist.get(jti, None)
-    if token_blocked is None:
-        return False
-    # Check if the token has expired
-    expiry = datetime.fromtimestamp(token_blocked, tz=timezone.utc)
-    if datetime.now(timezone.utc) > expiry:
-        del jwt_blocklist[jti]
-        return False
-    return True
+    # Expired entries are purged by the blocklist itself
+    return jwt_blocklist.is_revoked(jwt_payload["jti"])
 
 @auth_bp.route('/logout', methods=['POST'])
 @jwt_required()
@@ -125,7 +129,7 @@ def logout():
         exp = token["exp"]
         
         # Store the token's JTI and expiry time in the blocklist
-        jwt_blocklist[jti] = exp
+        jwt_blocklist.add(jti, exp)
         
         # Also logout from Flask-Login session if user is logged in
         if current_user.is_authenticated:
@@ -0,0 +1,154 @@
+import heapq
+import os
+import sqlite3
+import threading
+import time
+
+class MemoryBlocklist:
+    """Process-local blocklist.
+
+    Revoked jtis live in a dict for O(1) lookups, and a heap ordered by expiry
+    lets purge() drop every expired entry without scanning the rest.
+    """
+
+    def __init__(self, purge_interval=60):
+        self.purge_interval = purge_interval
+        self._expiry = {}
+        self._heap = []
+        self._lock = threading.Lock()
+        self._next_purge = 0
+
+    def add(self, jti, exp):
+        with self._lock:
+            self._expiry[jti] = exp
+            heapq.heappush(self._heap, (exp, jti))
+        self._maybe_purge()
+
+    def is_revoked(self, jti):
+        self._maybe_purge()
+        exp = self._expiry.get(jti)
+        return exp is not None and exp > time.time()
+
+    def purge(self, now=None):
+        """Drop every expired jti; returns how many were removed"""
+        now = time.time() if now is None else now
+        removed = 0
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                exp, jti = heapq.heappop(self._heap)
+                # Skip stale heap entries for jtis that were re-added
+                if self._expiry.get(jti) == exp:
+                    del self._expiry[jti]
+                    removed += 1
+        return removed
+
+    def _maybe_purge(self):
+        now = time.time()
+        if now >= self._next_purge:
+            self._next_purge = now + self.purge_interval
+            self.purge(now)
+
+    def __len__(self):
+        return len(self._expiry)
+
+class SQLiteBlocklist:
+    """Blocklist shared by every worker on the host through a SQLite file.
+
+    Lookups hit the jti primary key; expired rows are deleted in bulk
+    through an index on the expiry time.
+    """
+
+    def __init__(self, path, purge_interval=60):
+        self.path = path
+        self.purge_interval = purge_interval
+        self._local = threading.local()
+        self._next_purge = 0
+        with self._connect() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS jwt_blocklist ('
+                'jti TEXT PRIMARY KEY, expires_at INTEGER NOT NULL)'
+            )
+            conn.execute(
+                'CREATE INDEX IF NOT EXISTS ix_jwt_blocklist_expires_at '
+                'ON jwt_blocklist (expires_at)'
+            )
+
+    def _connect(self):
+        # sqlite3 connections must not be shared between threads
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    def add(self, jti, exp):
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO jwt_blocklist (jti, expires_at) VALUES (?, ?)',
+                (jti, int(exp))
+            )
+        self._maybe_purge()
+
+    def is_revoked(self, jti):
+        self._maybe_purge()
+        row = self._connect().execute(
+            'SELECT 1 FROM jwt_blocklist WHERE jti = ? AND expires_at > ?',
+            (jti, time.time())
+        ).fetchone()
+        return row is not None
+
+    def purge(self, now=None):
+        """Drop every expired jti; returns how many were removed"""
+        now = time.time() if now is None else now
+        with self._connect() as conn:
+            return conn.execute(
+                'DELETE FROM jwt_blocklist WHERE expires_at <= ?', (now,)
+            ).rowcount
+
+    def _maybe_purge(self):
+        # Each worker purges on its own schedule; deletes are idempotent
+        now = time.time()
+        if now >= self._next_purge:
+            self._next_purge = now + self.purge_interval
+            self.purge(now)
+
+    def __len__(self):
+        return self._connect().execute('SELECT COUNT(*) FROM jwt_blocklist').fetchone()[0]
+
+class TokenBlocklist:
+    """Revoked JWT store whose backend is chosen by JWT_BLOCKLIST_BACKEND.
+
+    'memory' (the default) keeps revocations per process; 'sqlite' shares
+    them between workers through the file at JWT_BLOCKLIST_PATH.
+    """
+
+    def __init__(self, app=None):
+        self.backend = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        backend = app.config.setdefault('JWT_BLOCKLIST_BACKEND', 'memory')
+        purge_interval = app.config.setdefault('JWT_BLOCKLIST_PURGE_INTERVAL', 60)
+
+        if backend == 'memory':
+            self.backend = MemoryBlocklist(purge_interval)
+        elif backend == 'sqlite':
+            path = app.config.get('JWT_BLOCKLIST_PATH')
+            if not path:
+                os.makedirs(app.instance_path, exist_ok=True)
+                path = os.path.join(app.instance_path, 'jwt_blocklist.db')
+            self.backend = SQLiteBlocklist(path, purge_interval)
+        else:
+            raise ValueError(f'Unknown JWT_BLOCKLIST_BACKEND: {backend!r}')
+
+    def add(self, jti, exp):
+        """Revoke jti until its expiry timestamp"""
+        self.backend.add(jti, exp)
+
+    def is_revoked(self, jti):
+        return self.backend.is_revoked(jti)
+
+    def purge(self):
+        return self.backend.purge()
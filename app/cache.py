@@ -0,0 +1,151 @@
+from collections import OrderedDict, namedtuple
+from functools import wraps
+import hashlib
+import threading
+import time
+from flask import make_response, request
+from flask_jwt_extended import get_jwt_identity
+
+CachedResponse = namedtuple('CachedResponse', 'etag body mimetype headers expires')
+
+# Response headers worth replaying from the cache
+CACHED_HEADERS = ('X-Next-Cursor', 'Vary')
+
+class ResponseCache:
+    """Per-user cache of rendered responses with LRU and TTL eviction.
+
+    Entries are grouped by user so invalidate() can drop exactly the
+    responses of the users touched by a write. Invalidations are numbered,
+    and a response computed while its user was invalidated is not stored,
+    so a slow read can never resurrect stale data. The last invalidation of
+    each user is remembered in a bounded LRU like the entries; once one is
+    evicted, reads that started before it are not stored for anyone.
+
+    The cache is per process; with several workers RESPONSE_CACHE_TTL
+    bounds how stale another worker's copy can be.
+    """
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self._entries = OrderedDict()
+        self._keys_by_user = {}
+        self._clock = 0  # invalidations so far
+        self._invalidated = OrderedDict()  # user id -> clock at their last invalidation
+        self._floor = 0  # clock of the newest invalidation no longer in _invalidated
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.setdefault('RESPONSE_CACHE_ENABLED', True)
+        self.max_entries = app.config.setdefault('RESPONSE_CACHE_SIZE', 10000)
+        self.ttl = app.config.setdefault('RESPONSE_CACHE_TTL', 60)
+
+    def generation(self):
+        """Token to pass to set() for a response about to be computed"""
+        return self._clock
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.expires <= time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry, generation):
+        user_id = key[0]
+        with self._lock:
+            if self._invalidated.get(user_id, self._floor) > generation:
+                return
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            self._keys_by_user.setdefault(user_id, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self, user_ids):
+        """Drop every cached response of the given users"""
+        with self._lock:
+            self._clock += 1
+            for user_id in user_ids:
+                user_id = int(user_id)
+                self._invalidated[user_id] = self._clock
+                self._invalidated.move_to_end(user_id)
+                for key in self._keys_by_user.pop(user_id, ()):
+                    self._entries.pop(key, None)
+            while len(self._invalidated) > self.max_entries:
+                _, self._floor = self._invalidated.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._clock += 1
+            self._floor = self._clock
+            self._invalidated.clear()
+            self._entries.clear()
+            self._keys_by_user.clear()
+
+    def cached(self, view):
+        """Cache a @jwt_required view's 200 responses per user, with ETags.
+
+        A request whose If-None-Match matches the cached ETag gets a 304
+        without running the view, so polling an unchanged resource never
+        touches the database. Apply below @jwt_required.
+        """
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if not self.enabled:
+                return view(*args, **kwargs)
+
+            user_id = int(get_jwt_identity())
+            key = (user_id, request.full_path, request.headers.get('Accept', ''))
+
+            entry = self.get(key)
+            if entry is not None:
+                if entry.etag in request.if_none_match:
+                    response = make_response('', 304)
+                else:
+                    response = make_response(entry.body)
+                    response.mimetype = entry.mimetype
+                    response.headers.update(entry.headers)
+                response.set_etag(entry.etag)
+                return private(response)
+
+            generation = self.generation()
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200 or response.is_streamed:
+                return response
+
+            body = response.get_data()
+            etag = hashlib.sha1(body).hexdigest()
+            self.set(key, CachedResponse(
+                etag,
+                body,
+                response.mimetype,
+                {name: response.headers[name] for name in CACHED_HEADERS if name in response.headers},
+                time.monotonic() + self.ttl
+            ), generation)
+
+            if etag in request.if_none_match:
+                response = make_response('', 304)
+            response.set_etag(etag)
+            return private(response)
+        return wrapper
+
+    def _remove(self, key):
+        self._entries.pop(key, None)
+        keys = self._keys_by_user.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_user[key[0]]
+
+
+def private(response):
+    # Clients must revalidate, and shared caches must not store per-user data
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.vary.add('Authorization')
+    return response
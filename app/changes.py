@@ -0,0 +1,48 @@
+import base64
+import datetime
+from sqlalchemy import insert
+from .models import ExpenseChange, db
+
+CHANGE_ACTIONS = ('created', 'updated', 'deleted')
+
+def record_changes(changes, action):
+    """Log an action on expenses for everyone they affect; caller commits.
+
+    changes is an iterable of (expense_id, user_ids). Edits and deletes must
+    include users who were removed from the expense, so their clients learn
+    to drop it. Returns the (id, user_id, expense_id, action) rows written.
+    """
+    if action not in CHANGE_ACTIONS:
+        raise ValueError(f'Unknown change action: {action!r}')
+    now = datetime.datetime.utcnow()
+    rows = [
+        {'user_id': user_id, 'expense_id': expense_id, 'action': action, 'changed_at': now}
+        for expense_id, user_ids in changes
+        for user_id in sorted(user_ids)
+    ]
+    if not rows:
+        return []
+    return db.session.execute(
+        insert(ExpenseChange).returning(
+            ExpenseChange.id, ExpenseChange.user_id, ExpenseChange.expense_id, ExpenseChange.action,
+            sort_by_parameter_order=True
+        ),
+        rows
+    ).all()
+
+def changes_query(user_id, since=0):
+    """(change id, expense_id) of the user's changes after since, oldest first"""
+    return db.session.query(ExpenseChange.id, ExpenseChange.expense_id).\
+        filter(ExpenseChange.user_id == user_id, ExpenseChange.id > since).\
+        order_by(ExpenseChange.id)
+
+def encode_change_cursor(change_id):
+    return base64.urlsafe_b64encode(str(change_id).encode('ascii')).decode('ascii')
+
+def decode_change_cursor(cursor):
+    """Decode a cursor from encode_change_cursor, or return None if it is malformed"""
+    try:
+        change_id = int(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('ascii'))
+    except (ValueError, UnicodeError):
+        return None
+    return change_id if change_id >= 0 else None
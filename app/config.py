@@ -0,0 +1,85 @@
+import os
+from datetime import timedelta
+
+def env_bool(name, default):
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+def env_int(name, default):
+    value = os.environ.get(name)
+    return default if value in (None, '') else int(value)
+
+class Config:
+    """Default configuration; every setting can be overridden from the environment.
+
+    Pass a mapping or another config object to create_app() to override
+    these, e.g. in tests and benchmarks.
+    """
+    # Keys are random per process unless provided; set them explicitly when
+    # running several workers so tokens are valid on all of them
+    SECRET_KEY = os.environ.get('SECRET_KEY') or os.urandom(32)
+    JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY') or os.urandom(32)
+    JWT_ACCESS_TOKEN_EXPIRES = timedelta(hours=1)
+    JWT_REFRESH_TOKEN_EXPIRES = timedelta(days=30)
+    JWT_ERROR_MESSAGE_KEY = 'error'
+    # 'sqlite' shares logouts between worker processes
+    JWT_BLOCKLIST_BACKEND = os.environ.get('JWT_BLOCKLIST_BACKEND', 'memory')
+
+    # bcrypt work factor and the number of hashes computed concurrently
+    BCRYPT_LOG_ROUNDS = env_int('BCRYPT_LOG_ROUNDS', 12)
+    PASSWORD_HASH_WORKERS = env_int('PASSWORD_HASH_WORKERS', os.cpu_count() or 1)
+
+    # Snapshots of users' rows resolved from their tokens
+    IDENTITY_CACHE_ENABLED = env_bool('IDENTITY_CACHE_ENABLED', True)
+    IDENTITY_CACHE_SIZE = env_int('IDENTITY_CACHE_SIZE', 10000)
+    IDENTITY_CACHE_TTL = env_int('IDENTITY_CACHE_TTL', 300)
+
+    # Per-user cache of polled responses; per process, so the TTL bounds how
+    # long another worker may serve data from before a write
+    RESPONSE_CACHE_ENABLED = env_bool('RESPONSE_CACHE_ENABLED', True)
+    RESPONSE_CACHE_SIZE = env_int('RESPONSE_CACHE_SIZE', 10000)
+    RESPONSE_CACHE_TTL = env_int('RESPONSE_CACHE_TTL', 60)
+
+    # Request and SQL instrumentation served at /metrics
+    METRICS_ENABLED = env_bool('METRICS_ENABLED', True)
+    SLOW_QUERY_MS = env_int('SLOW_QUERY_MS', 250)
+
+    # Background balance sheet exports; files are kept for EXPORT_TTL seconds
+    # Defaults to an 'exports' folder in the instance folder
+    EXPORT_DIR = os.environ.get('EXPORT_DIR')
+    EXPORT_WORKERS = env_int('EXPORT_WORKERS', 2)
+    EXPORT_MAX_JOBS = env_int('EXPORT_MAX_JOBS', 8)
+    EXPORT_MAX_JOBS_PER_USER = env_int('EXPORT_MAX_JOBS_PER_USER', 2)
+    EXPORT_TTL = env_int('EXPORT_TTL', 3600)
+    # Queued or running jobs untouched this long were left by a dead process
+    EXPORT_STALE_AFTER = env_int('EXPORT_STALE_AFTER', 6 * 3600)
+
+    # Server-Sent Events at /user/events. 'memory' only pushes writes made
+    # by the same worker; 'changelog' polls the change log so every worker's
+    # writes reach every stream
+    EVENTS_BROKER = os.environ.get('EVENTS_BROKER', 'memory')
+    EVENTS_POLL_INTERVAL = env_int('EVENTS_POLL_INTERVAL', 1)
+    EVENTS_QUEUE_SIZE = env_int('EVENTS_QUEUE_SIZE', 100)
+    EVENTS_HEARTBEAT = env_int('EVENTS_HEARTBEAT', 15)
+    EVENTS_REPLAY_LIMIT = env_int('EVENTS_REPLAY_LIMIT', 500)
+    EVENTS_MAX_SUBSCRIBERS = env_int('EVENTS_MAX_SUBSCRIBERS', 1000)
+
+    # Database and connection pool; only SQLite is supported
+    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'sqlite:///expense_sharing.db')
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    DB_POOL_SIZE = env_int('DB_POOL_SIZE', 10)
+    DB_MAX_OVERFLOW = env_int('DB_MAX_OVERFLOW', 20)
+    DB_POOL_TIMEOUT = env_int('DB_POOL_TIMEOUT', 30)
+    DB_POOL_RECYCLE = env_int('DB_POOL_RECYCLE', 1800)
+    DB_POOL_PRE_PING = env_bool('DB_POOL_PRE_PING', True)
+
+    # Pragmas applied to every SQLite connection. WAL lets readers proceed
+    # while a writer commits, and busy_timeout makes writers wait for the
+    # lock instead of failing with "database is locked".
+    SQLITE_TUNING = env_bool('SQLITE_TUNING', True)
+    SQLITE_BUSY_TIMEOUT_MS = env_int('SQLITE_BUSY_TIMEOUT_MS', 5000)
+    SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')
+    SQLITE_MMAP_SIZE = env_int('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)
+    SQLITE_CACHE_SIZE_KB = env_int('SQLITE_CACHE_SIZE_KB', 64 * 1024)
@@ -0,0 +1,42 @@
+from sqlalchemy.dialects.sqlite import insert
+from .models import RecentContact, db
+
+# Above this many people, an expense only links the creator with each
+# participant instead of every pair, so one huge split cannot write
+# millions of contact rows
+MAX_MESH_SIZE = 50
+
+def contact_pairs(creator_id, participant_ids):
+    """Ordered (user_id, contact_id) pairs linked by one expense"""
+    involved = {int(creator_id), *(int(user_id) for user_id in participant_ids)}
+    if len(involved) <= MAX_MESH_SIZE:
+        return [(a, b) for a in involved for b in involved if a != b]
+    creator_id = int(creator_id)
+    return [pair for user_id in involved - {creator_id}
+            for pair in ((creator_id, user_id), (user_id, creator_id))]
+
+def record_contacts(expenses):
+    """Bump last_expense_at for everyone linked by new expenses; caller commits.
+
+    expenses is an iterable of (creator_id, participant_ids, date).
+    """
+    latest = {}
+    for creator_id, participant_ids, date in expenses:
+        for pair in contact_pairs(creator_id, participant_ids):
+            if pair not in latest or latest[pair] < date:
+                latest[pair] = date
+    if not latest:
+        return
+
+    stmt = insert(RecentContact)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['user_id', 'contact_id'],
+        set_={'last_expense_at': db.func.max(
+            RecentContact.last_expense_at,
+            stmt.excluded.last_expense_at
+        )}
+    )
+    db.session.execute(stmt, [
+        {'user_id': user_id, 'contact_id': contact_id, 'last_expense_at': date}
+        for (user_id, contact_id), date in latest.items()
+    ])
@@ -0,0 +1,68 @@
+from contextlib import contextmanager
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+def engine_options(config):
+    """SQLAlchemy engine options built from the DB_* settings.
+
+    Raises ValueError for a database other than SQLite: the migrations,
+    upserts and search index use SQLite's SQL dialect.
+    """
+    url = make_url(config['SQLALCHEMY_DATABASE_URI'])
+    if url.get_backend_name() != 'sqlite':
+        raise ValueError(f'Only SQLite databases are supported, not {url.get_backend_name()!r}')
+    options = {
+        'pool_pre_ping': config['DB_POOL_PRE_PING'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+    }
+    # In-memory SQLite uses a single static connection, which has no pool
+    # to size
+    if url.database not in (None, '', ':memory:'):
+        options.update(
+            pool_size=config['DB_POOL_SIZE'],
+            max_overflow=config['DB_MAX_OVERFLOW'],
+            pool_timeout=config['DB_POOL_TIMEOUT'],
+        )
+    options.update(config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    return options
+
+def tune_sqlite(engine, config):
+    """Apply the SQLITE_* pragmas to every new connection of engine"""
+    if not config['SQLITE_TUNING']:
+        return
+    synchronous = str(config['SQLITE_SYNCHRONOUS']).upper()
+    if synchronous not in ('OFF', 'NORMAL', 'FULL', 'EXTRA'):
+        raise ValueError(f'Invalid SQLITE_SYNCHRONOUS: {synchronous!r}')
+
+    pragmas = [
+        f'PRAGMA busy_timeout = {int(config["SQLITE_BUSY_TIMEOUT_MS"])}',
+        f'PRAGMA synchronous = {synchronous}',
+        f'PRAGMA mmap_size = {int(config["SQLITE_MMAP_SIZE"])}',
+        # A negative cache_size is in KiB rather than pages
+        f'PRAGMA cache_size = -{int(config["SQLITE_CACHE_SIZE_KB"])}',
+    ]
+    if engine.url.database not in (None, '', ':memory:'):
+        pragmas.insert(0, 'PRAGMA journal_mode = WAL')
+
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+@contextmanager
+def immediate_transaction(conn):
+    """Run the block in a transaction holding SQLite's write lock from the start.
+
+    pysqlite only begins a transaction before INSERT, UPDATE and DELETE, so
+    SELECTs and DDL would run outside of it; conn must use the AUTOCOMMIT
+    isolation level so that the driver leaves BEGIN and COMMIT to us.
+    """
+    conn.exec_driver_sql('BEGIN IMMEDIATE')
+    try:
+        yield conn
+    except BaseException:
+        conn.exec_driver_sql('ROLLBACK')
+        raise
+    conn.exec_driver_sql('COMMIT')
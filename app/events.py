@@ -0,0 +1,345 @@
+from collections import namedtuple
+import json
+import queue
+import threading
+import time
+
+# One expense change as pushed to a user: messages are (event, data) pairs,
+# and the id is only sent with the last of them, so a resumed stream never
+# replays half a change
+Event = namedtuple('Event', 'id user_id messages')
+
+# How long clients wait before reconnecting a dropped stream
+RETRY_MS = 3000
+
+class TooManySubscribers(Exception):
+    """Raised when EVENTS_MAX_SUBSCRIBERS streams are already open"""
+
+def change_events(changes, expenses):
+    """Events for (change id, user_id, expense_id, action) rows.
+
+    expenses are NewExpense-like tuples of the changed expenses. A created
+    expense is announced with the user's share, followed by a balance event
+    per counterparty whose balance with the user it moved.
+    """
+    from .ledger import expense_deltas
+    from .splits import from_cents
+
+    expenses = {expense.id: expense for expense in expenses}
+    events = []
+    for change_id, user_id, expense_id, action in changes:
+        expense = expenses.get(expense_id)
+        if expense is None:
+            events.append(Event(change_id, user_id, [
+                ('expense', {'expense_id': expense_id, 'action': action})
+            ]))
+            continue
+        share = sum(p['share_cents'] for p in expense.participants if int(p['user_id']) == user_id)
+        messages = [('expense', {
+            'expense_id': expense_id,
+            'action': action,
+            'creator_id': int(expense.creator_id),
+            'amount': from_cents(expense.amount_cents),
+            'share': from_cents(share),
+            'date': expense.date.isoformat() if expense.date else None
+        })]
+        if action == 'created':
+            # Same sign as the ledger: positive means the counterparty owes the user
+            balances = {}
+            for (creditor_id, debtor_id), amount in \
+                    expense_deltas(expense.creator_id, expense.participants).items():
+                if creditor_id == user_id:
+                    balances[debtor_id] = balances.get(debtor_id, 0) + amount
+                elif debtor_id == user_id:
+                    balances[creditor_id] = balances.get(creditor_id, 0) - amount
+            messages.extend(
+                ('balance', {'counterparty_id': counterparty_id, 'delta': from_cents(amount)})
+                for counterparty_id, amount in sorted(balances.items())
+            )
+        events.append(Event(change_id, user_id, messages))
+    return events
+
+def load_change_events(changes):
+    """change_events() for change log rows, reading their expenses from the
+    live and archive tables"""
+    from .expenses import NewExpense, expense_tables
+    from .models import db
+
+    expense_ids = {expense_id for _, _, expense_id, _ in changes}
+    expenses = {}
+    for expense, participant in expense_tables(include_archived=True):
+        rows = db.session.query(
+            expense.id, expense.creator_id, expense.date, expense.amount_cents,
+            participant.user_id, participant.share_cents
+        ).\
+            outerjoin(participant, participant.expense_id == expense.id).\
+            filter(expense.id.in_(expense_ids))
+        for expense_id, creator_id, date, amount_cents, user_id, share_cents in rows:
+            if expense_id not in expenses:
+                expenses[expense_id] = NewExpense(expense_id, creator_id, date, amount_cents, [])
+            if user_id is not None:
+                expenses[expense_id].participants.append(
+                    {'user_id': user_id, 'share_cents': share_cents}
+                )
+    return change_events(changes, expenses.values())
+
+class Subscription:
+    """A bounded queue of events for one open stream.
+
+    A subscriber that falls behind does not block publishers: events that
+    do not fit are dropped and overflowed is set, and the stream then
+    catches up from the change log.
+    """
+
+    def __init__(self, broker, user_id, size):
+        self.broker = broker
+        self.user_id = user_id
+        self.overflowed = False
+        self._queue = queue.Queue(size)
+
+    def put(self, event):
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self.overflowed = True
+
+    def get(self, timeout):
+        """Next event, or None if none arrived within timeout seconds"""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def reset(self):
+        """Drop queued events after an overflow"""
+        self.overflowed = False
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                return
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+class MemoryBroker:
+    """Process-local broker: publish() hands events straight to the
+    subscribers of this process, so streams only see writes made by the
+    same worker."""
+
+    def __init__(self, queue_size):
+        self.queue_size = queue_size
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id):
+        subscription = Subscription(self, user_id, self.queue_size)
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscribers.get(subscription.user_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscribers[subscription.user_id]
+
+    def publish(self, events):
+        self.dispatch(events)
+
+    def dispatch(self, events):
+        for event in events:
+            with self._lock:
+                subscriptions = list(self._subscribers.get(event.user_id, ()))
+            for subscription in subscriptions:
+                subscription.put(event)
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(subscriptions) for subscriptions in self._subscribers.values())
+
+class ChangeLogBroker(MemoryBroker):
+    """Broker shared by every worker on the database.
+
+    publish() does nothing: a background thread reads new expense_change
+    rows of this process's subscribers every poll_interval seconds, so a
+    write made by any worker reaches every stream, at the cost of that
+    delay and one indexed query per interval.
+    """
+
+    def __init__(self, app, queue_size, poll_interval):
+        super().__init__(queue_size)
+        self.app = app
+        self.poll_interval = poll_interval
+        self._thread = None
+
+    def subscribe(self, user_id):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='events', daemon=True)
+                self._thread.start()
+        return super().subscribe(user_id)
+
+    def publish(self, events):
+        pass
+
+    def _run(self):
+        from .models import ExpenseChange, db
+
+        with self.app.app_context():
+            last_id = db.session.query(db.func.max(ExpenseChange.id)).scalar() or 0
+            db.session.close()
+            while True:
+                time.sleep(self.poll_interval)
+                try:
+                    last_id = self._poll(last_id)
+                except Exception:
+                    self.app.logger.exception('Polling the change log failed')
+                finally:
+                    db.session.close()
+
+    def _poll(self, last_id):
+        from .models import ExpenseChange, db
+
+        newest = db.session.query(db.func.max(ExpenseChange.id)).scalar() or 0
+        with self._lock:
+            user_ids = list(self._subscribers)
+        if newest > last_id and user_ids:
+            changes = db.session.query(
+                ExpenseChange.id, ExpenseChange.user_id, ExpenseChange.expense_id, ExpenseChange.action
+            ).\
+                filter(ExpenseChange.id > last_id, ExpenseChange.id <= newest,
+                       ExpenseChange.user_id.in_(user_ids)).\
+                order_by(ExpenseChange.id).all()
+            self.dispatch(load_change_events(changes))
+        return max(last_id, newest)
+
+class EventBroker:
+    """Pushes expense and balance events to open Server-Sent Events streams.
+
+    EVENTS_BROKER picks the backend: 'memory' (the default) delivers events
+    published by this process; 'changelog' polls the expense_change table,
+    so every worker's writes reach every stream. Event ids are change feed
+    cursors, which lets a stream resume from Last-Event-ID and lets clients
+    pass them to GET /expenses/changes.
+    """
+
+    def __init__(self, app=None):
+        self.backend = None
+        self._commit_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        backend = app.config.setdefault('EVENTS_BROKER', 'memory')
+        queue_size = app.config.setdefault('EVENTS_QUEUE_SIZE', 100)
+        self.heartbeat = app.config.setdefault('EVENTS_HEARTBEAT', 15)
+        self.replay_limit = app.config.setdefault('EVENTS_REPLAY_LIMIT', 500)
+        self.max_subscribers = app.config.setdefault('EVENTS_MAX_SUBSCRIBERS', 1000)
+
+        if backend == 'memory':
+            self.backend = MemoryBroker(queue_size)
+        elif backend == 'changelog':
+            poll_interval = app.config.setdefault('EVENTS_POLL_INTERVAL', 1)
+            self.backend = ChangeLogBroker(app, queue_size, poll_interval)
+        else:
+            raise ValueError(f'Unknown EVENTS_BROKER: {backend!r}')
+
+    def commit(self, session, events):
+        """Commit session, then publish the events of its changes.
+
+        Streams skip events older than the last one they sent, so within a
+        process events must be published in the order their changes were
+        committed; the lock keeps a slower request from publishing late.
+        """
+        with self._commit_lock:
+            session.commit()
+            self.backend.publish(events)
+
+    def latest(self, user_id):
+        """Id of the user's newest change, 0 if there is none"""
+        from .models import ExpenseChange, db
+        return db.session.query(db.func.max(ExpenseChange.id)).\
+            filter(ExpenseChange.user_id == user_id).scalar() or 0
+
+    def replay(self, user_id, since):
+        """The user's events after since, or None if there are more than
+        EVENTS_REPLAY_LIMIT"""
+        from .models import ExpenseChange, db
+        changes = db.session.query(
+            ExpenseChange.id, ExpenseChange.user_id, ExpenseChange.expense_id, ExpenseChange.action
+        ).\
+            filter(ExpenseChange.user_id == user_id, ExpenseChange.id > since).\
+            order_by(ExpenseChange.id).\
+            limit(self.replay_limit + 1).all()
+        if len(changes) > self.replay_limit:
+            return None
+        return load_change_events(changes)
+
+    def stream(self, user_id, since, expires_at):
+        """Yield the text/event-stream of a user's events after change since.
+
+        Missed events are replayed from the change log, on resume and after
+        the subscriber's queue overflowed. When more than the replay limit
+        were missed a 'resync' event carries the cursor to fetch them from
+        GET /expenses/changes instead. A comment is sent after heartbeat
+        seconds of silence, and the stream ends when the token expires so
+        the client reconnects with a fresh one.
+        """
+        from .changes import encode_change_cursor
+        from .models import db
+
+        if len(self.backend) >= self.max_subscribers:
+            raise TooManySubscribers()
+        # Streams are long; hold a pooled connection only while querying
+        db.session.close()
+
+        def message(name, data, event_id=None):
+            lines = f'id: {encode_change_cursor(event_id)}\n' if event_id is not None else ''
+            return f'{lines}event: {name}\ndata: {json.dumps(data, sort_keys=True)}\n\n'
+
+        def format_event(event):
+            return ''.join(
+                message(name, data, event.id if i == len(event.messages) - 1 else None)
+                for i, (name, data) in enumerate(event.messages)
+            )
+
+        def generate():
+            position = since
+            catch_up = True
+            # Subscribed here, where the finally below is sure to run, and
+            # before reading the log so nothing falls in between
+            subscription = self.backend.subscribe(user_id)
+            try:
+                yield f'retry: {RETRY_MS}\n\n'
+                while True:
+                    if catch_up:
+                        events = self.replay(user_id, position)
+                        if events is None:
+                            missed, position = position, self.latest(user_id)
+                            yield message('resync', {'since': encode_change_cursor(missed)}, position)
+                            events = []
+                        db.session.close()
+                        for event in events:
+                            yield format_event(event)
+                            position = event.id
+                        catch_up = False
+
+                    remaining = expires_at - time.time()
+                    if remaining <= 0:
+                        return
+                    event = subscription.get(min(self.heartbeat, remaining))
+                    if subscription.overflowed:
+                        subscription.reset()
+                        catch_up = True
+                    elif event is None:
+                        yield ': keepalive\n\n'
+                    elif event.id > position:
+                        yield format_event(event)
+                        position = event.id
+            finally:
+                subscription.close()
+
+        return generate()
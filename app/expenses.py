@@ -1,63 +1,259 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, current_app, request, jsonify, send_file, stream_with_context, url_for
 from flask_login import login_required, current_user
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from .models import Expense, ExpenseParticipant, User, db
+from . import event_broker, export_jobs, response_cache
+from .models import Expense, ExpenseArchive, ExpenseParticipant, ExpenseParticipantArchive, User, db
+from .changes import changes_query, decode_change_cursor, encode_change_cursor, record_changes
+from .contacts import record_contacts
+from .events import change_events
+from .exports import ExportLimitReached
+from .ledger import apply_deltas, expense_deltas
+from .rollups import record_spending
+from .serializers import negotiate, not_acceptable, render
+from .splits import from_cents, split_cents, to_cents
+from sqlalchemy import insert, tuple_, union
+from collections import namedtuple
+import base64
 import csv
+import json
 from io import StringIO
 import datetime
 expenses_bp = Blueprint('expenses', __name__)
 
-def validate_split(participants, split_type, total_amount):
-    """Validate split amounts based on the split type"""
-    if split_type == 'equal':
-        share = total_amount / len(participants)
-        return [{**p, 'share_amount': share} for p in participants]
-    
-    elif split_type == 'exact':
-        total_shares = sum(p.get('share_amount', 0) for p in participants)
-        if abs(total_shares - total_amount) > 0.01:  # Allow small floating-point differences
-            return None
-        return participants
-    
-    elif split_type == 'percentage':
-        total_percentage = sum(p.get('share_percentage', 0) for p in participants)
-        if abs(total_percentage - 100) > 0.01:  # Allow small floating-point differences
-            return None
-        return [{
-            **p,
-            'share_amount': (p['share_percentage'] / 100) * total_amount
-        } for p in participants]
+# An expense that was just inserted, as passed to record_expense_effects
+NewExpense = namedtuple('NewExpense', 'id creator_id date amount_cents participants')
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+BULK_BATCH_SIZE = 500  # expenses inserted per transaction
+BULK_MAX_ITEMS = 50000
+USER_ID_CHUNK_SIZE = 500  # participant ids checked per query
+
+CSV_HEADER = ['Date', 'Description', 'Amount', 'Split Type', 'Your Share', 'Status']
+CSV_BATCH_SIZE = 1000  # rows fetched per round trip when streaming
+CSV_CHUNK_SIZE = 64 * 1024  # bytes buffered before a chunk is sent
+
+def encode_cursor(date, expense_id):
+    """Encode a (date, id) keyset position as an opaque cursor"""
+    raw = f'{date.isoformat()}|{expense_id}'.encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+def decode_cursor(cursor):
+    """Decode a cursor from encode_cursor, or return None if it is malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+        date, expense_id = raw.split('|')
+        return datetime.datetime.fromisoformat(date), int(expense_id)
+    except (ValueError, UnicodeError):
+        return None
+
+def expense_tables(include_archived=False):
+    """(expense model, participant model) pairs a read should cover"""
+    tables = [(Expense, ExpenseParticipant)]
+    if include_archived:
+        tables.append((ExpenseArchive, ExpenseParticipantArchive))
+    return tables
+
+def union_all(queries):
+    # Criteria and ordering added afterwards are adapted to the union's
+    # columns through the first query's entities
+    return queries[0].union_all(*queries[1:]) if len(queries) > 1 else queries[0]
+
+def user_expense_ids(user_id, expense=Expense, participant=ExpenseParticipant):
+    """Ids of expenses the user created or participates in.
+
+    A UNION of two indexed lookups: each id appears once even when the user
+    is both creator and participant, and neither table is scanned.
+    """
+    return union(
+        db.select(expense.id).where(expense.creator_id == user_id),
+        db.select(participant.expense_id).where(participant.user_id == user_id)
+    )
+
+def expense_key(row):
+    """Sort key of a (date, id) row, newest first when reversed"""
+    return (row[0] or datetime.datetime.min, row[1])
+
+def user_expense_key_queries(user_id, before=None, include_archived=False):
+    """(date, id) of the user's expenses, newest first, one query per side.
+
+    The expenses they created and those they participate in are each an
+    ordered range scan of an index, on creator_id and on the participant's
+    copy of the expense date, so a page costs the same however long the
+    history. before is an optional (date, id) keyset position to continue after.
+    """
+    queries = []
+    for expense, participant in expense_tables(include_archived):
+        for date, expense_id, owner_id in (
+            (expense.date, expense.id, expense.creator_id),
+            (participant.expense_date, participant.expense_id, participant.user_id)
+        ):
+            query = db.session.query(date, expense_id).filter(owner_id == user_id)
+            if before:
+                query = query.filter(tuple_(date, expense_id) < tuple_(*before))
+            queries.append(query.order_by(date.desc(), expense_id.desc()))
+    return queries
+
+def user_expenses_page(user_id, limit, before=None, include_archived=False):
+    """A page of the user's expenses, newest first, as (rows, has_more).
+
+    Rows are (id, description, amount_cents, date, split_type, creator name)
+    tuples rather than ORM objects, so pages serialize straight from rows.
+    Each side is read up to limit + 1 keys and the sides are merged here.
+    A side that had more keys is only complete down to its last key, so the
+    merge stops there; the page may then be short, but is never wrong.
+    """
+    keys = set()
+    bound = None
+    for query in user_expense_key_queries(user_id, before, include_archived):
+        side = query.limit(limit + 1).all()
+        keys.update((date, expense_id) for date, expense_id in side)
+        if len(side) > limit:
+            bound = max(bound, expense_key(side[-1])) if bound else expense_key(side[-1])
+    keys = sorted(
+        (key for key in keys if bound is None or expense_key(key) >= bound),
+        key=expense_key, reverse=True
+    )
+    has_more = len(keys) > limit or bound is not None
+    expense_ids = [expense_id for _, expense_id in keys[:limit]]
+    if not expense_ids:
+        return [], has_more
     
+    rows = {}
+    for expense, _ in expense_tables(include_archived):
+        rows.update((row.id, row) for row in db.session.query(
+            expense.id,
+            expense.description,
+            expense.amount_cents,
+            expense.date,
+            expense.split_type,
+            User.name
+        ).\
+            join(User, User.id == expense.creator_id).\
+            filter(expense.id.in_(expense_ids)))
+    return [rows[expense_id] for expense_id in expense_ids if expense_id in rows], has_more
+
+def changed_expenses_query(user_id, expense_ids):
+    """Rows like user_expenses_page of the given expenses, live or archived,
+    that still involve the user, newest first"""
+    queries = []
+    for expense, participant in expense_tables(include_archived=True):
+        involved = db.exists().where(
+            participant.expense_id == expense.id,
+            participant.user_id == user_id
+        )
+        queries.append(db.session.query(
+            expense.id,
+            expense.description,
+            expense.amount_cents,
+            expense.date,
+            expense.split_type,
+            User.name
+        ).\
+            join(User, User.id == expense.creator_id).\
+            filter(expense.id.in_(expense_ids), (expense.creator_id == user_id) | involved))
+    return union_all(queries).order_by(Expense.date.desc(), Expense.id.desc())
+
+def participants_query(expense_ids, include_archived=False):
+    """(expense_id, user name, share_cents, share_percentage) rows of expenses"""
+    queries = [
+        db.session.query(
+            participant.expense_id,
+            User.name,
+            participant.share_cents,
+            participant.share_percentage,
+            participant.id
+        ).\
+            join(User, User.id == participant.user_id).\
+            filter(participant.expense_id.in_(expense_ids))
+        for _, participant in expense_tables(include_archived)
+    ]
+    return union_all(queries).order_by(ExpenseParticipant.expense_id, ExpenseParticipant.id)
+
+def validate_split(participants, split_type, total_amount):
+    """Validate split amounts based on the split type.
+
+    Returns the participants with 'share_cents' added, or None if the split
+    does not add up. Shares are exact integer cents summing to the total.
+    """
+    shares = split_cents(participants, split_type, to_cents(total_amount))
+    if shares is None:
+        return None
+    return [{**p, 'share_cents': share} for p, share in zip(participants, shares)]
+
+def participant_user_id(value):
+    """A participant's user_id as an int, accepting numeric strings, or None"""
+    if type(value) is int:
+        return value
+    if isinstance(value, str) and value.isascii() and value.isdigit():
+        return int(value)
     return None
 
-@expenses_bp.route('/expense', methods=['POST'])
-@jwt_required()
-def add_expense():
-    data = request.get_json()
+def unknown_user_ids(user_ids):
+    """The ids among user_ids without a user, by indexed IN lookups"""
+    user_ids = sorted(set(user_ids))
+    found = set()
+    # Chunked to stay within SQLite's limit on bound parameters
+    for start in range(0, len(user_ids), USER_ID_CHUNK_SIZE):
+        found.update(db.session.scalars(
+            db.select(User.id).where(User.id.in_(user_ids[start:start + USER_ID_CHUNK_SIZE]))
+        ))
+    return set(user_ids) - found
+
+def check_expense(data):
+    """Validate an expense payload.
+
+    Returns (validated_participants, None) on success or (None, error message).
+    """
     required_fields = ['description', 'amount', 'split_type', 'participants']
     
-    if not all(field in data for field in required_fields):
-        return jsonify({'error': 'Missing required fields'}), 400
+    if not isinstance(data, dict) or not all(field in data for field in required_fields):
+        return None, 'Missing required fields'
     
     if data['split_type'] not in ['equal', 'exact', 'percentage']:
-        return jsonify({'error': 'Invalid split type'}), 400
+        return None, 'Invalid split type'
+    
+    participants = data['participants']
+    if not isinstance(participants, list) or not all(isinstance(p, dict) for p in participants):
+        return None, 'Invalid participants'
+    user_ids = [participant_user_id(p.get('user_id')) for p in participants]
+    if None in user_ids:
+        return None, 'Every participant needs an integer user_id'
+    participants = [{**p, 'user_id': user_id} for p, user_id in zip(participants, user_ids)]
     
     # Validate and process participants
-    validated_participants = validate_split(
-        data['participants'],
-        data['split_type'],
-        data['amount']
-    )
+    try:
+        validated_participants = validate_split(
+            participants,
+            data['split_type'],
+            data['amount']
+        )
+    except (KeyError, TypeError, ValueError, ArithmeticError):
+        validated_participants = None
     
     if not validated_participants:
-        return jsonify({'error': 'Invalid split amounts'}), 400
+        return None, 'Invalid split amounts'
+    return validated_participants, None
+
+@expenses_bp.route('/expense', methods=['POST'])
+@jwt_required()
+def add_expense():
+    data = request.get_json()
+    
+    validated_participants, error = check_expense(data)
+    if error:
+        return jsonify({'error': error}), 400
+    if unknown_user_ids(p['user_id'] for p in validated_participants):
+        return jsonify({'error': 'Unknown participant user_id'}), 400
     
     try:
         expense = Expense(
             description=data['description'],
-            amount=data['amount'],
+            amount_cents=to_cents(data['amount']),
             split_type=data['split_type'],
-            creator_id=get_jwt_identity()
+            creator_id=get_jwt_identity(),
+            date=datetime.datetime.utcnow()
         )
         db.session.add(expense)
         
@@ -66,85 +262,502 @@ def add_expense():
             exp_participant = ExpenseParticipant(
                 expense=expense,
                 user_id=participant['user_id'],
-                share_amount=participant['share_amount'],
-                share_percentage=participant.get('share_percentage')
+                share_cents=participant['share_cents'],
+                share_percentage=participant.get('share_percentage'),
+                expense_date=expense.date
             )
             db.session.add(exp_participant)
         
-        db.session.commit()
+        db.session.flush()
+        new_expense = NewExpense(
+            expense.id,
+            int(expense.creator_id),
+            expense.date,
+            expense.amount_cents,
+            validated_participants
+        )
+        changes = record_expense_effects([new_expense])
+        
+        event_broker.commit(db.session, change_events(changes, [new_expense]))
+        response_cache.invalidate(expense_users(get_jwt_identity(), validated_participants))
         return jsonify({'message': 'Expense added successfully', 'expense_id': expense.id}), 201
     
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': 'Failed to add expense'}), 500
 
+def read_bulk_items():
+    """Iterate (item, error) pairs from a JSON array or an NDJSON request body.
+
+    NDJSON bodies are read line by line, so large imports are never held in
+    memory as a whole. Raises ValueError straight away for any other body.
+    """
+    if request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+        return read_ndjson_items(request.stream)
+    
+    data = request.get_json(silent=True)
+    if not isinstance(data, list):
+        raise ValueError('Expected a JSON array or an NDJSON body')
+    return ((item, None) for item in data)
+
+def read_ndjson_items(stream):
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line), None
+        except ValueError:
+            yield None, 'Invalid JSON'
+
+def record_expense_effects(expenses):
+    """Update every table derived from expenses, in the caller's transaction.
+
+    expenses is a list of NewExpense for rows just inserted. Called by every
+    write path so the derived tables never drift from the expense rows.
+    Returns the change log rows to publish once committed.
+    """
+    deltas = None
+    for expense in expenses:
+        deltas = expense_deltas(expense.creator_id, expense.participants, deltas)
+    if deltas:
+        apply_deltas(deltas)
+    
+    record_contacts(
+        (expense.creator_id, [p['user_id'] for p in expense.participants], expense.date)
+        for expense in expenses
+    )
+    record_spending(expenses)
+    return record_changes(
+        ((expense.id, expense_users(expense.creator_id, expense.participants)) for expense in expenses),
+        'created'
+    )
+
+def expense_users(creator_id, participants):
+    """Ids of everyone whose listings and balances an expense changes"""
+    return {int(creator_id), *(int(p['user_id']) for p in participants)}
+
+def parse_expense_date(value):
+    """Parse an ISO date as naive UTC, like the dates stored for new expenses"""
+    date = datetime.datetime.fromisoformat(value)
+    if date.tzinfo is not None:
+        date = date.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return date
+
+def check_bulk_item(data):
+    """Validate one bulk item like check_expense, parsing its optional date.
+
+    Returns (data with 'date' set, validated_participants, None) on success
+    or (None, None, error message).
+    """
+    validated_participants, error = check_expense(data)
+    if error:
+        return None, None, error
+    try:
+        date = parse_expense_date(data['date']) if data.get('date') else datetime.datetime.utcnow()
+    except (TypeError, ValueError, OverflowError):
+        return None, None, 'Invalid date'
+    return {**data, 'date': date}, validated_participants, None
+
+def insert_expense_batch(creator_id, batch):
+    """Insert a batch of validated expenses in one transaction.
+
+    batch is a list of (index, data, validated_participants). Returns the new
+    expense ids in batch order.
+    """
+    expense_ids = db.session.scalars(
+        insert(Expense).returning(Expense.id, sort_by_parameter_order=True),
+        [{
+            'description': data['description'],
+            'amount_cents': to_cents(data['amount']),
+            'split_type': data['split_type'],
+            'creator_id': creator_id,
+            'date': data['date']
+        } for _, data, _ in batch]
+    ).all()
+    
+    participant_rows = []
+    for expense_id, (_, data, participants) in zip(expense_ids, batch):
+        participant_rows.extend({
+            'expense_id': expense_id,
+            'user_id': participant['user_id'],
+            'share_cents': participant['share_cents'],
+            'share_percentage': participant.get('share_percentage'),
+            'expense_date': data['date']
+        } for participant in participants)
+    db.session.execute(insert(ExpenseParticipant), participant_rows)
+    
+    expenses = [
+        NewExpense(expense_id, creator_id, data['date'], to_cents(data['amount']), participants)
+        for expense_id, (_, data, participants) in zip(expense_ids, batch)
+    ]
+    changes = record_expense_effects(expenses)
+    event_broker.commit(db.session, change_events(changes, expenses))
+    response_cache.invalidate({
+        user_id
+        for _, _, participants in batch
+        for user_id in expense_users(creator_id, participants)
+    })
+    return expense_ids
+
+@expenses_bp.route('/expenses/bulk', methods=['POST'])
+@jwt_required()
+def add_expenses_bulk():
+    """Create many expenses at once from a JSON array or NDJSON stream.
+
+    Items are validated individually and inserted in batches, one transaction
+    per batch. Each item may carry an ISO 'date' for historical imports;
+    dates with an offset are stored as UTC. When a batch fails its items are
+    retried one at a time, so only the items at fault are reported failed.
+    Should reading the body fail midway, processing stops at that item and
+    the response still lists the results of every item before it.
+    """
+    creator_id = int(get_jwt_identity())
+    results = []
+    batch = []
+    
+    def insert_batch(items):
+        try:
+            expense_ids = insert_expense_batch(creator_id, items)
+            results.extend({'index': index, 'expense_id': expense_id}
+                           for (index, _, _), expense_id in zip(items, expense_ids))
+        except Exception:
+            db.session.rollback()
+            if len(items) == 1:
+                results.append({'index': items[0][0], 'error': 'Failed to add expense'})
+                return
+            # Retry one by one so a bad item only fails itself
+            for item in items:
+                insert_batch([item])
+    
+    def flush():
+        # One lookup per batch for every participant id it mentions
+        try:
+            unknown = unknown_user_ids(p['user_id'] for _, _, participants in batch for p in participants)
+        except Exception:
+            db.session.rollback()
+            results.extend({'index': index, 'error': 'Failed to add expense'} for index, _, _ in batch)
+            batch.clear()
+            return
+        known = []
+        for index, data, participants in batch:
+            if any(p['user_id'] in unknown for p in participants):
+                results.append({'index': index, 'error': 'Unknown participant user_id'})
+            else:
+                known.append((index, data, participants))
+        if known:
+            insert_batch(known)
+        batch.clear()
+    
+    try:
+        items = read_bulk_items()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    handled = 0  # items before this one have a result or sit in the batch
+    try:
+        for index, (data, error) in enumerate(items):
+            if index >= BULK_MAX_ITEMS:
+                results.append({'index': index, 'error': f'Bulk requests are limited to {BULK_MAX_ITEMS} items'})
+                break
+            
+            validated_participants = None
+            if not error:
+                data, validated_participants, error = check_bulk_item(data)
+            if error:
+                results.append({'index': index, 'error': error})
+            else:
+                batch.append((index, data, validated_participants))
+            handled = index + 1
+            if len(batch) >= BULK_BATCH_SIZE:
+                flush()
+    except Exception:
+        # Earlier batches are committed, so report them rather than fail the
+        # whole request: a client retrying blindly would write them twice
+        current_app.logger.exception('Bulk expense request stopped at item %d', handled)
+        results.append({'index': handled, 'error': 'Failed to process item; later items were not read'})
+    
+    if batch:
+        flush()
+    
+    results.sort(key=lambda result: result['index'])
+    created = sum(1 for result in results if 'expense_id' in result)
+    return jsonify({
+        'created': created,
+        'failed': len(results) - created,
+        'results': results
+    }), 200
+
 @expenses_bp.route('/expenses/user')
 @jwt_required()
+@response_cache.cached
 def get_user_expenses():
+    """List the user's expenses as JSON or, on request, MessagePack"""
     user_id = get_jwt_identity()
+    mimetype = negotiate()
+    if mimetype is None:
+        return not_acceptable()
     
-    # Get expenses where user is either creator or participant
-    expenses = db.session.query(Expense).join(
-        ExpenseParticipant
-    ).filter(
-        (Expense.creator_id == user_id) |
-        (ExpenseParticipant.user_id == user_id)
-    ).all()
+    limit, error = parse_limit()
+    if error:
+        return jsonify({'error': error}), 400
     
-    expenses_list = []
-    for expense in expenses:
-        expense_data = {
-            'id': expense.id,
-            'description': expense.description,
-            'amount': expense.amount,
-            'date': expense.date.isoformat(),
-            'split_type': expense.split_type,
-            'creator': expense.creator.name,
-            'participants': [{
-                'user_name': p.user.name,
-                'share_amount': p.share_amount,
-                'share_percentage': p.share_percentage
-            } for p in expense.participants]
-        }
-        expenses_list.append(expense_data)
-    
-    return jsonify(expenses_list), 200
+    include_archived = request.args.get('include_archived') in ('1', 'true')
+    
+    position = None
+    cursor = request.args.get('cursor')
+    if cursor:
+        position = decode_cursor(cursor)
+        if position is None:
+            return jsonify({'error': 'Invalid cursor'}), 400
+    # Participants of the whole page then come from a single query
+    rows, has_more = user_expenses_page(user_id, limit, position, include_archived)
+    
+    response = render(serialize_expenses(rows, include_archived), mimetype)
+    if has_more:
+        last = rows[-1]
+        response.headers['X-Next-Cursor'] = encode_cursor(last.date, last.id)
+    return response
 
-@expenses_bp.route('/balance-sheet/download')
+def parse_limit():
+    """The 'limit' page size arg as (limit, None), or (None, error message)"""
+    try:
+        limit = int(request.args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        return None, 'Invalid limit'
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        return None, f'Limit must be between 1 and {MAX_PAGE_SIZE}'
+    return limit, None
+
+def serialize_expenses(rows, include_archived=False):
+    """Expense dicts of rows from user_expenses_page, with their participants"""
+    participants = {}
+    if rows:
+        for expense_id, user_name, share_cents, share_percentage, _ in \
+                participants_query([row[0] for row in rows], include_archived):
+            participants.setdefault(expense_id, []).append({
+                'user_name': user_name,
+                'share_amount': from_cents(share_cents),
+                'share_percentage': share_percentage
+            })
+    
+    return [{
+        'id': expense_id,
+        'description': description,
+        'amount': from_cents(amount_cents),
+        'date': date.isoformat(),
+        'split_type': split_type,
+        'creator': creator_name,
+        'participants': participants.get(expense_id, [])
+    } for expense_id, description, amount_cents, date, split_type, creator_name in rows]
+
+@expenses_bp.route('/expenses/changes')
 @jwt_required()
-def download_balance_sheet():
-    user_id = get_jwt_identity()
+def get_expense_changes():
+    """Expenses changed for the user since a cursor, for incremental sync.
+
+    Pass the returned cursor back as 'since'; without it the feed starts
+    from the user's first expense. 'limit' bounds the changes read per page
+    and has_more says whether to fetch again right away. Changed expenses
+    that still involve the user are returned in full, archived or not, and
+    the ids of those deleted or no longer involving them under 'deleted'.
+    """
+    user_id = int(get_jwt_identity())
+    mimetype = negotiate()
+    if mimetype is None:
+        return not_acceptable()
     
-    # Get all expenses involving the user
-    expenses = db.session.query(Expense).join(
-        ExpenseParticipant
-    ).filter(
-        (Expense.creator_id == user_id) |
-        (ExpenseParticipant.user_id == user_id)
-    ).all()
+    limit, error = parse_limit()
+    if error:
+        return jsonify({'error': error}), 400
     
-    # Create CSV file
-    output = StringIO()
-    writer = csv.writer(output)
-    writer.writerow(['Date', 'Description', 'Amount', 'Split Type', 'Your Share', 'Status'])
+    since = 0
+    if request.args.get('since'):
+        since = decode_change_cursor(request.args['since'])
+        if since is None:
+            return jsonify({'error': 'Invalid cursor'}), 400
     
-    for expense in expenses:
-        user_participation = next(
-            (p for p in expense.participants if p.user_id == user_id),
-            None
-        )
-        
-        status = 'Paid' if expense.creator_id == user_id else 'Owe'
-        writer.writerow([
-            expense.date.strftime('%Y-%m-%d'),
+    changes = changes_query(user_id, since).limit(limit + 1).all()
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+    
+    # Several changes to one expense collapse into its current state
+    expense_ids = list(dict.fromkeys(expense_id for _, expense_id in changes))
+    rows = changed_expenses_query(user_id, expense_ids).all() if expense_ids else []
+    current = {row.id for row in rows}
+    
+    return render({
+        'expenses': serialize_expenses(rows, include_archived=True),
+        'deleted': [expense_id for expense_id in expense_ids if expense_id not in current],
+        'cursor': encode_change_cursor(changes[-1].id if changes else since),
+        'has_more': has_more
+    }, mimetype)
+
+def parse_date_range(args):
+    """Parse optional 'from'/'to' (YYYY-MM-DD) args; 'to' is inclusive.
+
+    Raises ValueError on malformed dates.
+    """
+    start = args.get('from')
+    end = args.get('to')
+    start = datetime.datetime.strptime(start, '%Y-%m-%d') if start else None
+    end = datetime.datetime.strptime(end, '%Y-%m-%d') + datetime.timedelta(days=1) if end else None
+    return start, end
+
+def balance_sheet_query(user_id, start=None, end=None, include_archived=False):
+    """Expenses involving the user with the user's own share, oldest first"""
+    queries = []
+    for expense, participant in expense_tables(include_archived):
+        own_share = db.aliased(participant)
+        query = db.session.query(
+            expense.date,
             expense.description,
-            expense.amount,
+            expense.amount_cents,
             expense.split_type,
-            user_participation.share_amount if user_participation else 0,
+            expense.creator_id,
+            own_share.share_cents,
+            expense.id
+        ).outerjoin(
+            own_share,
+            (own_share.expense_id == expense.id) & (own_share.user_id == user_id)
+        ).filter(expense.id.in_(user_expense_ids(user_id, expense, participant)))
+        if start:
+            query = query.filter(expense.date >= start)
+        if end:
+            query = query.filter(expense.date < end)
+        queries.append(query)
+    return union_all(queries).order_by(Expense.date, Expense.id)
+
+def balance_sheet_rows(user_id, start=None, end=None, include_archived=False):
+    """Yield one CSV row per expense involving the user, oldest first.
+
+    The user's share comes from an outer join on their own participation row,
+    and rows are streamed from a server-side cursor in fixed-size batches.
+    """
+    query = balance_sheet_query(user_id, start, end, include_archived).\
+        execution_options(yield_per=CSV_BATCH_SIZE)
+    
+    for date, description, amount_cents, split_type, creator_id, share_cents, _ in query:
+        status = 'Paid' if creator_id == user_id else 'Owe'
+        yield [
+            date.strftime('%Y-%m-%d'),
+            description,
+            from_cents(amount_cents),
+            split_type,
+            from_cents(share_cents) if share_cents is not None else 0,
             status
-        ])
+        ]
+
+def stream_csv(rows):
+    """Render rows as CSV text chunks without holding the whole file"""
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_HEADER)
+    for row in rows:
+        writer.writerow(row)
+        if buffer.tell() >= CSV_CHUNK_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+@expenses_bp.route('/balance-sheet/download')
+@jwt_required()
+def download_balance_sheet():
+    user_id = int(get_jwt_identity())
+    
+    try:
+        start, end = parse_date_range(request.args)
+    except ValueError:
+        return jsonify({'error': 'Dates must use the YYYY-MM-DD format'}), 400
+    
+    filename = f'balance_sheet_{datetime.datetime.now().strftime("%Y%m%d")}.csv'
+    include_archived = request.args.get('include_archived') in ('1', 'true')
+    rows = balance_sheet_rows(user_id, start, end, include_archived)
+    
+    # ?format=csv streams the file itself with chunked transfer encoding
+    if request.args.get('format') == 'csv':
+        return Response(
+            stream_with_context(stream_csv(rows)),
+            mimetype='text/csv',
+            headers={'Content-Disposition': f'attachment; filename={filename}'}
+        )
     
     return jsonify({
-        'csv_content': output.getvalue(),
-        'filename': f'balance_sheet_{datetime.datetime.now().strftime("%Y%m%d")}.csv'
-    }), 200
\ No newline at end of file
+        'csv_content': ''.join(stream_csv(rows)),
+        'filename': filename
+    }), 200
+
+def export_status(job):
+    status = {
+        'job_id': job['id'],
+        'status': job['status'],
+        'filename': job['filename'],
+        'created_at': datetime.datetime.utcfromtimestamp(job['created_at']).isoformat()
+    }
+    if job['status'] == 'done':
+        status['size'] = job['size']
+        status['download_url'] = url_for('expenses.download_export', job_id=job['id'])
+    elif job['status'] == 'failed':
+        status['error'] = job['error']
+    return status
+
+@expenses_bp.route('/balance-sheet/exports', methods=['POST'])
+@jwt_required()
+def create_export():
+    """Start a background balance sheet export.
+
+    Takes the same 'from'/'to' args as /balance-sheet/download, plus
+    'gzip=1' to compress the file and 'include_archived=1'. Poll the returned status URL, then fetch
+    its download_url once the job is done.
+    """
+    user_id = int(get_jwt_identity())
+    
+    try:
+        start, end = parse_date_range(request.args)
+    except ValueError:
+        return jsonify({'error': 'Dates must use the YYYY-MM-DD format'}), 400
+    
+    include_archived = request.args.get('include_archived') in ('1', 'true')
+    
+    def write(out):
+        out.writelines(stream_csv(balance_sheet_rows(user_id, start, end, include_archived)))
+    
+    try:
+        job = export_jobs.submit(
+            user_id,
+            f'balance_sheet_{datetime.datetime.now().strftime("%Y%m%d")}.csv',
+            write,
+            compress=request.args.get('gzip') in ('1', 'true')
+        )
+    except ExportLimitReached:
+        response = jsonify({'error': 'Too many exports in progress, please retry shortly'})
+        response.headers['Retry-After'] = '5'
+        return response, 429
+    
+    response = jsonify(export_status(job))
+    response.headers['Location'] = url_for('expenses.get_export', job_id=job['id'])
+    return response, 202
+
+@expenses_bp.route('/balance-sheet/exports/<job_id>')
+@jwt_required()
+def get_export(job_id):
+    job = export_jobs.get(job_id, int(get_jwt_identity()))
+    if job is None:
+        return jsonify({'error': 'Export not found'}), 404
+    return jsonify(export_status(job)), 200
+
+@expenses_bp.route('/balance-sheet/exports/<job_id>/download')
+@jwt_required()
+def download_export(job_id):
+    job = export_jobs.get(job_id, int(get_jwt_identity()))
+    if job is None:
+        return jsonify({'error': 'Export not found'}), 404
+    if job['status'] != 'done':
+        return jsonify({'error': f'Export is {job["status"]}'}), 409
+    return send_file(
+        export_jobs.file_path(job_id),
+        mimetype='application/gzip' if job['compressed'] else 'text/csv',
+        as_attachment=True,
+        download_name=job['filename']
+    )
@@ -0,0 +1,167 @@
+from concurrent.futures import ThreadPoolExecutor
+import gzip
+import json
+import os
+import threading
+import time
+import uuid
+
+class ExportLimitReached(Exception):
+    """Raised when too many export jobs are already queued or running"""
+
+class ExportManager:
+    """Runs large exports on a local worker pool and keeps the files on disk.
+
+    Each job writes its file to EXPORT_DIR in a streaming fashion, optionally
+    gzip-compressed, next to a small JSON file holding its state. Status and
+    downloads are answered from those files, so any worker process on the
+    same host can serve them. Finished and failed jobs are deleted after
+    EXPORT_TTL seconds; jobs still queued or running after
+    EXPORT_STALE_AFTER seconds are taken to belong to a dead process.
+    """
+
+    def __init__(self, app=None):
+        self._executor = None
+        self._active = {}
+        self._lock = threading.Lock()
+        self._last_purge = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        workers = app.config.setdefault('EXPORT_WORKERS', 2)
+        self.max_jobs = app.config.setdefault('EXPORT_MAX_JOBS', workers * 4)
+        self.max_jobs_per_user = app.config.setdefault('EXPORT_MAX_JOBS_PER_USER', 2)
+        self.ttl = app.config.setdefault('EXPORT_TTL', 3600)
+        self.stale_after = app.config.setdefault('EXPORT_STALE_AFTER', 6 * 3600)
+        self.directory = app.config.get('EXPORT_DIR') or os.path.join(app.instance_path, 'exports')
+        os.makedirs(self.directory, exist_ok=True)
+
+        self.app = app
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='export')
+        self.purge()
+
+    def submit(self, owner_id, filename, write, compress=False):
+        """Queue write(text_file) to run in the background; returns the job.
+
+        write runs inside an app context and gets a text file opened for
+        CSV output. Raises ExportLimitReached when the pool is saturated.
+        """
+        if time.time() - self._last_purge >= 60:
+            self.purge()
+
+        with self._lock:
+            if len(self._active) >= self.max_jobs:
+                raise ExportLimitReached()
+            if sum(owner == owner_id for owner in self._active.values()) >= self.max_jobs_per_user:
+                raise ExportLimitReached()
+            job_id = uuid.uuid4().hex
+            self._active[job_id] = owner_id
+
+        job = {
+            'id': job_id,
+            'owner_id': owner_id,
+            'status': 'queued',
+            'filename': filename + ('.gz' if compress else ''),
+            'compressed': compress,
+            'size': None,
+            'error': None,
+            'created_at': time.time(),
+            'finished_at': None
+        }
+        self._save(job)
+        try:
+            self._executor.submit(self._run, job, write)
+        except BaseException:
+            with self._lock:
+                self._active.pop(job_id, None)
+            self._delete(job_id)
+            raise
+        return job
+
+    def get(self, job_id, owner_id):
+        """The job's state, or None if it does not exist or is not owner_id's"""
+        # Ids are hex, so a crafted id can never escape the export directory
+        if not job_id.isalnum():
+            return None
+        try:
+            with open(self._meta_path(job_id)) as f:
+                job = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return job if job['owner_id'] == owner_id else None
+
+    def file_path(self, job_id):
+        return os.path.join(self.directory, job_id + '.data')
+
+    def purge(self):
+        """Delete jobs that finished more than EXPORT_TTL seconds ago.
+
+        Decided from each job's saved state, so it is safe while other
+        processes share the directory: a queued or running job is only
+        deleted once its state has not changed for EXPORT_STALE_AFTER
+        seconds, as when the process running it died.
+        """
+        self._last_purge = now = time.time()
+        for name in os.listdir(self.directory):
+            job_id, ext = os.path.splitext(name)
+            if ext != '.json':
+                continue
+            try:
+                with open(os.path.join(self.directory, name)) as f:
+                    job = json.load(f)
+                if job['status'] in ('queued', 'running'):
+                    expired = now - job.get('updated_at', job['created_at']) >= self.stale_after
+                else:
+                    expired = now - job['finished_at'] >= self.ttl
+            except FileNotFoundError:
+                # Purged by another process meanwhile
+                continue
+            except (OSError, ValueError, KeyError, TypeError):
+                expired = True
+            if expired:
+                self._delete(job_id)
+
+    def _run(self, job, write):
+        job['status'] = 'running'
+        self._save(job)
+        path = self.file_path(job['id'])
+        partial = path + '.part'
+        try:
+            with self.app.app_context():
+                if job['compressed']:
+                    out = gzip.open(partial, 'wt', newline='', encoding='utf-8')
+                else:
+                    out = open(partial, 'w', newline='', encoding='utf-8')
+                with out:
+                    write(out)
+            os.replace(partial, path)
+            job.update(status='done', size=os.path.getsize(path))
+        except Exception as e:
+            self.app.logger.exception('Export %s failed', job['id'])
+            if os.path.exists(partial):
+                os.remove(partial)
+            job.update(status='failed', error='Export failed')
+        finally:
+            job['finished_at'] = time.time()
+            self._save(job)
+            with self._lock:
+                self._active.pop(job['id'], None)
+
+    def _meta_path(self, job_id):
+        return os.path.join(self.directory, job_id + '.json')
+
+    def _save(self, job):
+        # Write then rename so readers never see a half-written state file
+        job['updated_at'] = time.time()
+        path = self._meta_path(job['id'])
+        with open(path + '.tmp', 'w') as f:
+            json.dump(job, f)
+        os.replace(path + '.tmp', path)
+
+    def _delete(self, job_id):
+        for path in (self._meta_path(job_id), self.file_path(job_id), self.file_path(job_id) + '.part'):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,62 @@
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+import os
+import threading
+from flask import jsonify
+
+class HasherBusy(Exception):
+    """Raised when every password hashing slot is taken"""
+
+class PasswordHasher:
+    """Runs bcrypt on a bounded thread pool instead of the request thread.
+
+    At most PASSWORD_HASH_WORKERS hashes run at once and at most
+    PASSWORD_HASH_QUEUE more may wait; beyond that requests fail fast with
+    503 rather than pinning every worker thread on bcrypt. The work factor
+    is flask_bcrypt's BCRYPT_LOG_ROUNDS.
+    """
+
+    def __init__(self, bcrypt, app=None):
+        self.bcrypt = bcrypt
+        self._executor = None
+        self._slots = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        workers = app.config.setdefault('PASSWORD_HASH_WORKERS', os.cpu_count() or 1)
+        queue = app.config.setdefault('PASSWORD_HASH_QUEUE', workers * 4)
+        self.timeout = app.config.setdefault('PASSWORD_HASH_TIMEOUT', 10)
+
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers,
+            thread_name_prefix='password-hash'
+        )
+        self._slots = threading.BoundedSemaphore(workers + queue)
+        app.register_error_handler(HasherBusy, self._busy_response)
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HasherBusy()
+        try:
+            future = self._executor.submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            raise HasherBusy()
+
+    def hash(self, password):
+        """Return the bcrypt hash of password as text"""
+        return self._run(self.bcrypt.generate_password_hash, password).decode('utf-8')
+
+    def check(self, password_hash, password):
+        return self._run(self.bcrypt.check_password_hash, password_hash, password)
+
+    @staticmethod
+    def _busy_response(error):
+        response = jsonify({'error': 'Server is busy, please retry shortly'})
+        response.headers['Retry-After'] = '1'
+        return response, 503
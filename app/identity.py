@@ -0,0 +1,98 @@
+from collections import OrderedDict, namedtuple
+import threading
+import time
+from flask import jsonify
+from flask_login import UserMixin
+
+class UserSnapshot(namedtuple('UserSnapshot', 'id email name mobile'), UserMixin):
+    """Read-only copy of a user's row, safe to share between requests"""
+    __slots__ = ()
+
+class IdentityCache:
+    """Bounded LRU of user snapshots with TTL eviction.
+
+    Registered as flask_jwt_extended's user lookup, so every request with a
+    valid token resolves its user here and handlers read it from
+    get_current_user() instead of querying the user row again. Writes to a
+    user's row must call invalidate(). A snapshot loaded while its user was
+    invalidated is not stored; the last invalidation of each user is kept in
+    a bounded LRU, and once one is evicted, loads that started before it
+    are not stored for anyone. The cache is per process, so another worker
+    may serve a snapshot up to IDENTITY_CACHE_TTL old.
+    """
+
+    def __init__(self, jwt, app=None):
+        self.jwt = jwt
+        self.enabled = False
+        self._entries = OrderedDict()
+        self._clock = 0  # invalidations so far
+        self._invalidated = OrderedDict()  # user id -> clock at their last invalidation
+        self._floor = 0  # clock of the newest invalidation no longer in _invalidated
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.setdefault('IDENTITY_CACHE_ENABLED', True)
+        self.max_entries = app.config.setdefault('IDENTITY_CACHE_SIZE', 10000)
+        self.ttl = app.config.setdefault('IDENTITY_CACHE_TTL', 300)
+        # jwt.init_app must run first to fill in its defaults
+        self.identity_claim = app.config['JWT_IDENTITY_CLAIM']
+        self.jwt.user_lookup_loader(self._lookup)
+        self.jwt.user_lookup_error_loader(self._not_found)
+
+    def get(self, user_id):
+        """Snapshot of the user, or None if there is no such user"""
+        user_id = int(user_id)
+        if not self.enabled:
+            return self._load(user_id)
+
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[1] > time.monotonic():
+                self._entries.move_to_end(user_id)
+                return entry[0]
+            generation = self._clock
+
+        snapshot = self._load(user_id)
+        if snapshot is None:
+            return None
+        with self._lock:
+            # Skip the store if the user was changed while we were loading
+            if self._invalidated.get(user_id, self._floor) <= generation:
+                self._entries[user_id] = (snapshot, time.monotonic() + self.ttl)
+                self._entries.move_to_end(user_id)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return snapshot
+
+    def invalidate(self, user_id):
+        user_id = int(user_id)
+        with self._lock:
+            self._clock += 1
+            self._invalidated[user_id] = self._clock
+            self._invalidated.move_to_end(user_id)
+            self._entries.pop(user_id, None)
+            while len(self._invalidated) > self.max_entries:
+                _, self._floor = self._invalidated.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._clock += 1
+            self._floor = self._clock
+            self._invalidated.clear()
+            self._entries.clear()
+
+    def _load(self, user_id):
+        from .models import User, db
+        row = db.session.query(User.id, User.email, User.name, User.mobile).\
+            filter(User.id == user_id).first()
+        return UserSnapshot(*row) if row is not None else None
+
+    def _lookup(self, jwt_header, jwt_data):
+        return self.get(jwt_data[self.identity_claim])
+
+    @staticmethod
+    def _not_found(jwt_header, jwt_data):
+        # A valid token whose user has since been deleted
+        return jsonify({'error': 'User not found'}), 401
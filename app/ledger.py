@@ -0,0 +1,142 @@
+from collections import defaultdict
+import click
+from flask.cli import AppGroup
+from sqlalchemy.dialects.sqlite import insert as upsert
+from .models import Balance, BalanceCheckpoint, Expense, ExpenseParticipant, db
+
+ledger_cli = AppGroup('ledger', help='Maintain the pairwise balance ledger.')
+
+def expense_deltas(creator_id, participants, deltas=None):
+    """Accumulate what each participant owes the creator for one expense.
+
+    Returns a dict of cents keyed by (creditor_id, debtor_id). Pass the same
+    dict again to fold several expenses into one set of deltas.
+    """
+    if deltas is None:
+        deltas = defaultdict(int)
+    creator_id = int(creator_id)
+    for participant in participants:
+        debtor_id = int(participant['user_id'])
+        if debtor_id != creator_id:
+            deltas[(creator_id, debtor_id)] += participant['share_cents']
+    return deltas
+
+def apply_deltas(deltas):
+    """Add deltas to the ledger in the current session; the caller commits.
+
+    One upsert adds each amount to its row in place, so concurrent writers
+    never overwrite each other's totals and nothing is read first.
+    """
+    changes = defaultdict(int)
+    for (creditor_id, debtor_id), amount in deltas.items():
+        changes[(creditor_id, debtor_id)] += amount
+        changes[(debtor_id, creditor_id)] -= amount
+    if not changes:
+        return
+
+    stmt = upsert(Balance)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['user_id', 'counterparty_id'],
+        set_={'amount_cents': Balance.amount_cents + stmt.excluded.amount_cents}
+    )
+    db.session.execute(stmt, [{
+        'user_id': user_id,
+        'counterparty_id': counterparty_id,
+        'amount_cents': amount
+    } for (user_id, counterparty_id), amount in changes.items()])
+
+def counterparty_balances_query(user_id, counterparty_ids=None, after=None):
+    """The user's own ledger rows, one per counterparty, in counterparty order.
+
+    Yields (counterparty_id, cents); positive cents means the counterparty
+    owes user_id. counterparty_ids optionally limits it to those users and
+    after to the counterparties past that id. Reads a range of the ledger's
+    primary key, however long the history.
+    """
+    query = db.session.query(Balance.counterparty_id, Balance.amount_cents).\
+        filter(Balance.user_id == user_id)
+    if counterparty_ids is not None:
+        query = query.filter(Balance.counterparty_id.in_(counterparty_ids))
+    if after is not None:
+        query = query.filter(Balance.counterparty_id > after)
+    return query.order_by(Balance.counterparty_id)
+
+def expense_balances(expense=Expense, participant=ExpenseParticipant, expense_ids=None):
+    """Pairwise balances of one expense/participant table pair.
+
+    expense_ids optionally limits it to a select of expense ids.
+    """
+    owed = db.session.query(
+        expense.creator_id,
+        participant.user_id,
+        db.func.sum(participant.share_cents)
+    ).\
+    join(participant, participant.expense_id == expense.id).\
+    filter(participant.user_id != expense.creator_id)
+    if expense_ids is not None:
+        owed = owed.filter(expense.id.in_(expense_ids))
+    owed = owed.group_by(expense.creator_id, participant.user_id)
+
+    balances = defaultdict(int)
+    for creditor_id, debtor_id, amount in owed:
+        balances[(creditor_id, debtor_id)] += amount or 0
+        balances[(debtor_id, creditor_id)] -= amount or 0
+    return balances
+
+def compute_balances():
+    """Recompute every pairwise balance from the raw expense rows.
+
+    Archived expenses are counted through their balance checkpoints.
+    """
+    balances = expense_balances()
+    for row in BalanceCheckpoint.query:
+        balances[(row.user_id, row.counterparty_id)] += row.amount_cents
+    return balances
+
+def find_drift():
+    """Compare the stored ledger with a fresh recomputation.
+
+    Returns (user_id, counterparty_id, stored, expected) for every pair that
+    disagrees, including pairs missing from either side.
+    """
+    expected = compute_balances()
+    stored = {
+        (row.user_id, row.counterparty_id): row.amount_cents
+        for row in Balance.query
+    }
+
+    drift = []
+    for pair in sorted(set(expected) | set(stored)):
+        stored_amount = stored.get(pair)
+        expected_amount = expected.get(pair, 0)
+        if stored_amount != expected_amount:
+            drift.append((pair[0], pair[1], stored_amount, expected_amount))
+    return drift
+
+def rebuild_ledger():
+    """Replace the ledger with balances recomputed from raw expenses"""
+    balances = compute_balances()
+    Balance.query.delete()
+    db.session.add_all(
+        Balance(user_id=user_id, counterparty_id=counterparty_id, amount_cents=amount)
+        for (user_id, counterparty_id), amount in balances.items()
+    )
+    db.session.commit()
+    return len(balances)
+
+@ledger_cli.command('verify')
+def verify_command():
+    """Report pairs whose stored balance differs from the raw expenses."""
+    drift = find_drift()
+    for user_id, counterparty_id, stored, expected in drift:
+        click.echo(f'user {user_id} / {counterparty_id}: stored={stored} expected={expected}')
+    if drift:
+        click.echo(f'{len(drift)} pair(s) drifted; run "flask ledger rebuild" to fix.')
+        raise SystemExit(1)
+    click.echo('Ledger is consistent with expenses.')
+
+@ledger_cli.command('rebuild')
+def rebuild_command():
+    """Recompute the whole ledger from raw expenses."""
+    count = rebuild_ledger()
+    click.echo(f'Rebuilt ledger with {count} balance rows.')
@@ -0,0 +1,174 @@
+from bisect import bisect_left
+from functools import partial
+from inspect import isgenerator
+import threading
+import time
+from flask import Response, g, has_request_context, request
+from sqlalchemy import event
+
+# Upper bounds of the histogram buckets; +Inf is implicit
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def samples(self):
+        """(le, cumulative count) pairs including +Inf"""
+        total = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            total += count
+            yield bound, total
+
+class EndpointStats:
+    def __init__(self):
+        self.responses = {}
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.queries = Histogram(QUERY_COUNT_BUCKETS)
+        self.db_seconds = 0.0
+        self.slow_queries = 0
+
+class Metrics:
+    """Per-endpoint request latency and SQL statistics, served at /metrics.
+
+    Queries are attributed to the request running them; the per-request
+    counts live on flask.g and are folded into the shared totals once, when
+    the request ends, so the hot path takes no lock. Statements slower than
+    SLOW_QUERY_MS are logged. Figures are per process.
+    """
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self._stats = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.setdefault('METRICS_ENABLED', True)
+        self.slow_query_seconds = app.config.setdefault('SLOW_QUERY_MS', 250) / 1000
+        self.logger = app.logger
+        if not self.enabled:
+            return
+        app.before_request(self._start_request)
+        app.after_request(self._record_status)
+        # Streamed responses are recorded when their body has been sent
+        app.teardown_request(self._end_request)
+        app.add_url_rule('/metrics', 'metrics', self.render)
+
+    def instrument(self, engine):
+        """Time every statement run on engine; call once per engine"""
+        if not self.enabled:
+            return
+
+        @event.listens_for(engine, 'before_cursor_execute')
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+        @event.listens_for(engine, 'after_cursor_execute')
+        def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            elapsed = time.perf_counter() - conn.info['query_start'].pop()
+            if elapsed >= self.slow_query_seconds:
+                self.logger.warning('Slow query (%.1f ms): %s', elapsed * 1000, statement)
+                slow = 1
+            else:
+                slow = 0
+            if has_request_context() and 'metrics_start' in g:
+                g.metrics_queries += 1
+                g.metrics_db_seconds += elapsed
+                g.metrics_slow_queries += slow
+
+    def _start_request(self):
+        g.metrics_start = time.perf_counter()
+        g.metrics_queries = 0
+        g.metrics_db_seconds = 0.0
+        g.metrics_slow_queries = 0
+
+    def _record_status(self, response):
+        g.metrics_status = response.status_code
+        if isgenerator(response.response) and 'metrics_start' in g:
+            # A generated body runs after the view returns, so the request
+            # is recorded once it has been sent, by the teardown that
+            # stream_with_context runs then or else when it is closed
+            g.metrics_streaming = True
+            response.call_on_close(partial(self._record, self._key(), g._get_current_object()))
+        return response
+
+    def _end_request(self, error=None):
+        if 'metrics_start' not in g or request.endpoint == 'metrics':
+            return
+        # A client closing a stream raises GeneratorExit, which is no error
+        if isinstance(error, Exception):
+            g.metrics_status = 500
+        if g.pop('metrics_streaming', False):
+            return
+        self._record(self._key(), g)
+
+    def _key(self):
+        # Route templates rather than raw paths keep label cardinality bounded
+        return (request.method, request.url_rule.rule if request.url_rule else 'unmatched')
+
+    def _record(self, key, state):
+        """Fold one request's figures from its flask.g into the totals"""
+        # Popped so that a request is recorded once
+        start = state.pop('metrics_start', None)
+        if start is None:
+            return
+        elapsed = time.perf_counter() - start
+        status = state.get('metrics_status', 500)
+
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = EndpointStats()
+            stats.responses[status] = stats.responses.get(status, 0) + 1
+            stats.latency.observe(elapsed)
+            stats.queries.observe(state.metrics_queries)
+            stats.db_seconds += state.metrics_db_seconds
+            stats.slow_queries += state.metrics_slow_queries
+
+    def render(self):
+        """Prometheus text exposition of the collected metrics"""
+        lines = []
+
+        def family(name, kind, help_text):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+
+        with self._lock:
+            stats = sorted(self._stats.items())
+
+            family('http_requests_total', 'counter', 'Requests by endpoint and status.')
+            for (method, rule), s in stats:
+                for status, count in sorted(s.responses.items()):
+                    lines.append(f'http_requests_total{{method="{method}",endpoint="{rule}",status="{status}"}} {count}')
+
+            for name, attr, help_text in (
+                ('http_request_duration_seconds', 'latency', 'Request latency.'),
+                ('db_queries_per_request', 'queries', 'SQL statements run per request.'),
+            ):
+                family(name, 'histogram', help_text)
+                for (method, rule), s in stats:
+                    histogram = getattr(s, attr)
+                    labels = f'method="{method}",endpoint="{rule}"'
+                    for bound, count in histogram.samples():
+                        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+                    lines.append(f'{name}_sum{{{labels}}} {histogram.sum}')
+                    lines.append(f'{name}_count{{{labels}}} {sum(histogram.counts)}')
+
+            family('db_query_duration_seconds_total', 'counter', 'Time spent in SQL statements.')
+            for (method, rule), s in stats:
+                lines.append(f'db_query_duration_seconds_total{{method="{method}",endpoint="{rule}"}} {s.db_seconds:.6f}')
+
+            family('db_slow_queries_total', 'counter', 'SQL statements slower than SLOW_QUERY_MS.')
+            for (method, rule), s in stats:
+                lines.append(f'db_slow_queries_total{{method="{method}",endpoint="{rule}"}} {s.slow_queries}')
+
+        return Response('\n'.join(lines) + '\n', content_type='text/plain; version=0.0.4; charset=utf-8')
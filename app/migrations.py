@@ -0,0 +1,550 @@
+from itertools import groupby
+import datetime
+import re
+import click
+from flask.cli import AppGroup
+from sqlalchemy.dialects import sqlite
+from . import db
+from .database import immediate_transaction
+from .splits import allocate
+
+db_cli = AppGroup('db', help='Manage the database schema.')
+
+# (version, description, function) in the order they were added. A migration
+# receives a connection inside its own transaction and must never be edited
+# once released; change the schema by appending a new one.
+MIGRATIONS = []
+
+# How long a worker waits for another one's migrations, in milliseconds
+MIGRATION_LOCK_TIMEOUT_MS = 10 * 60 * 1000
+
+# Tables large enough that a full scan on a request path is a bug
+HOT_TABLES = {'user', 'expense', 'expense_participant', 'balance', 'spending_rollup',
+              'expense_archive', 'expense_participant_archive', 'expense_change'}
+
+# Keyset-paginated hot queries: they must also read rows in index order,
+# since sorting in a temp B-tree reads every match before the first page
+KEYSET_QUERIES = {'GET /expenses/user created', 'GET /expenses/user participating',
+                  'GET /expenses/user created, archived',
+                  'GET /expenses/user participating, archived', 'GET /expenses/changes'}
+
+def migration(version, description):
+    """Register fn(connection) as the migration to schema version"""
+    def register(fn):
+        MIGRATIONS.append((version, description, fn))
+        return fn
+    return register
+
+@migration(1, 'Baseline schema')
+def baseline_schema(conn):
+    # Databases created by db.create_all() already have these tables
+    conn.exec_driver_sql('''
+        CREATE TABLE IF NOT EXISTS "user" (
+            id INTEGER NOT NULL,
+            email VARCHAR(120) NOT NULL,
+            name VARCHAR(80) NOT NULL,
+            mobile VARCHAR(15) NOT NULL,
+            password_hash VARCHAR(128),
+            PRIMARY KEY (id),
+            UNIQUE (email),
+            UNIQUE (mobile)
+        )
+    ''')
+    conn.exec_driver_sql('''
+        CREATE TABLE IF NOT EXISTS expense (
+            id INTEGER NOT NULL,
+            description VARCHAR(200) NOT NULL,
+            amount FLOAT NOT NULL,
+            date DATETIME,
+            split_type VARCHAR(20) NOT NULL,
+            creator_id INTEGER NOT NULL,
+            PRIMARY KEY (id),
+            FOREIGN KEY(creator_id) REFERENCES "user" (id)
+        )
+    ''')
+    conn.exec_driver_sql('''
+        CREATE TABLE IF NOT EXISTS expense_participant (
+            id INTEGER NOT NULL,
+            expense_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            share_amount FLOAT NOT NULL,
+            share_percentage FLOAT,
+            PRIMARY KEY (id),
+            FOREIGN KEY(expense_id) REFERENCES expense (id),
+            FOREIGN KEY(user_id) REFERENCES "user" (id)
+        )
+    ''')
+
+@migration(2, 'Pairwise balance ledger')
+def balance_ledger(conn):
+    conn.exec_driver_sql('''
+        CREATE TABLE IF NOT EXISTS balance (
+            user_id INTEGER NOT NULL,
+            counterparty_id INTEGER NOT NULL,
+            amount FLOAT NOT NULL,
+            PRIMARY KEY (user_id, counterparty_id),
+            FOREIGN KEY(user_id) REFERENCES "user" (id),
+            FOREIGN KEY(counterparty_id) REFERENCES "user" (id)
+        )
+    ''')
+    # Seed the ledger from existing expenses unless it was already built
+    if conn.exec_driver_sql('SELECT 1 FROM balance LIMIT 1').first() is None:
+        conn.exec_driver_sql('''
+            INSERT INTO balance (user_id, counterparty_id, amount)
+            SELECT user_id, counterparty_id, SUM(amount) FROM (
+                SELECT e.creator_id AS user_id, p.user_id AS counterparty_id,
+                       p.share_amount AS amount
+                FROM expense e JOIN expense_participant p ON p.expense_id = e.id
+                WHERE p.user_id != e.creator_id
+                UNION ALL
+                SELECT p.user_id, e.creator_id, -p.share_amount
+                FROM expense e JOIN expense_participant p ON p.expense_id = e.id
+                WHERE p.user_id != e.creator_id
+            )
+            GROUP BY user_id, counterparty_id
+        ''')
+
+@migration(3, 'Indexes for hot query paths')
+def hot_path_indexes(conn):
+    conn.exec_driver_sql(
+        'CREATE INDEX IF NOT EXISTS ix_expense_creator_date ON expense (creator_id, date)'
+    )
+    conn.exec_driver_sql(
+        'CREATE INDEX IF NOT EXISTS ix_expense_participant_user_expense '
+        'ON expense_participant (user_id, expense_id)'
+    )
+    conn.exec_driver_sql(
+        'CREATE INDEX IF NOT EXISTS ix_expense_participant_expense_user '
+        'ON expense_participant (expense_id, user_id)'
+    )
+
+@migration(4, 'Store amounts as integer cents')
+def integer_cents(conn):
+    # SQLite cannot change a column type in place, so each table is rebuilt
+    conn.exec_driver_sql('''
+        CREATE TABLE expense_new (
+            id INTEGER NOT NULL,
+            description VARCHAR(200) NOT NULL,
+            amount_cents INTEGER NOT NULL,
+            date DATETIME,
+            split_type VARCHAR(20) NOT NULL,
+            creator_id INTEGER NOT NULL,
+            PRIMARY KEY (id),
+            FOREIGN KEY(creator_id) REFERENCES "user" (id)
+        )
+    ''')
+    conn.exec_driver_sql('''
+        INSERT INTO expense_new (id, description, amount_cents, date, split_type, creator_id)
+        SELECT id, description, CAST(ROUND(amount * 100) AS INTEGER), date, split_type, creator_id
+        FROM expense
+    ''')
+
+    conn.exec_driver_sql('''
+        CREATE TABLE expense_participant_new (
+            id INTEGER NOT NULL,
+            expense_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            share_cents INTEGER NOT NULL,
+            share_percentage FLOAT,
+            PRIMARY KEY (id),
+            FOREIGN KEY(expense_id) REFERENCES expense (id),
+            FOREIGN KEY(user_id) REFERENCES "user" (id)
+        )
+    ''')
+    # Float shares are re-split with largest-remainder rounding so every
+    # expense's shares add up to its total exactly
+    rows = conn.exec_driver_sql('''
+        SELECT p.id, p.expense_id, p.user_id, p.share_amount, p.share_percentage, e.amount_cents
+        FROM expense_participant p JOIN expense_new e ON e.id = p.expense_id
+        ORDER BY p.expense_id, p.id
+    ''')
+    batch = []
+    for _, group in groupby(rows, key=lambda row: row[1]):
+        group = list(group)
+        amounts = [row[3] for row in group]
+        if all(amount >= 0 for amount in amounts) and sum(amounts) > 0:
+            shares = allocate(group[0][5], amounts)
+        else:
+            shares = [int(round(amount * 100)) for amount in amounts]
+        batch.extend(
+            (row[0], row[1], row[2], share, row[4]) for row, share in zip(group, shares)
+        )
+        if len(batch) >= 1000:
+            insert_participants(conn, batch)
+            batch = []
+    insert_participants(conn, batch)
+
+    conn.exec_driver_sql('DROP TABLE expense_participant')
+    conn.exec_driver_sql('DROP TABLE expense')
+    conn.exec_driver_sql('ALTER TABLE expense_new RENAME TO expense')
+    conn.exec_driver_sql('ALTER TABLE expense_participant_new RENAME TO expense_participant')
+    hot_path_indexes(conn)
+
+    conn.exec_driver_sql('DROP TABLE balance')
+    conn.exec_driver_sql('''
+        CREATE TABLE balance (
+            user_id INTEGER NOT NULL,
+            counterparty_id INTEGER NOT NULL,
+            amount_cents INTEGER NOT NULL,
+            PRIMARY KEY (user_id, counterparty_id),
+            FOREIGN KEY(user_id) REFERENCES "user" (id),
+            FOREIGN KEY(counterparty_id) REFERENCES "user" (id)
+        )
+    ''')
+    conn.exec_driver_sql('''
+        INSERT INTO balance (user_id, counterparty_id, amount_cents)
+        SELECT user_id, counterparty_id, SUM(amount) FROM (
+            SELECT e.creator_id AS user_id, p.user_id AS counterparty_id,
+                   p.share_cents AS amount
+            FROM expense e JOIN expense_participant p ON p.expense_id = e.id
+            WHERE p.user_id != e.creator_id
+            UNION ALL
+            SELECT p.user_id, e.creator_id, -p.share_cents
+            FROM expense e JOIN expense_participant p ON p.expense_id = e.id
+            WHERE p.user_id != e.creator_id
+        )
+        GROUP BY user_id, counterparty_id
+    ''')
+
+@migration(5, 'Trigram search index for users')
+def user_search_index(conn):
+    # External-content FTS5 table: stores only the index, reads rows from user
+    conn.exec_driver_sql('''
+        CREATE VIRTUAL TABLE user_search USING fts5(
+            name, email, content='user', content_rowid='id', tokenize='trigram'
+        )
+    ''')
+    conn.exec_driver_sql('''
+        CREATE TRIGGER user_search_insert AFTER INSERT ON "user" BEGIN
+            INSERT INTO user_search (rowid, name, email) VALUES (new.id, new.name, new.email);
+        END
+    ''')
+    conn.exec_driver_sql('''
+        CREATE TRIGGER user_search_delete AFTER DELETE ON "user" BEGIN
+            INSERT INTO user_search (user_search, rowid, name, email)
+            VALUES ('delete', old.id, old.name, old.email);
+        END
+    ''')
+    conn.exec_driver_sql('''
+        CREATE TRIGGER user_search_update AFTER UPDATE OF name, email ON "user" BEGIN
+            INSERT INTO user_search (user_search, rowid, name, email)
+            VALUES ('delete', old.id, old.name, old.email);
+            INSERT INTO user_search (rowid, name, email) VALUES (new.id, new.name, new.email);
+        END
+    ''')
+    conn.exec_driver_sql("INSERT INTO user_search (user_search) VALUES ('rebuild')")
+
+@migration(6, 'Recent contacts index')
+def recent_contacts(conn):
+    conn.exec_driver_sql('''
+        CREATE TABLE recent_contact (
+            user_id INTEGER NOT NULL,
+            contact_id INTEGER NOT NULL,
+            last_expense_at DATETIME NOT NULL,
+            PRIMARY KEY (user_id, contact_id),
+            FOREIGN KEY(user_id) REFERENCES "user" (id),
+            FOREIGN KEY(contact_id) REFERENCES "user" (id)
+        )
+    ''')
+    conn.exec_driver_sql(
+        'CREATE INDEX ix_recent_contact_user_last ON recent_contact (user_id, last_expense_at)'
+    )
+    # Backfill with the same rule as contacts.contact_pairs: everyone in an
+    # expense is linked unless it has more than 50 people, in which case
+    # only the creator is linked with each participant
+    conn.exec_driver_sql('''
+        WITH involved AS (
+            SELECT expense_id, user_id FROM expense_participant
+            UNION
+            SELECT id, creator_id FROM expense
+        ),
+        sizes AS (
+            SELECT expense_id, COUNT(*) AS people FROM involved GROUP BY expense_id
+        )
+        INSERT INTO recent_contact (user_id, contact_id, last_expense_at)
+        SELECT a.user_id, b.user_id, MAX(e.date)
+        FROM involved a
+        JOIN involved b ON b.expense_id = a.expense_id AND b.user_id != a.user_id
+        JOIN expense e ON e.id = a.expense_id
+        JOIN sizes s ON s.expense_id = a.expense_id
+        WHERE e.date IS NOT NULL AND (
+            s.people <= 50 OR
+            a.user_id = e.creator_id OR
+            b.user_id = e.creator_id
+        )
+        GROUP BY a.user_id, b.user_id
+    ''')
+
+@migration(7, 'Daily and monthly spending rollups')
+def spending_rollups(conn):
+    conn.exec_driver_sql('''
+        CREATE TABLE spending_rollup (
+            user_id INTEGER NOT NULL,
+            bucket VARCHAR(5) NOT NULL,
+            period_start DATE NOT NULL,
+            paid_cents INTEGER NOT NULL,
+            share_cents INTEGER NOT NULL,
+            expense_count INTEGER NOT NULL,
+            PRIMARY KEY (user_id, bucket, period_start),
+            FOREIGN KEY(user_id) REFERENCES "user" (id)
+        )
+    ''')
+    # Same totals as rollups.spending_deltas: everyone involved in an
+    # expense counts it once, the creator adds the amount as paid and each
+    # participant adds their share
+    conn.exec_driver_sql('''
+        WITH shares AS (
+            SELECT expense_id, user_id, SUM(share_cents) AS share_cents
+            FROM expense_participant
+            GROUP BY expense_id, user_id
+        ),
+        involved AS (
+            SELECT expense_id, user_id FROM shares
+            UNION
+            SELECT id, creator_id FROM expense
+        ),
+        facts AS (
+            SELECT i.user_id, e.date,
+                   CASE WHEN i.user_id = e.creator_id THEN e.amount_cents ELSE 0 END AS paid_cents,
+                   COALESCE(s.share_cents, 0) AS share_cents
+            FROM involved i
+            JOIN expense e ON e.id = i.expense_id
+            LEFT JOIN shares s ON s.expense_id = i.expense_id AND s.user_id = i.user_id
+            WHERE e.date IS NOT NULL
+        )
+        INSERT INTO spending_rollup
+            (user_id, bucket, period_start, paid_cents, share_cents, expense_count)
+        SELECT user_id, 'day', date(date), SUM(paid_cents), SUM(share_cents), COUNT(*)
+        FROM facts GROUP BY user_id, date(date)
+        UNION ALL
+        SELECT user_id, 'month', strftime('%Y-%m-01', date), SUM(paid_cents), SUM(share_cents), COUNT(*)
+        FROM facts GROUP BY user_id, strftime('%Y-%m-01', date)
+    ''')
+
+@migration(8, 'Expense archive and balance checkpoints')
+def expense_archive(conn):
+    conn.exec_driver_sql('''
+        CREATE TABLE expense_archive (
+            id INTEGER NOT NULL,
+            description VARCHAR(200) NOT NULL,
+            amount_cents INTEGER NOT NULL,
+            date DATETIME,
+            split_type VARCHAR(20) NOT NULL,
+            creator_id INTEGER NOT NULL,
+            PRIMARY KEY (id),
+            FOREIGN KEY(creator_id) REFERENCES "user" (id)
+        )
+    ''')
+    conn.exec_driver_sql('''
+        CREATE TABLE expense_participant_archive (
+            id INTEGER NOT NULL,
+            expense_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            share_cents INTEGER NOT NULL,
+            share_percentage FLOAT,
+            PRIMARY KEY (id),
+            FOREIGN KEY(expense_id) REFERENCES expense_archive (id),
+            FOREIGN KEY(user_id) REFERENCES "user" (id)
+        )
+    ''')
+    conn.exec_driver_sql('''
+        CREATE TABLE balance_checkpoint (
+            user_id INTEGER NOT NULL,
+            counterparty_id INTEGER NOT NULL,
+            amount_cents INTEGER NOT NULL,
+            archived_before DATETIME NOT NULL,
+            PRIMARY KEY (user_id, counterparty_id),
+            FOREIGN KEY(user_id) REFERENCES "user" (id),
+            FOREIGN KEY(counterparty_id) REFERENCES "user" (id)
+        )
+    ''')
+    for statement in (
+        'CREATE INDEX ix_expense_archive_creator_date ON expense_archive (creator_id, date)',
+        'CREATE INDEX ix_expense_participant_archive_user_expense '
+        'ON expense_participant_archive (user_id, expense_id)',
+        'CREATE INDEX ix_expense_participant_archive_expense_user '
+        'ON expense_participant_archive (expense_id, user_id)',
+    ):
+        conn.exec_driver_sql(statement)
+
+@migration(9, 'Expense change feed')
+def expense_changes(conn):
+    conn.exec_driver_sql('''
+        CREATE TABLE expense_change (
+            id INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            expense_id INTEGER NOT NULL,
+            action VARCHAR(10) NOT NULL,
+            changed_at DATETIME NOT NULL,
+            FOREIGN KEY(user_id) REFERENCES "user" (id)
+        )
+    ''')
+    conn.exec_driver_sql('CREATE INDEX ix_expense_change_user_id ON expense_change (user_id, id)')
+    # Existing expenses, live and archived, start the feed as 'created'
+    # changes for everyone involved, in expense order
+    conn.exec_driver_sql('''
+        WITH expenses AS (
+            SELECT id, creator_id, date FROM expense
+            UNION ALL
+            SELECT id, creator_id, date FROM expense_archive
+        ),
+        involved AS (
+            SELECT expense_id, user_id FROM expense_participant
+            UNION
+            SELECT expense_id, user_id FROM expense_participant_archive
+            UNION
+            SELECT id, creator_id FROM expenses
+        )
+        INSERT INTO expense_change (user_id, expense_id, action, changed_at)
+        SELECT i.user_id, e.id, 'created', COALESCE(e.date, CURRENT_TIMESTAMP)
+        FROM involved i
+        JOIN expenses e ON e.id = i.expense_id
+        ORDER BY e.id, i.user_id
+    ''')
+
+@migration(10, 'Expense dates on participant rows')
+def participant_expense_dates(conn):
+    # A user's expenses are then read newest first straight off an index
+    # on either side: creator_id on expense, user_id on participants
+    for table, expenses in (('expense_participant', 'expense'),
+                            ('expense_participant_archive', 'expense_archive')):
+        conn.exec_driver_sql(f'ALTER TABLE {table} ADD COLUMN expense_date DATETIME')
+        conn.exec_driver_sql(
+            f'UPDATE {table} SET expense_date = '
+            f'(SELECT date FROM {expenses} WHERE {expenses}.id = {table}.expense_id)'
+        )
+        conn.exec_driver_sql(
+            f'CREATE INDEX ix_{table}_user_date ON {table} (user_id, expense_date, expense_id)'
+        )
+
+@migration(11, 'Case-insensitive index on user names')
+def user_name_index(conn):
+    # Serves the name prefix matches of user search in order
+    conn.exec_driver_sql('CREATE INDEX ix_user_name_nocase ON "user" (name COLLATE NOCASE)')
+
+def insert_participants(conn, rows):
+    if rows:
+        conn.exec_driver_sql(
+            'INSERT INTO expense_participant_new '
+            '(id, expense_id, user_id, share_cents, share_percentage) VALUES (?, ?, ?, ?, ?)',
+            rows
+        )
+
+def current_version(conn):
+    """Highest migration applied to the database, 0 for a new database"""
+    conn.exec_driver_sql(
+        'CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)'
+    )
+    return conn.exec_driver_sql('SELECT MAX(version) FROM schema_version').scalar() or 0
+
+def upgrade():
+    """Apply pending migrations in order, each in its own transaction.
+
+    Each transaction takes the write lock before reading the schema version,
+    so workers starting together wait for each other and every migration is
+    applied exactly once; a migration that fails is rolled back entirely,
+    DDL included. Returns the (version, description) pairs that were applied.
+    """
+    applied = []
+    with db.engine.connect() as conn:
+        conn.execution_options(isolation_level='AUTOCOMMIT')
+        busy_timeout = conn.exec_driver_sql('PRAGMA busy_timeout').scalar()
+        # Long enough to wait out another worker's migrations
+        conn.exec_driver_sql(f'PRAGMA busy_timeout = {MIGRATION_LOCK_TIMEOUT_MS}')
+        try:
+            for version, description, fn in sorted(MIGRATIONS, key=lambda m: m[0]):
+                with immediate_transaction(conn):
+                    if version <= current_version(conn):
+                        continue
+                    fn(conn)
+                    conn.exec_driver_sql(
+                        'INSERT INTO schema_version (version) VALUES (?)', (version,)
+                    )
+                applied.append((version, description))
+        finally:
+            conn.exec_driver_sql(f'PRAGMA busy_timeout = {int(busy_timeout)}')
+    return applied
+
+def hot_queries(user_id=1):
+    """The statements behind each request path, keyed by a readable name"""
+    from .changes import changes_query
+    from .expenses import (balance_sheet_query, changed_expenses_query, participants_query,
+                           user_expense_key_queries)
+    from .ledger import counterparty_balances_query
+    from .rollups import summary_query
+    from .users import balance_query, recent_contacts_query, search_users_query
+
+    before = (datetime.datetime(2100, 1, 1), 1000000)
+    created, participating, created_archived, participating_archived = \
+        user_expense_key_queries(user_id, before, include_archived=True)
+    return {
+        'GET /expenses/user created': created.limit(51),
+        'GET /expenses/user participating': participating.limit(51),
+        'GET /expenses/user created, archived': created_archived.limit(51),
+        'GET /expenses/user participating, archived': participating_archived.limit(51),
+        'GET /expenses/user participants': participants_query([1, 2, 3]),
+        'GET /expenses/user participants, archived': participants_query([1, 2, 3], True),
+        'GET /expenses/changes': changes_query(user_id).limit(51),
+        'GET /expenses/changes expenses': changed_expenses_query(user_id, [1, 2, 3]),
+        'GET /balance-sheet/download': balance_sheet_query(user_id),
+        'GET /users/recent-contacts': recent_contacts_query(user_id),
+        'GET /user/balance': balance_query(user_id),
+        'GET /users/search': search_users_query('example', 10).limit(10),
+        'GET /users/settlement': counterparty_balances_query(user_id, after=user_id).limit(200),
+        'GET /users/settlement, user_ids': counterparty_balances_query(user_id, [user_id + 1]),
+        'GET /users/balances': counterparty_balances_query(user_id, after=user_id).limit(200),
+        'GET /users/balances, user_ids': counterparty_balances_query(user_id, [user_id + 1]),
+        'GET /user/summary': summary_query(user_id, 'month'),
+    }
+
+def explain(query):
+    """Return the SQLite query plan lines for an ORM query"""
+    statement = query.statement.compile(
+        dialect=sqlite.dialect(),
+        compile_kwargs={'literal_binds': True}
+    )
+    rows = db.session.execute(db.text(f'EXPLAIN QUERY PLAN {statement}'))
+    return [row[-1] for row in rows]
+
+def full_scans(plan, keyset=False):
+    """Plan lines that scan a hot table without using an index, and for a
+    keyset query the lines that sort its rows outside an index"""
+    scans = []
+    for line in plan:
+        match = re.match(r'SCAN (\w+)', line)
+        if match and match.group(1) in HOT_TABLES and 'USING' not in line:
+            scans.append(line)
+        elif keyset and re.match(r'USE TEMP B-TREE FOR (RIGHT PART OF |LAST TERM OF )?ORDER BY', line):
+            scans.append(line)
+    return scans
+
+@db_cli.command('upgrade')
+def upgrade_command():
+    """Apply pending schema migrations."""
+    applied = upgrade()
+    for version, description in applied:
+        click.echo(f'Applied {version}: {description}')
+    if not applied:
+        click.echo('Database is up to date.')
+
+@db_cli.command('current')
+def current_command():
+    """Show the schema version of the database."""
+    with db.engine.connect() as conn:
+        version = current_version(conn)
+    latest = max(version for version, _, _ in MIGRATIONS)
+    click.echo(f'Schema version {version} (latest {latest}).')
+
+@db_cli.command('check-indexes')
+def check_indexes_command():
+    """Verify with EXPLAIN QUERY PLAN that request queries use indexes."""
+    failed = False
+    for name, query in hot_queries().items():
+        plan = explain(query)
+        scans = full_scans(plan, keyset=name in KEYSET_QUERIES)
+        click.echo(f'{"FAIL" if scans else "ok"}  {name}')
+        for line in plan:
+            click.echo(f'      {line}')
+        failed = failed or bool(scans)
+    if failed:
+        raise SystemExit(1)
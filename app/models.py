@@ -1,12 +1,15 @@
 from datetime import datetime
 from flask_login import UserMixin
-from . import db, bcrypt,login_manager 
+from . import db, identity_cache, login_manager, password_hasher
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    return identity_cache.get(user_id)
 
 class User(UserMixin, db.Model):
+    __table_args__ = (
+        db.Index('ix_user_name_nocase', db.text('name COLLATE NOCASE')),
+    )
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(120), unique=True, nullable=False)
     name = db.Column(db.String(80), nullable=False)
@@ -16,23 +19,123 @@ class User(UserMixin, db.Model):
     participations = db.relationship('ExpenseParticipant', backref='user', lazy=True)
 
     def set_password(self, password):
-        self.password_hash = bcrypt.generate_password_hash(password).decode('utf-8')
+        self.password_hash = password_hasher.hash(password)
 
     def check_password(self, password):
-        return bcrypt.check_password_hash(self.password_hash, password)
+        return password_hasher.check(self.password_hash, password)
 
 class Expense(db.Model):
+    __table_args__ = (
+        db.Index('ix_expense_creator_date', 'creator_id', 'date'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     description = db.Column(db.String(200), nullable=False)
-    amount = db.Column(db.Float, nullable=False)
+    amount_cents = db.Column(db.Integer, nullable=False)
     date = db.Column(db.DateTime, default=datetime.utcnow)
     split_type = db.Column(db.String(20), nullable=False)  # 'equal', 'exact', 'percentage'
     creator_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     participants = db.relationship('ExpenseParticipant', backref='expense', lazy=True)
 
 class ExpenseParticipant(db.Model):
+    __table_args__ = (
+        db.Index('ix_expense_participant_user_expense', 'user_id', 'expense_id'),
+        db.Index('ix_expense_participant_expense_user', 'expense_id', 'user_id'),
+        db.Index('ix_expense_participant_user_date', 'user_id', 'expense_date', 'expense_id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     expense_id = db.Column(db.Integer, db.ForeignKey('expense.id'), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    share_amount = db.Column(db.Float, nullable=False)  # For exact splits
-    share_percentage = db.Column(db.Float)  # For percentage splits
\ No newline at end of file
+    share_cents = db.Column(db.Integer, nullable=False)
+    share_percentage = db.Column(db.Float)  # For percentage splits
+    expense_date = db.Column(db.DateTime)  # Copy of the expense's date, for listings
+
+class Balance(db.Model):
+    """Denormalized pairwise balance, kept in step with expenses by add_expense.
+
+    Every pair is stored in both directions so a user's balances are a single
+    indexed read. A positive amount means the counterparty owes user_id.
+    Like every stored amount it is in integer cents.
+    """
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    counterparty_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    amount_cents = db.Column(db.Integer, nullable=False, default=0)
+
+class RecentContact(db.Model):
+    """When user_id last shared an expense with contact_id, kept by add_expense"""
+    __table_args__ = (
+        db.Index('ix_recent_contact_user_last', 'user_id', 'last_expense_at'),
+    )
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    contact_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    last_expense_at = db.Column(db.DateTime, nullable=False)
+
+class SpendingRollup(db.Model):
+    """A user's spending per day or month, kept in step with expenses by add_expense.
+
+    paid_cents is what the user paid as creator, share_cents their own share
+    and expense_count the expenses they were involved in, for expenses dated
+    within the period starting at period_start.
+    """
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    bucket = db.Column(db.String(5), primary_key=True)  # 'day' or 'month'
+    period_start = db.Column(db.Date, primary_key=True)
+    paid_cents = db.Column(db.Integer, nullable=False, default=0)
+    share_cents = db.Column(db.Integer, nullable=False, default=0)
+    expense_count = db.Column(db.Integer, nullable=False, default=0)
+
+class ExpenseArchive(db.Model):
+    """Expenses moved out of the live table by "flask archive run".
+
+    Same columns as Expense; rows keep their original ids, so live and
+    archived ids never collide.
+    """
+    __table_args__ = (
+        db.Index('ix_expense_archive_creator_date', 'creator_id', 'date'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    description = db.Column(db.String(200), nullable=False)
+    amount_cents = db.Column(db.Integer, nullable=False)
+    date = db.Column(db.DateTime)
+    split_type = db.Column(db.String(20), nullable=False)
+    creator_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+
+class ExpenseParticipantArchive(db.Model):
+    """Participants of archived expenses, in their original order"""
+    __table_args__ = (
+        db.Index('ix_expense_participant_archive_user_expense', 'user_id', 'expense_id'),
+        db.Index('ix_expense_participant_archive_expense_user', 'expense_id', 'user_id'),
+        db.Index('ix_expense_participant_archive_user_date', 'user_id', 'expense_date', 'expense_id'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    expense_id = db.Column(db.Integer, db.ForeignKey('expense_archive.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    share_cents = db.Column(db.Integer, nullable=False)
+    share_percentage = db.Column(db.Float)
+    expense_date = db.Column(db.DateTime)
+
+class BalanceCheckpoint(db.Model):
+    """Pairwise balances of all archived expenses, like Balance.
+
+    The ledger equals these checkpoints plus the deltas of live expenses.
+    """
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    counterparty_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    amount_cents = db.Column(db.Integer, nullable=False, default=0)
+    archived_before = db.Column(db.DateTime, nullable=False)
+
+class ExpenseChange(db.Model):
+    """One row per user affected by each expense write, for GET /expenses/changes.
+
+    Ids come from AUTOINCREMENT, so they only grow and are never reused,
+    and SQLite's single writer commits them in order: a client that has
+    seen change n has seen every earlier change of its user.
+    """
+    __table_args__ = (
+        db.Index('ix_expense_change_user_id', 'user_id', 'id'),
+        {'sqlite_autoincrement': True},
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    expense_id = db.Column(db.Integer, nullable=False)
+    action = db.Column(db.String(10), nullable=False)
+    changed_at = db.Column(db.DateTime, nullable=False)
@@ -0,0 +1,191 @@
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import islice
+import csv
+import json
+import os
+import time
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from flask_bcrypt import generate_password_hash
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+from .auth import validate_registration
+from .models import User, db
+
+users_cli = AppGroup('users', help='Manage user accounts.')
+
+IMPORT_BATCH_SIZE = 1000
+REJECTED_FIELDS = ['line', 'email', 'name', 'mobile', 'error']
+
+def hash_password(password, rounds):
+    # Runs in a worker process; same hash format as User.set_password
+    return generate_password_hash(password, rounds).decode('utf-8')
+
+def read_rows(path, fmt):
+    """Yield (line number, row, error) from a CSV file with a header or NDJSON"""
+    with open(path, newline='', encoding='utf-8') as f:
+        if fmt == 'csv':
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield reader.line_num, row, None
+            return
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                yield number, None, 'Invalid JSON'
+                continue
+            yield number, row, None if isinstance(row, dict) else 'Expected a JSON object'
+
+def import_users(rows, reject, rounds, workers=None, batch_size=IMPORT_BATCH_SIZE, progress=None):
+    """Create users from (line, row, error) tuples; returns the counts.
+
+    Rows are checked with the /register rules. Duplicates within the input
+    are caught in memory and existing accounts with one query per batch, so
+    only new users are hashed, spread over a process pool. Each batch is
+    inserted in one transaction. reject(line, row, error) is called for
+    every row that is not imported.
+    """
+    counts = {'processed': 0, 'imported': 0, 'rejected': 0}
+    workers = workers or os.cpu_count() or 1
+    seen_emails = set()
+    seen_mobiles = set()
+    rows = iter(rows)
+
+    def rejected(line, row, error):
+        counts['rejected'] += 1
+        reject(line, row, error)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            counts['processed'] += len(batch)
+
+            accepted = []
+            for line, row, error in batch:
+                error = error or validate_registration(row)
+                if not error and row['email'] in seen_emails:
+                    error = 'Duplicate email in file'
+                if not error and row['mobile'] in seen_mobiles:
+                    error = 'Duplicate mobile in file'
+                if error:
+                    rejected(line, row, error)
+                    continue
+                seen_emails.add(row['email'])
+                seen_mobiles.add(row['mobile'])
+                accepted.append((line, row))
+
+            if accepted:
+                taken = db.session.query(User.email, User.mobile).filter(
+                    User.email.in_([row['email'] for _, row in accepted]) |
+                    User.mobile.in_([row['mobile'] for _, row in accepted])
+                ).all()
+                taken_emails = {email for email, _ in taken}
+                taken_mobiles = {mobile for _, mobile in taken}
+                new = []
+                for line, row in accepted:
+                    if row['email'] in taken_emails:
+                        rejected(line, row, 'Email already registered')
+                    elif row['mobile'] in taken_mobiles:
+                        rejected(line, row, 'Mobile number already registered')
+                    else:
+                        new.append((line, row))
+                accepted = new
+
+            if accepted:
+                hashes = pool.map(
+                    partial(hash_password, rounds=rounds),
+                    [row['password'] for _, row in accepted],
+                    chunksize=max(1, len(accepted) // (4 * workers))
+                )
+                users = [{
+                    'email': row['email'],
+                    'name': row['name'],
+                    'mobile': row['mobile'],
+                    'password_hash': password_hash
+                } for (_, row), password_hash in zip(accepted, hashes)]
+                counts['imported'] += insert_users(accepted, users, rejected)
+
+            if progress:
+                progress(counts)
+    return counts
+
+def insert_users(accepted, users, rejected):
+    """Insert a batch in one transaction; returns how many were inserted.
+
+    If an account was registered meanwhile the batch falls back to one
+    insert per user so only the conflicting rows are rejected.
+    """
+    try:
+        db.session.execute(insert(User), users)
+        db.session.commit()
+        return len(users)
+    except IntegrityError:
+        db.session.rollback()
+
+    inserted = 0
+    for (line, row), user in zip(accepted, users):
+        try:
+            db.session.execute(insert(User), [user])
+            db.session.commit()
+            inserted += 1
+        except IntegrityError:
+            db.session.rollback()
+            rejected(line, row, 'Email or mobile number already registered')
+    return inserted
+
+@users_cli.command('import')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'ndjson']),
+              help='Input format; defaults to the file extension.')
+@click.option('--rejected', 'rejected_path', type=click.Path(dir_okay=False),
+              help='CSV file for rejected rows [default: PATH.rejected.csv]')
+@click.option('--batch-size', default=IMPORT_BATCH_SIZE, show_default=True)
+@click.option('--workers', type=int, help='Hashing processes [default: all cores]')
+def import_command(path, fmt, rejected_path, batch_size, workers):
+    """Create users from a CSV or NDJSON file.
+
+    Rows need email, name, mobile and password, and are validated like
+    POST /register. Rejected rows are written, without their passwords, to
+    the rejected file with the reason.
+    """
+    if fmt is None:
+        fmt = 'csv' if path.lower().endswith('.csv') else 'ndjson'
+    rejected_path = rejected_path or f'{path}.rejected.csv'
+    rounds = current_app.config['BCRYPT_LOG_ROUNDS']
+    started = time.monotonic()
+
+    def progress(counts):
+        rate = counts['processed'] / max(time.monotonic() - started, 1e-9)
+        click.echo(f'\r{counts["processed"]} rows: {counts["imported"]} imported, '
+                   f'{counts["rejected"]} rejected ({rate:.0f} rows/s)', nl=False, err=True)
+
+    with open(rejected_path, 'w', newline='', encoding='utf-8') as out:
+        writer = csv.DictWriter(out, REJECTED_FIELDS)
+        writer.writeheader()
+
+        def reject(line, row, error):
+            row = row if isinstance(row, dict) else {}
+            writer.writerow({
+                'line': line,
+                'email': row.get('email'),
+                'name': row.get('name'),
+                'mobile': row.get('mobile'),
+                'error': error
+            })
+
+        counts = import_users(read_rows(path, fmt), reject, rounds, workers, batch_size, progress)
+
+    click.echo(err=True)
+    click.echo(f'Imported {counts["imported"]} of {counts["processed"]} users '
+               f'in {time.monotonic() - started:.1f}s.')
+    if counts['rejected']:
+        click.echo(f'{counts["rejected"]} rejected row(s) written to {rejected_path}.')
+    else:
+        os.remove(rejected_path)
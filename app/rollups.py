@@ -0,0 +1,163 @@
+from collections import defaultdict, namedtuple
+from itertools import groupby
+import click
+from flask.cli import AppGroup
+from sqlalchemy import insert
+from sqlalchemy.dialects.sqlite import insert as upsert
+from .models import (Expense, ExpenseArchive, ExpenseParticipant, ExpenseParticipantArchive,
+                     SpendingRollup, db)
+
+rollups_cli = AppGroup('rollups', help='Maintain the spending rollups.')
+
+BUCKETS = ('day', 'month')
+BACKFILL_BATCH_SIZE = 5000
+
+Spending = namedtuple('Spending', 'creator_id date amount_cents participants')
+
+def period_start(date, bucket):
+    """First day of the day or month bucket containing date"""
+    day = date.date() if hasattr(date, 'date') else date
+    return day if bucket == 'day' else day.replace(day=1)
+
+def spending_deltas(expenses, totals=None):
+    """Accumulate [paid, share, count] cents per (user_id, bucket, period_start).
+
+    expenses are NewExpense-like tuples with creator_id, date, amount_cents
+    and participants carrying 'user_id' and 'share_cents'. Pass the same
+    dict again to fold more expenses in.
+    """
+    if totals is None:
+        totals = defaultdict(lambda: [0, 0, 0])
+    for expense in expenses:
+        creator_id = int(expense.creator_id)
+        shares = defaultdict(int)
+        for participant in expense.participants:
+            shares[int(participant['user_id'])] += participant['share_cents']
+        for user_id in shares.keys() | {creator_id}:
+            paid = expense.amount_cents if user_id == creator_id else 0
+            for bucket in BUCKETS:
+                total = totals[(user_id, bucket, period_start(expense.date, bucket))]
+                total[0] += paid
+                total[1] += shares.get(user_id, 0)
+                total[2] += 1
+    return totals
+
+def record_spending(expenses):
+    """Add new expenses to the rollups in the current session; caller commits"""
+    totals = spending_deltas(expenses)
+    if not totals:
+        return
+
+    stmt = upsert(SpendingRollup)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['user_id', 'bucket', 'period_start'],
+        set_={
+            'paid_cents': SpendingRollup.paid_cents + stmt.excluded.paid_cents,
+            'share_cents': SpendingRollup.share_cents + stmt.excluded.share_cents,
+            'expense_count': SpendingRollup.expense_count + stmt.excluded.expense_count,
+        }
+    )
+    db.session.execute(stmt, rollup_rows(totals))
+
+def rollup_rows(totals):
+    return [{
+        'user_id': user_id,
+        'bucket': bucket,
+        'period_start': start,
+        'paid_cents': paid,
+        'share_cents': share,
+        'expense_count': count
+    } for (user_id, bucket, start), (paid, share, count) in totals.items()]
+
+def summary_query(user_id, bucket, start=None, end=None):
+    """Rollup rows of one bucket size for the user, oldest first.
+
+    start and end are dates; a bucket is included when it starts within
+    [start, end), so month buckets cover whole months.
+    """
+    query = db.session.query(
+        SpendingRollup.period_start,
+        SpendingRollup.paid_cents,
+        SpendingRollup.share_cents,
+        SpendingRollup.expense_count
+    ).filter(
+        SpendingRollup.user_id == user_id,
+        SpendingRollup.bucket == bucket
+    )
+    if start:
+        query = query.filter(SpendingRollup.period_start >= period_start(start, bucket))
+    if end:
+        query = query.filter(SpendingRollup.period_start < end)
+    return query.order_by(SpendingRollup.period_start)
+
+def compute_rollups():
+    """Recompute every rollup row from the raw expense rows.
+
+    Streams live and archived expenses with their participants through the
+    same spending_deltas used on writes, so a backfill can never disagree
+    with the incremental updates.
+    """
+    totals = defaultdict(lambda: [0, 0, 0])
+    for expense, participant in ((Expense, ExpenseParticipant),
+                                 (ExpenseArchive, ExpenseParticipantArchive)):
+        rows = db.session.query(
+            expense.id,
+            expense.creator_id,
+            expense.date,
+            expense.amount_cents,
+            participant.user_id,
+            participant.share_cents
+        ).\
+        outerjoin(participant, participant.expense_id == expense.id).\
+        filter(expense.date.isnot(None)).\
+        order_by(expense.id).\
+        execution_options(yield_per=BACKFILL_BATCH_SIZE)
+
+        for _, group in groupby(rows, key=lambda row: row[0]):
+            group = list(group)
+            _, creator_id, date, amount_cents, _, _ = group[0]
+            participants = [
+                {'user_id': user_id, 'share_cents': share_cents}
+                for *_, user_id, share_cents in group if user_id is not None
+            ]
+            spending_deltas([Spending(creator_id, date, amount_cents, participants)], totals)
+    return totals
+
+def find_drift():
+    """(user_id, bucket, period_start, stored, expected) for every row that disagrees"""
+    expected = {key: tuple(value) for key, value in compute_rollups().items()}
+    stored = {
+        (row.user_id, row.bucket, row.period_start): (row.paid_cents, row.share_cents, row.expense_count)
+        for row in SpendingRollup.query
+    }
+    return [
+        (*key, stored.get(key), expected.get(key))
+        for key in sorted(set(expected) | set(stored))
+        if stored.get(key) != expected.get(key)
+    ]
+
+def rebuild_rollups():
+    """Replace the rollups with totals recomputed from raw expenses"""
+    rows = rollup_rows(compute_rollups())
+    SpendingRollup.query.delete()
+    for start in range(0, len(rows), BACKFILL_BATCH_SIZE):
+        db.session.execute(insert(SpendingRollup), rows[start:start + BACKFILL_BATCH_SIZE])
+    db.session.commit()
+    return len(rows)
+
+@rollups_cli.command('backfill')
+def backfill_command():
+    """Recompute the spending rollups from raw expenses."""
+    count = rebuild_rollups()
+    click.echo(f'Rebuilt rollups with {count} rows.')
+
+@rollups_cli.command('verify')
+def verify_command():
+    """Report rollup rows that differ from the raw expenses."""
+    drift = find_drift()
+    for user_id, bucket, start, stored, expected in drift:
+        click.echo(f'user {user_id} {bucket} {start}: stored={stored} expected={expected}')
+    if drift:
+        click.echo(f'{len(drift)} row(s) drifted; run "flask rollups backfill" to fix.')
+        raise SystemExit(1)
+    click.echo('Rollups are consistent with expenses.')
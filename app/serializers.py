@@ -0,0 +1,56 @@
+import json
+from flask import Response, jsonify, request
+
+# Both encoders are optional: without orjson JSON falls back to the standard
+# library, and without msgpack the format is simply not offered
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON = 'application/json'
+MSGPACK = 'application/msgpack'
+# Older clients still ask for the pre-registration name
+MSGPACK_ALIASES = (MSGPACK, 'application/x-msgpack')
+
+def encode_json(data):
+    if orjson is not None:
+        # Same key order and trailing newline as jsonify
+        return orjson.dumps(data, option=orjson.OPT_SORT_KEYS | orjson.OPT_APPEND_NEWLINE)
+    # Byte for byte what orjson produces, so ETags do not depend on it
+    return json.dumps(data, separators=(',', ':'), sort_keys=True, ensure_ascii=False).encode('utf-8') + b'\n'
+
+def encode_msgpack(data):
+    return msgpack.packb(data, use_bin_type=True)
+
+def offered_formats():
+    formats = [JSON]
+    if msgpack is not None:
+        formats.extend(MSGPACK_ALIASES)
+    return formats
+
+def negotiate():
+    """The response mimetype the client accepts, or None if none is offered"""
+    if not request.accept_mimetypes:
+        return JSON
+    return request.accept_mimetypes.best_match(offered_formats())
+
+def not_acceptable():
+    response = jsonify({'error': 'Not acceptable', 'formats': offered_formats()})
+    response.status_code = 406
+    return response
+
+def render(data, mimetype, status=200):
+    """Encode plain lists/dicts/scalars as mimetype (from negotiate())"""
+    if mimetype in MSGPACK_ALIASES:
+        body, mimetype = encode_msgpack(data), MSGPACK
+    else:
+        body = encode_json(data)
+    response = Response(body, status=status, mimetype=mimetype)
+    response.vary.add('Accept')
+    return response
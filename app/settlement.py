@@ -0,0 +1,49 @@
+import heapq
+
+def simplify_debts(net_balances):
+    """Compute a near-minimal list of transfers that settles every balance.
+
+    net_balances maps user id to net cents (positive: the user is owed
+    money, negative: the user owes money) and must sum to zero. Greedily
+    matches the largest creditor with the largest debtor using two heaps,
+    which needs at most n - 1 transfers and runs in O(n log n).
+
+    Returns a list of (from_user_id, to_user_id, cents) tuples.
+    """
+    creditors = []
+    debtors = []
+    for user_id, cents in net_balances.items():
+        if cents > 0:
+            creditors.append((-cents, user_id))
+        elif cents < 0:
+            debtors.append((cents, user_id))
+    heapq.heapify(creditors)
+    heapq.heapify(debtors)
+
+    transfers = []
+    while creditors and debtors:
+        credit, creditor_id = heapq.heappop(creditors)
+        debt, debtor_id = heapq.heappop(debtors)
+        paid = min(-credit, -debt)
+        transfers.append((debtor_id, creditor_id, paid))
+
+        # Whoever is not fully settled goes back on their heap
+        if -credit > paid:
+            heapq.heappush(creditors, (credit + paid, creditor_id))
+        if -debt > paid:
+            heapq.heappush(debtors, (debt + paid, debtor_id))
+    return transfers
+
+def pairwise_transfers(pair_balances):
+    """Settle every pairwise balance directly, without simplification.
+
+    pair_balances maps (user_id, counterparty_id) to the cents the
+    counterparty owes user_id, stored in both directions as in the ledger.
+    This is what settling /user/balance one counterparty at a time amounts
+    to; it is kept as the baseline simplify_debts is measured against.
+    """
+    transfers = []
+    for (user_id, counterparty_id), cents in pair_balances.items():
+        if cents > 0:
+            transfers.append((counterparty_id, user_id, cents))
+    return transfers
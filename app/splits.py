@@ -0,0 +1,89 @@
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+# Amounts are stored as integer minor units (cents)
+CENTS = Decimal('0.01')
+# SQLite stores integers as signed 64-bit values
+MAX_CENTS = 2 ** 63 - 1
+
+def to_decimal(value):
+    """Parse a JSON number (or numeric string) exactly, raising ValueError"""
+    if isinstance(value, bool):
+        raise ValueError('Expected a number')
+    try:
+        value = Decimal(str(value))
+    except InvalidOperation:
+        raise ValueError('Expected a number')
+    if not value.is_finite():
+        raise ValueError('Expected a finite number')
+    return value
+
+def to_cents(amount):
+    """Convert a currency amount from a request to integer cents.
+
+    Goes through the decimal string so 0.1 + 0.2 style float error never
+    reaches the database. Raises ValueError for amounts whose cents do not
+    fit in a database integer.
+    """
+    try:
+        cents = int(to_decimal(amount).quantize(CENTS, rounding=ROUND_HALF_UP) * 100)
+    except ArithmeticError:
+        # quantize runs out of precision from 1e26, far past MAX_CENTS
+        raise ValueError('Amount out of range')
+    if abs(cents) > MAX_CENTS:
+        raise ValueError('Amount out of range')
+    return cents
+
+def from_cents(cents):
+    """Convert integer cents back to a currency amount for responses"""
+    return cents / 100
+
+def allocate(total_cents, weights):
+    """Split total_cents in proportion to weights with largest-remainder rounding.
+
+    Every weight becomes an integer on a common scale, so each share is
+    computed with one exact divmod. Shares get the floor of their exact value
+    and the leftover cents go to the largest remainders (earlier participants
+    win ties), so the result always sums to total_cents exactly.
+    """
+    weights = [to_decimal(weight) for weight in weights]
+    if any(weight < 0 for weight in weights):
+        raise ValueError('Weights must not be negative')
+    scale = min(weight.as_tuple().exponent for weight in weights)
+    scaled = [int(weight.scaleb(-scale)) for weight in weights]
+    weight_total = sum(scaled)
+    if weight_total == 0:
+        raise ValueError('Weights must not all be zero')
+
+    shares, remainders = zip(*(divmod(total_cents * weight, weight_total) for weight in scaled))
+    shares = list(shares)
+    leftover = total_cents - sum(shares)
+    for index in sorted(range(len(shares)), key=lambda i: -remainders[i])[:leftover]:
+        shares[index] += 1
+    return shares
+
+def split_cents(participants, split_type, total_cents):
+    """Compute every participant's share in cents for a split type.
+
+    Returns the list of shares in participant order, or None when exact
+    shares or percentages do not add up.
+    """
+    if not participants:
+        return None
+
+    if split_type == 'equal':
+        return allocate(total_cents, [1] * len(participants))
+
+    elif split_type == 'exact':
+        shares = [to_cents(p.get('share_amount', 0)) for p in participants]
+        if sum(shares) != total_cents:
+            return None
+        return shares
+
+    elif split_type == 'percentage':
+        percentages = [to_decimal(p.get('share_percentage', 0)) for p in participants]
+        # Allow small floating-point differences in the percentages
+        if abs(sum(percentages) - 100) > Decimal('0.01'):
+            return None
+        return allocate(total_cents, percentages)
+
+    return None
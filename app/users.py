@@ -1,16 +1,33 @@
-from flask import Blueprint, jsonify, request
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from .models import User, ExpenseParticipant, Expense, db
+from flask import Blueprint, Response, jsonify, request, stream_with_context
+from flask_jwt_extended import jwt_required, get_current_user, get_jwt, get_jwt_identity
+from . import event_broker, identity_cache, response_cache
+from .changes import decode_change_cursor
+from .events import TooManySubscribers
+from .models import User, Balance, RecentContact, db
+from .expenses import parse_date_range
+from .ledger import counterparty_balances_query
+from .rollups import BUCKETS, summary_query
+from .serializers import negotiate, not_acceptable, render
+from .settlement import simplify_debts
+from .splits import from_cents
 from sqlalchemy.exc import IntegrityError
 
 users_bp = Blueprint('users', __name__)
 
+SEARCH_PAGE_SIZE = 10
+MAX_SEARCH_PAGE_SIZE = 50
+SEARCH_CANDIDATES = 1000
+# Sorts after every string starting with a given prefix
+PREFIX_END = chr(0x10FFFF)
+RECENT_CONTACTS_LIMIT = 5
+MAX_GROUP_SIZE = 200
+
 @users_bp.route('/user', methods=['GET'])
 @jwt_required()
 def get_user_details():
     """Get current user's details"""
-    current_user_id = get_jwt_identity()
-    user = User.query.get_or_404(current_user_id)
+    # Resolved from the identity cache when the token was verified
+    user = get_current_user()
     
     return jsonify({
         'id': user.id,
@@ -23,8 +40,7 @@ def get_user_details():
 @jwt_required()
 def update_user_details():
     """Update current user's details"""
-    current_user_id = get_jwt_identity()
-    user = User.query.get_or_404(current_user_id)
+    user = db.session.get(User, get_current_user().id)
     data = request.get_json()
     
     # Fields that are allowed to be updated
@@ -36,6 +52,9 @@ def update_user_details():
                 setattr(user, field, data[field])
         
         db.session.commit()
+        identity_cache.invalidate(user.id)
+        # Names appear in other users' cached listings and balances
+        response_cache.clear()
         return jsonify({
             'message': 'User details updated successfully',
             'user': {
@@ -52,6 +71,45 @@ def update_user_details():
         db.session.rollback()
         return jsonify({'error': 'Failed to update user details'}), 500
 
+def escape_like(value):
+    """Escape LIKE wildcards so user input only matches literally"""
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def search_users_query(query, window=SEARCH_CANDIDATES):
+    """Users matching query, ranked: exact email, then name prefix, then substring.
+
+    window is how many ranked results the caller reads, offset included.
+    Substring candidates come from the user_search FTS5 trigram index (kept
+    in sync with the user table by triggers), so no leading-wildcard scan.
+    Name prefix matches are read in order from ix_user_name_nocase, as many
+    as the window needs.
+    """
+    # A quoted FTS5 string matches the query as a substring of any column.
+    # Very common trigrams can match most users, so only the first
+    # SEARCH_CANDIDATES of them are ranked.
+    match = '"' + query.replace('"', '""') + '"'
+    name = User.name.collate('NOCASE')
+    candidates = User.id.in_(
+        db.select(db.literal_column('rowid')).
+        select_from(db.table('user_search')).
+        where(db.text('user_search MATCH :match').bindparams(match=match)).
+        limit(SEARCH_CANDIDATES)
+    ) | User.id.in_(
+        db.select(User.id).
+        where(name >= query, name < query + PREFIX_END).
+        order_by(name, User.id).
+        limit(window)
+    ) | (User.email == query)
+    
+    rank = db.case(
+        (db.func.lower(User.email) == query.lower(), 0),
+        (User.name.ilike(f'{escape_like(query)}%', escape='\\'), 1),
+        else_=2
+    )
+    return db.session.query(User.id, User.name, User.email).\
+        filter(candidates).\
+        order_by(rank, name, User.id)
+
 @users_bp.route('/users/search', methods=['GET'])
 @jwt_required()
 def search_users():
@@ -60,39 +118,39 @@ def search_users():
     if len(query) < 3:
         return jsonify({'error': 'Search query must be at least 3 characters long'}), 400
     
-    users = User.query.filter(
-        (User.name.ilike(f'%{query}%')) |
-        (User.email.ilike(f'%{query}%'))
-    ).limit(10).all()
+    try:
+        page = int(request.args.get('page', 1))
+        limit = int(request.args.get('limit', SEARCH_PAGE_SIZE))
+    except ValueError:
+        return jsonify({'error': 'Invalid page or limit'}), 400
+    if page < 1 or not 1 <= limit <= MAX_SEARCH_PAGE_SIZE:
+        return jsonify({'error': f'Page must be positive and limit between 1 and {MAX_SEARCH_PAGE_SIZE}'}), 400
+    
+    users = search_users_query(query, page * limit).limit(limit).offset((page - 1) * limit).all()
     
     return jsonify([{
-        'id': user.id,
-        'name': user.name,
-        'email': user.email
-    } for user in users]), 200
+        'id': user_id,
+        'name': name,
+        'email': email
+    } for user_id, name, email in users]), 200
+
+def recent_contacts_query(user_id):
+    """The user's most recent distinct contacts, newest first"""
+    # recent_contact is updated by add_expense, so this is one indexed read
+    return db.session.query(User).\
+        join(RecentContact, RecentContact.contact_id == User.id).\
+        filter(RecentContact.user_id == user_id).\
+        order_by(RecentContact.last_expense_at.desc(), RecentContact.contact_id.desc()).\
+        limit(RECENT_CONTACTS_LIMIT)
 
 @users_bp.route('/users/recent-contacts', methods=['GET'])
 @jwt_required()
+@response_cache.cached
 def get_recent_contacts():
     """Get list of users who shared expenses with current user"""
     current_user_id = get_jwt_identity()
     
-    # Get unique users from recent expenses (limited to last 5 unique contacts)
-    recent_contacts = db.session.query(User).distinct().\
-        join(ExpenseParticipant, User.id == ExpenseParticipant.user_id).\
-        join(Expense).\
-        filter(
-            Expense.id.in_(
-                db.session.query(Expense.id).\
-                join(ExpenseParticipant).\
-                filter(ExpenseParticipant.user_id == current_user_id).\
-                order_by(Expense.date.desc()).\
-                limit(20)
-            ),
-            User.id != current_user_id
-        ).\
-        limit(5).\
-        all()
+    recent_contacts = recent_contacts_query(current_user_id).all()
     
     return jsonify([{
         'id': user.id,
@@ -104,8 +162,7 @@ def get_recent_contacts():
 @jwt_required()
 def change_password():
     """Change user's password"""
-    current_user_id = get_jwt_identity()
-    user = User.query.get_or_404(current_user_id)
+    user = db.session.get(User, get_current_user().id)
     data = request.get_json()
     
     if not all(k in data for k in ['current_password', 'new_password']):
@@ -122,77 +179,252 @@ def change_password():
             'error': 'New password must be at least 8 characters long and contain uppercase, lowercase, numbers, and special characters'
         }), 400
     
+    # Hashing runs outside the try so a saturated hasher answers 503
+    user.set_password(data['new_password'])
     try:
-        user.set_password(data['new_password'])
         db.session.commit()
+        identity_cache.invalidate(user.id)
         return jsonify({'message': 'Password updated successfully'}), 200
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': 'Failed to update password'}), 500
 
+def balance_query(user_id):
+    """The user's ledger rows joined with each counterparty's details"""
+    # Balances are maintained incrementally by add_expense, so this is a
+    # single read of one row per counterparty
+    return db.session.query(User.id, User.name, User.email, Balance.amount_cents).\
+        join(Balance, Balance.counterparty_id == User.id).\
+        filter(Balance.user_id == user_id)
+
 @users_bp.route('/user/balance', methods=['GET'])
 @jwt_required()
+@response_cache.cached
 def get_user_balance():
-    """Get user's overall balance with other users"""
+    """Get user's overall balance with other users, as JSON or MessagePack"""
     current_user_id = get_jwt_identity()
+    mimetype = negotiate()
+    if mimetype is None:
+        return not_acceptable()
     
-    # Calculate amounts owed by others (where current user is creator)
-    owed_by_others = db.session.query(
-        User,
-        db.func.sum(ExpenseParticipant.share_amount).label('amount')
-    ).\
-    select_from(User).\
-    join(ExpenseParticipant, User.id == ExpenseParticipant.user_id).\
-    join(Expense, Expense.id == ExpenseParticipant.expense_id).\
-    filter(
-        Expense.creator_id == current_user_id,
-        ExpenseParticipant.user_id != current_user_id
-    ).\
-    group_by(User.id).all()
-    
-    # Calculate amounts owed to others (where current user is participant)
-    owed_to_others = db.session.query(
-        User,
-        db.func.sum(ExpenseParticipant.share_amount).label('amount')
-    ).\
-    select_from(User).\
-    join(Expense, User.id == Expense.creator_id).\
-    join(ExpenseParticipant, ExpenseParticipant.expense_id == Expense.id).\
-    filter(
-        ExpenseParticipant.user_id == current_user_id,
-        Expense.creator_id != current_user_id
-    ).\
-    group_by(User.id).all()
-    
-    # Compile balances
-    balances = {}
-    
-    # Add amounts owed by others
-    for user, amount in owed_by_others:
-        balances[user.id] = {
-            'user': {
-                'id': user.id,
-                'name': user.name,
-                'email': user.email
-            },
-            'amount': amount or 0
+    rows = balance_query(current_user_id).all()
+    
+    balances = [{
+        'user': {
+            'id': user_id,
+            'name': name,
+            'email': email
+        },
+        'amount': from_cents(amount_cents)
+    } for user_id, name, email, amount_cents in rows]
+    
+    return render({
+        'balances': balances,
+        'total_balance': from_cents(sum(amount_cents for *_, amount_cents in rows))
+    }, mimetype)
+
+@users_bp.route('/user/events', methods=['GET'])
+@jwt_required()
+def stream_user_events():
+    """Push the user's expense and balance events as Server-Sent Events.
+
+    Each new expense involving the user sends an 'expense' event followed
+    by a 'balance' event per counterparty whose balance it moved. Reconnect
+    with the Last-Event-ID header (or 'since') to resume where the stream
+    left off.
+    """
+    current_user_id = int(get_jwt_identity())
+    since = request.headers.get('Last-Event-ID') or request.args.get('since')
+    if since:
+        since = decode_change_cursor(since)
+        if since is None:
+            return jsonify({'error': 'Invalid event id'}), 400
+    else:
+        since = event_broker.latest(current_user_id)
+    
+    try:
+        stream = event_broker.stream(current_user_id, since, get_jwt()['exp'])
+    except TooManySubscribers:
+        response = jsonify({'error': 'Too many open event streams, please retry shortly'})
+        response.headers['Retry-After'] = '5'
+        return response, 503
+    
+    return Response(stream_with_context(stream), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        # Keep proxies such as nginx from buffering the stream
+        'X-Accel-Buffering': 'no'
+    })
+
+@users_bp.route('/user/summary', methods=['GET'])
+@jwt_required()
+@response_cache.cached
+def get_spending_summary():
+    """Get the user's spending per day or month.
+
+    Answered from the rollups, so the cost depends on the number of buckets
+    returned rather than the number of expenses. Month buckets cover whole
+    months, so 'from' is rounded down to the start of its month.
+    """
+    current_user_id = int(get_jwt_identity())
+    bucket = request.args.get('bucket', 'month')
+    if bucket not in BUCKETS:
+        return jsonify({'error': 'bucket must be day or month'}), 400
+    
+    try:
+        start, end = parse_date_range(request.args)
+    except ValueError:
+        return jsonify({'error': 'Dates must use the YYYY-MM-DD format'}), 400
+    
+    rows = summary_query(
+        current_user_id,
+        bucket,
+        start.date() if start else None,
+        end.date() if end else None
+    ).all()
+    
+    def totals(paid_cents, share_cents, expense_count):
+        return {
+            'paid': from_cents(paid_cents),
+            'share': from_cents(share_cents),
+            'net': from_cents(paid_cents - share_cents),
+            'expense_count': expense_count
         }
     
-    # Subtract amounts owed to others
-    for user, amount in owed_to_others:
-        if user.id in balances:
-            balances[user.id]['amount'] -= (amount or 0)
-        else:
-            balances[user.id] = {
-                'user': {
-                    'id': user.id,
-                    'name': user.name,
-                    'email': user.email
-                },
-                'amount': -(amount or 0)
-            }
+    return jsonify({
+        'bucket': bucket,
+        'periods': [
+            {'period': period.isoformat(), **totals(paid_cents, share_cents, expense_count)}
+            for period, paid_cents, share_cents, expense_count in rows
+        ],
+        'total': totals(
+            sum(row[1] for row in rows),
+            sum(row[2] for row in rows),
+            sum(row[3] for row in rows)
+        )
+    }), 200
+
+def group_balances(current_user_id):
+    """The current user's balances with a request's group.
+
+    Returns ({counterparty_id: cents}, next cursor, None), positive cents
+    meaning the counterparty owes the current user, or (None, None, error
+    response). 'user_ids' names the group, at most MAX_GROUP_SIZE members
+    counting the current user, all of whom they must share expenses with.
+    Without it the group is everyone they share expenses with, read
+    MAX_GROUP_SIZE members at a time: the next cursor, when there is one,
+    goes back as 'cursor' for the next page. Only the user's own ledger
+    rows are read, so what other members owe each other stays private.
+    """
+    if request.args.get('user_ids'):
+        try:
+            counterparty_ids = {int(user_id) for user_id in request.args['user_ids'].split(',')}
+        except ValueError:
+            return None, None, (jsonify({'error': 'user_ids must be a comma-separated list of ids'}), 400)
+        counterparty_ids.discard(current_user_id)
+        if len(counterparty_ids) >= MAX_GROUP_SIZE:
+            return None, None, (jsonify({'error': f'A group may have at most {MAX_GROUP_SIZE} users'}), 400)
+        balances = dict(counterparty_balances_query(current_user_id, counterparty_ids))
+        if not counterparty_ids <= balances.keys():
+            return None, None, (jsonify({'error': 'Group may only include users you share expenses with'}), 403)
+        return balances, None, None
+    
+    after = None
+    if request.args.get('cursor'):
+        try:
+            after = int(request.args['cursor'])
+        except ValueError:
+            return None, None, (jsonify({'error': 'Invalid cursor'}), 400)
+    # The current user takes one of the page's places
+    page_size = MAX_GROUP_SIZE - 1
+    rows = counterparty_balances_query(current_user_id, after=after).limit(page_size + 1).all()
+    next_cursor = str(rows[page_size - 1][0]) if len(rows) > page_size else None
+    return dict(rows[:page_size]), next_cursor, None
+
+def star_net_balances(current_user_id, balances):
+    """Net cents of the current user and each counterparty over the user's
+    own balances, as simplify_debts expects them"""
+    net = {counterparty_id: -cents for counterparty_id, cents in balances.items()}
+    net[current_user_id] = sum(balances.values())
+    return net
+
+def next_cursor_header(next_cursor):
+    return {'X-Next-Cursor': next_cursor} if next_cursor else {}
+
+@users_bp.route('/users/settlement', methods=['GET'])
+@jwt_required()
+def get_settlement_plan():
+    """Get a minimal set of transfers that settles the user's balances with a group.
+
+    The group and its pages are as for group_balances. Only the current
+    user's own balances are settled. A transfer between two other members
+    stands for what one owes the user and the user owes the other; it
+    never reflects what those members owe each other.
+    """
+    current_user_id = int(get_jwt_identity())
+    balances, next_cursor, error = group_balances(current_user_id)
+    if error:
+        return error
+    
+    transfers = simplify_debts(star_net_balances(current_user_id, balances))
+    
+    involved = {user_id for transfer in transfers for user_id in transfer[:2]}
+    names = dict(db.session.query(User.id, User.name).filter(User.id.in_(involved)))
     
     return jsonify({
-        'balances': list(balances.values()),
-        'total_balance': sum(b['amount'] for b in balances.values())
-    }), 200
\ No newline at end of file
+        'transfers': [{
+            'from': {'id': from_id, 'name': names.get(from_id)},
+            'to': {'id': to_id, 'name': names.get(to_id)},
+            'amount': from_cents(cents)
+        } for from_id, to_id, cents in transfers],
+        'transfer_count': len(transfers)
+    }), 200, next_cursor_header(next_cursor)
+
+@users_bp.route('/users/balances', methods=['GET'])
+@jwt_required()
+def get_group_balances():
+    """Get the user's balances with a group's members in one request.
+
+    Takes 'user_ids' and 'cursor' like /users/settlement.
+    Returns the member ids, the current user's included, in ascending order
+    with each member's net balance over the pairs shown, plus those pairs as
+    an edge list of what each debtor owes each creditor or, with
+    'shape=matrix', a matrix where row i, column j is what users[j] owes
+    users[i]. Only pairs that include the current user are shown; what
+    other members owe each other stays private to them.
+    """
+    mimetype = negotiate()
+    if mimetype is None:
+        return not_acceptable()
+    shape = request.args.get('shape', 'edges')
+    if shape not in ('edges', 'matrix'):
+        return jsonify({'error': 'shape must be edges or matrix'}), 400
+    
+    current_user_id = int(get_jwt_identity())
+    balances, next_cursor, error = group_balances(current_user_id)
+    if error:
+        return error
+    
+    users = sorted(set(balances) | {current_user_id})
+    net = star_net_balances(current_user_id, balances)
+    result = {'users': users, 'net': [from_cents(net[user_id]) for user_id in users]}
+    
+    pairs = [(counterparty_id, cents) for counterparty_id, cents in balances.items() if cents]
+    if shape == 'matrix':
+        index = {user_id: i for i, user_id in enumerate(users)}
+        matrix = [[0] * len(users) for _ in users]
+        i = index[current_user_id]
+        for counterparty_id, cents in pairs:
+            j = index[counterparty_id]
+            matrix[i][j] = from_cents(cents)
+            matrix[j][i] = from_cents(-cents)
+        result['matrix'] = matrix
+    else:
+        result['edges'] = [{
+            'debtor': counterparty_id if cents > 0 else current_user_id,
+            'creditor': current_user_id if cents > 0 else counterparty_id,
+            'amount': from_cents(abs(cents))
+        } for counterparty_id, cents in pairs]
+    
+    response = render(result, mimetype)
+    response.headers.update(next_cursor_header(next_cursor))
+    return response
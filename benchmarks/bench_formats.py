@@ -0,0 +1,91 @@
+"""Compare payload size and encode time of the expense and balance response formats.
+
+Usage: python benchmarks/bench_formats.py [--users 300] [--expenses 20000] [--pages 50]
+
+Seeds a temporary database with datagen.py, fetches full pages of
+/expenses/user and /user/balance for many users, then encodes the same data
+with jsonify (the previous output), the fast JSON encoder and MessagePack.
+Also times whole requests per Accept header, which includes the switch from
+ORM objects to row tuples. MessagePack is skipped when msgpack is not
+installed.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from datagen import seed
+from app import create_app
+from app import serializers
+
+def timed(fn, payloads, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for payload in payloads:
+            fn(payload)
+    return (time.perf_counter() - started) / (repeat * len(payloads))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=300)
+    parser.add_argument('--expenses', type=int, default=20000)
+    parser.add_argument('--pages', type=int, default=50, help='users whose pages are encoded')
+    parser.add_argument('--limit', type=int, default=200, help='expenses per page')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}',
+        'BCRYPT_LOG_ROUNDS': 4,
+        'RESPONSE_CACHE_ENABLED': False,
+    })
+    print(f'Seeding {args.users} users and {args.expenses} expenses...', file=sys.stderr)
+    seed(app, args.users, args.expenses)
+
+    from flask_jwt_extended import create_access_token
+    with app.app_context():
+        headers = [{'Authorization': f'Bearer {create_access_token(identity=str(user_id))}'}
+                   for user_id in range(1, args.pages + 1)]
+
+    client = app.test_client()
+    endpoints = {
+        'expenses': f'/expenses/user?limit={args.limit}',
+        'balance': '/user/balance',
+    }
+    encoders = [('jsonify', lambda data: app.json.response(data).get_data()),
+                ('fast json', serializers.encode_json)]
+    if serializers.msgpack is not None:
+        encoders.append(('msgpack', serializers.encode_msgpack))
+    else:
+        print('msgpack is not installed; skipping MessagePack', file=sys.stderr)
+
+    print(f'fast json encoder: {"orjson" if serializers.orjson else "json (orjson not installed)"}')
+    print(f'\n{"payload":<10}{"format":<11}{"avg bytes":>11}{"encode us":>11}')
+    with app.app_context():
+        for name, path in endpoints.items():
+            payloads = [json.loads(client.get(path, headers=h).data) for h in headers]
+            for label, encode in encoders:
+                size = sum(len(encode(p)) for p in payloads) / len(payloads)
+                seconds = timed(encode, payloads, args.repeat)
+                print(f'{name:<10}{label:<11}{size:>11.0f}{seconds * 1e6:>11.1f}')
+
+    accepts = ['application/json']
+    if serializers.msgpack is not None:
+        accepts.append('application/msgpack')
+    print(f'\n{"request":<10}{"accept":<22}{"ms/request":>11}')
+    for name, path in endpoints.items():
+        for accept in accepts:
+            started = time.perf_counter()
+            for _ in range(max(1, args.repeat // 4)):
+                for h in headers:
+                    client.get(path, headers={**h, 'Accept': accept})
+            elapsed = (time.perf_counter() - started) / (max(1, args.repeat // 4) * len(headers))
+            print(f'{name:<10}{accept:<22}{elapsed * 1000:>11.2f}')
+
+if __name__ == '__main__':
+    main()
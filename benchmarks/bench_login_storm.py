@@ -0,0 +1,108 @@
+"""Measure login throughput and the latency of a cheap endpoint during a login storm.
+
+Usage: python benchmarks/bench_login_storm.py [--login-threads 16] [--hash-workers 2]
+
+Logins hammer POST /login while other threads poll GET /user. Compare runs
+with different --hash-workers / --hash-queue values: a bounded hasher keeps
+GET /user latency flat and sheds excess logins with fast 503s.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+
+PASSWORD = 'Storm-Passw0rd!'
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--login-threads', type=int, default=16)
+    parser.add_argument('--reader-threads', type=int, default=4)
+    parser.add_argument('--hash-workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--hash-queue', type=int, default=None)
+    parser.add_argument('--rounds', type=int, default=10, help='bcrypt work factor')
+    parser.add_argument('--backoff', type=float, default=0.1,
+                        help='seconds a client waits after a 503 before retrying')
+    args = parser.parse_args()
+
+    db_file = tempfile.NamedTemporaryFile(suffix='.db', delete=False)
+    db_file.close()
+    config = {
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{db_file.name}',
+        'BCRYPT_LOG_ROUNDS': args.rounds,
+        'PASSWORD_HASH_WORKERS': args.hash_workers,
+    }
+    if args.hash_queue is not None:
+        config['PASSWORD_HASH_QUEUE'] = args.hash_queue
+    app = create_app(config)
+
+    client = app.test_client()
+    response = client.post('/register', json={
+        'email': 'storm@example.com',
+        'name': 'Storm',
+        'mobile': '5550001111',
+        'password': PASSWORD
+    })
+    headers = {'Authorization': f'Bearer {response.get_json()["access_token"]}'}
+
+    stop = time.monotonic() + args.duration
+    lock = threading.Lock()
+    logins = {'ok': 0, 'busy': 0, 'other': 0}
+    login_latency = []
+    reader_latency = []
+
+    def login_worker():
+        client = app.test_client()
+        while time.monotonic() < stop:
+            start = time.perf_counter()
+            status = client.post('/login', json={
+                'email': 'storm@example.com',
+                'password': PASSWORD
+            }).status_code
+            elapsed = (time.perf_counter() - start) * 1000
+            key = 'ok' if status == 200 else 'busy' if status == 503 else 'other'
+            with lock:
+                logins[key] += 1
+                login_latency.append(elapsed)
+            if status == 503:
+                time.sleep(args.backoff)
+
+    def reader_worker():
+        client = app.test_client()
+        while time.monotonic() < stop:
+            start = time.perf_counter()
+            client.get('/user', headers=headers)
+            with lock:
+                reader_latency.append((time.perf_counter() - start) * 1000)
+
+    threads = [threading.Thread(target=login_worker) for _ in range(args.login_threads)]
+    threads += [threading.Thread(target=reader_worker) for _ in range(args.reader_threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    os.unlink(db_file.name)
+
+    print(f'hash workers={args.hash_workers} login threads={args.login_threads} rounds={args.rounds}')
+    print(f'logins: {logins["ok"] / args.duration:.1f}/s ok, '
+          f'{logins["busy"]} shed with 503, {logins["other"]} other')
+    print(f'login latency ms: p50={percentile(login_latency, 50):.1f} '
+          f'p99={percentile(login_latency, 99):.1f}')
+    print(f'GET /user latency ms: p50={percentile(reader_latency, 50):.1f} '
+          f'p95={percentile(reader_latency, 95):.1f} p99={percentile(reader_latency, 99):.1f} '
+          f'({len(reader_latency)} requests)')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""Compare debt simplification against settling pairwise balances directly.
+
+Usage: python benchmarks/bench_settlement.py [--users 5000] [--contacts 20]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.settlement import pairwise_transfers, simplify_debts
+
+def random_ledger(users, contacts, seed):
+    """Build ledger-style pair balances in cents (both directions) for a random group"""
+    rng = random.Random(seed)
+    pairs = defaultdict(int)
+    for user_id in range(users):
+        for counterparty_id in rng.sample(range(users), min(contacts, users)):
+            if counterparty_id == user_id:
+                continue
+            amount = rng.randint(1, 50000)
+            pairs[(user_id, counterparty_id)] += amount
+            pairs[(counterparty_id, user_id)] -= amount
+    return pairs
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, (time.perf_counter() - start) * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=5000)
+    parser.add_argument('--contacts', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    pairs = random_ledger(args.users, args.contacts, args.seed)
+    net = defaultdict(int)
+    for (user_id, _), amount in pairs.items():
+        net[user_id] += amount
+
+    naive, naive_ms = timed(pairwise_transfers, pairs)
+    simplified, simplified_ms = timed(simplify_debts, net)
+
+    print(f'users={args.users} pair balances={len(pairs) // 2}')
+    print(f'pairwise:   {len(naive):>8} transfers  {naive_ms:8.1f} ms')
+    print(f'simplified: {len(simplified):>8} transfers  {simplified_ms:8.1f} ms')
+
+if __name__ == '__main__':
+    main()
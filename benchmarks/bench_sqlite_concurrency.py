@@ -0,0 +1,121 @@
+"""Compare concurrent read/write throughput with and without the SQLite tuning.
+
+Usage: python benchmarks/bench_sqlite_concurrency.py [--writers 4] [--readers 8] [--hold-ms 200]
+
+Writer threads create expenses while reader threads poll /expenses/user and
+/user/balance against a file database, with the response cache off so every
+read queries it. The run is repeated with SQLITE_TUNING off (rollback
+journal, default pragmas) and on (WAL, synchronous=NORMAL, mmap and cache
+size), the latter once with busy_timeout 0 and once with the default.
+
+Then everything runs again while another connection keeps taking the write
+lock for --hold-ms at a time, like an archive run or a large import: with
+the rollback journal readers wait for it too, and without busy_timeout
+writers fail with "database is locked" instead of waiting. With tuning off
+pysqlite's own 5 s timeout still applies.
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app
+
+def hold_write_lock(path, stop, args):
+    """Keep taking the database's write lock for --hold-ms at a time"""
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+    conn.execute('CREATE TABLE IF NOT EXISTS bench_lock (id INTEGER PRIMARY KEY, at REAL)')
+    while time.monotonic() < stop:
+        conn.execute('BEGIN EXCLUSIVE')
+        conn.execute('INSERT INTO bench_lock (at) VALUES (?)', (time.time(),))
+        time.sleep(args.hold_ms / 1000)
+        conn.execute('COMMIT')
+        time.sleep(args.release_ms / 1000)
+    conn.close()
+
+def run(label, args, contention=False, **config):
+    workdir = tempfile.mkdtemp()
+    path = os.path.join(workdir, 'bench.db')
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}',
+        'BCRYPT_LOG_ROUNDS': 4,
+        'RESPONSE_CACHE_ENABLED': False,
+        'METRICS_ENABLED': False,
+        **config
+    })
+    client = app.test_client()
+    headers = []
+    for i in range(args.users):
+        response = client.post('/register', json={
+            'email': f'bench{i}@example.com',
+            'name': f'Bench {i}',
+            'mobile': f'555{i:07d}',
+            'password': 'Bench-Passw0rd!'
+        })
+        headers.append({'Authorization': f'Bearer {response.get_json()["access_token"]}'})
+
+    stop = time.monotonic() + args.duration
+    lock = threading.Lock()
+    counts = {'writes': 0, 'write_errors': 0, 'reads': 0, 'read_errors': 0}
+
+    def writer(n):
+        client = app.test_client()
+        while time.monotonic() < stop:
+            status = client.post('/expense', headers=headers[n % args.users], json={
+                'description': 'Bench',
+                'amount': 30,
+                'split_type': 'equal',
+                'participants': [{'user_id': u + 1} for u in range(min(3, args.users))]
+            }).status_code
+            with lock:
+                counts['writes' if status == 201 else 'write_errors'] += 1
+
+    def reader(n):
+        client = app.test_client()
+        paths = ['/expenses/user', '/user/balance']
+        i = 0
+        while time.monotonic() < stop:
+            status = client.get(paths[i % 2], headers=headers[n % args.users]).status_code
+            i += 1
+            with lock:
+                counts['reads' if status == 200 else 'read_errors'] += 1
+
+    threads = [threading.Thread(target=writer, args=(n,)) for n in range(args.writers)]
+    threads += [threading.Thread(target=reader, args=(n,)) for n in range(args.readers)]
+    if contention:
+        threads.append(threading.Thread(target=hold_write_lock, args=(path, stop, args)))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    print(f'{label:<22} writes/s={counts["writes"] / args.duration:8.1f} '
+          f'reads/s={counts["reads"] / args.duration:8.1f} '
+          f'write errors={counts["write_errors"]:5d} read errors={counts["read_errors"]:5d}')
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--users', type=int, default=5)
+    parser.add_argument('--hold-ms', type=float, default=200,
+                        help='How long the contending connection holds the write lock')
+    parser.add_argument('--release-ms', type=float, default=50,
+                        help='Pause between its write transactions')
+    args = parser.parse_args()
+
+    for contention in (False, True):
+        print(f'With a connection holding the write lock for {args.hold_ms:g} ms at a time:'
+              if contention else 'Without other connections:')
+        run('default', args, contention, SQLITE_TUNING=False)
+        run('tuned, busy_timeout=0', args, contention, SQLITE_TUNING=True, SQLITE_BUSY_TIMEOUT_MS=0)
+        run('tuned', args, contention, SQLITE_TUNING=True)
+
+if __name__ == '__main__':
+    main()
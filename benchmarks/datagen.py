@@ -0,0 +1,204 @@
+"""Seed a database with synthetic users and expenses for benchmarks.
+
+Usage: python benchmarks/datagen.py --db bench.db [--users 1000] [--expenses 20000] [--seed 1]
+
+Users belong to a few overlapping friend groups (couples, flatmates, trips)
+and most expenses are split inside one of the creator's groups, so balances
+and contacts look like real usage rather than a uniform random mesh. Activity
+is skewed: a minority of users create most expenses, a few expenses are large
+events, and split types and amounts follow a rough real-world mix.
+
+Expenses go through the same batch insert as POST /expenses/bulk, so the
+ledger, contacts and every other derived table are populated. The same
+--seed and --users always produce the same users and groups; harness.py
+relies on that to generate realistic new expenses against a seeded database.
+"""
+import argparse
+import datetime
+import math
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import insert
+from app.splits import allocate
+
+PASSWORD = 'Bench-Passw0rd!'
+
+# (weight, smallest, largest) friend group sizes
+GROUP_SIZES = [(45, 2, 2), (35, 3, 5), (15, 6, 10), (5, 11, 25)]
+SPLIT_TYPES = [('equal', 70), ('exact', 20), ('percentage', 10)]
+DESCRIPTIONS = ['Groceries', 'Dinner', 'Rent', 'Utilities', 'Taxi', 'Coffee',
+                'Movie tickets', 'Hotel', 'Flights', 'Concert', 'Gas', 'Drinks']
+# Share of expenses that are one-off events with people outside any group
+EVENT_RATE = 0.01
+EVENT_SIZE = (15, 60)
+
+def user_email(index):
+    return f'bench{index}@example.com'
+
+def user_row(index, password_hash):
+    return {
+        'email': user_email(index),
+        'name': f'Bench User {index}',
+        'mobile': f'+1555{index:07d}',
+        'password_hash': password_hash
+    }
+
+class Population:
+    """Friend groups and activity weights for user ids 1..users"""
+
+    def __init__(self, users, seed=1):
+        if users < 2:
+            raise ValueError('Need at least two users')
+        self.users = users
+        rng = random.Random(seed)
+
+        self.groups = []
+        self.groups_by_user = {user_id: [] for user_id in range(1, users + 1)}
+        # Everyone joins about two groups on average
+        while sum(len(group) for group in self.groups) < users * 2:
+            _, low, high = rng.choices(GROUP_SIZES, [w for w, _, _ in GROUP_SIZES])[0]
+            size = min(users, rng.randint(low, high))
+            group = rng.sample(range(1, users + 1), size)
+            for user_id in group:
+                self.groups_by_user[user_id].append(len(self.groups))
+            self.groups.append(group)
+        for user_id, groups in self.groups_by_user.items():
+            if not groups:
+                partner = rng.choice([u for u in (user_id - 1, user_id + 1) if 1 <= u <= users])
+                groups.append(len(self.groups))
+                self.groups_by_user[partner].append(len(self.groups))
+                self.groups.append([user_id, partner])
+
+        # Zipf-like activity: a few heavy users create most expenses
+        order = list(range(1, users + 1))
+        rng.shuffle(order)
+        self.creators = order
+        self.creator_weights = [1 / (rank + 1) ** 0.8 for rank in range(users)]
+
+    def expense(self, rng, creator_id=None, date=None):
+        """Return (creator_id, payload) for a realistic POST /expense body"""
+        if creator_id is None:
+            creator_id = rng.choices(self.creators, self.creator_weights)[0]
+
+        if rng.random() < EVENT_RATE:
+            size = min(self.users, rng.randint(*EVENT_SIZE))
+            members = set(rng.sample(range(1, self.users + 1), size))
+        else:
+            group = self.groups[rng.choice(self.groups_by_user[creator_id])]
+            # Small splits are far more common than whole-group ones
+            size = min(len(group), 2 + int(rng.expovariate(0.7)))
+            members = set(rng.sample(group, size))
+        # Usually the creator shares the expense, sometimes pays for others
+        if rng.random() < 0.9:
+            members.add(creator_id)
+        else:
+            members.discard(creator_id)
+        if not members:
+            members = {creator_id}
+        participants = [{'user_id': user_id} for user_id in sorted(members)]
+
+        # Log-normal amounts around 25.00, capped at 5000.00
+        cents = max(100, min(500000, int(math.exp(rng.gauss(math.log(2500), 1.0)))))
+        split_type = rng.choices([s for s, _ in SPLIT_TYPES], [w for _, w in SPLIT_TYPES])[0]
+        if split_type == 'exact':
+            weights = [rng.randint(1, 10) for _ in participants]
+            shares = allocate(cents, weights)
+            for participant, share in zip(participants, shares):
+                participant['share_amount'] = share / 100
+        elif split_type == 'percentage':
+            # Whole percentages so they always add up to exactly 100
+            percentages = allocate(100, [rng.randint(1, 10) for _ in participants])
+            if 0 in percentages:
+                split_type = 'equal'
+            else:
+                for participant, percentage in zip(participants, percentages):
+                    participant['share_percentage'] = percentage
+
+        payload = {
+            'description': rng.choice(DESCRIPTIONS),
+            'amount': cents / 100,
+            'split_type': split_type,
+            'participants': participants
+        }
+        if date is not None:
+            payload['date'] = date.isoformat()
+        return creator_id, payload
+
+def seed(app, users, expenses, seed=1, days=365, batch_size=2000, progress=None):
+    """Insert users 1..users and expenses spread over the last days days.
+
+    Expects an empty database. Returns the Population used, for callers that
+    generate more expenses later.
+    """
+    from app import bcrypt, db
+    from app.expenses import check_expense, insert_expense_batch
+    from app.models import User
+
+    population = Population(users, seed)
+    rng = random.Random(seed + 1)
+    with app.app_context():
+        # One hash for everyone: hashing each password would dominate seeding
+        password_hash = bcrypt.generate_password_hash(PASSWORD).decode('utf-8')
+        for start in range(1, users + 1, batch_size):
+            db.session.execute(insert(User), [
+                user_row(index, password_hash)
+                for index in range(start, min(users, start + batch_size - 1) + 1)
+            ])
+            db.session.commit()
+
+        now = datetime.datetime.utcnow()
+        # Spread evenly over the period, oldest first, like real history
+        step = datetime.timedelta(days=days) / max(expenses, 1)
+        done = 0
+        while done < expenses:
+            by_creator = {}
+            for n in range(done, min(expenses, done + batch_size)):
+                date = now - datetime.timedelta(days=days) + step * n
+                creator_id, payload = population.expense(rng)
+                participants, error = check_expense(payload)
+                if error:
+                    raise AssertionError(f'Generated an invalid expense: {error}')
+                payload['date'] = date
+                by_creator.setdefault(creator_id, []).append((n, payload, participants))
+            for creator_id, batch in by_creator.items():
+                insert_expense_batch(creator_id, batch)
+            done = min(expenses, done + batch_size)
+            if progress:
+                progress(done, expenses)
+    return population
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--db', required=True, help='SQLite file to create')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--expenses', type=int, default=20000)
+    parser.add_argument('--days', type=int, default=365, help='history length')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--rounds', type=int, default=4, help='bcrypt work factor of the seeded passwords')
+    args = parser.parse_args()
+
+    path = os.path.abspath(args.db)
+    if os.path.exists(path):
+        parser.error(f'{path} already exists')
+
+    from app import create_app
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}',
+        'BCRYPT_LOG_ROUNDS': args.rounds,
+    })
+
+    started = time.perf_counter()
+    def progress(done, total):
+        print(f'\r{done}/{total} expenses', end='', file=sys.stderr, flush=True)
+    seed(app, args.users, args.expenses, args.seed, args.days, progress=progress)
+    print(file=sys.stderr)
+    print(f'Seeded {args.users} users and {args.expenses} expenses into {path} '
+          f'in {time.perf_counter() - started:.1f}s; password for every user: {PASSWORD}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,390 @@
+"""Drive every API endpoint and report throughput and latency percentiles.
+
+Usage:
+    python benchmarks/harness.py [--db bench.db] [--out results.json] [--compare baseline.json]
+    python benchmarks/harness.py --url http://localhost:5000 --users 1000 --seed 1
+
+By default the app runs in-process through the Flask test client, on a
+database seeded by datagen.py (--db, or a fresh temporary one seeded with
+--users/--expenses). With --url the requests go over HTTP to a running
+server whose database was seeded by datagen.py with the same --users and
+--seed.
+
+Each scenario runs for --duration seconds on --concurrency threads, using
+sessions of --sessions different users so per-user caches see a realistic
+mix. Results are written as JSON; --compare prints the change against an
+earlier run.
+"""
+import argparse
+import datetime
+import itertools
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from datagen import PASSWORD, Population, seed, user_email
+
+ALT_PASSWORD = 'Bench-Passw0rd?'
+
+class TestClient:
+    """Requests through app.test_client()"""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, headers=None, json=None, data=None):
+        response = self.client.open(path, method=method, headers=headers, json=json, data=data)
+        return response.status_code, response.data
+
+def encode_json(value):
+    return json.dumps(value).encode()
+
+class HTTPClient:
+    """Requests to a running server"""
+
+    def __init__(self, url):
+        self.url = url.rstrip('/')
+
+    def request(self, method, path, headers=None, json=None, data=None):
+        headers = dict(headers or {})
+        if json is not None:
+            data = encode_json(json)
+            headers['Content-Type'] = 'application/json'
+        elif isinstance(data, str):
+            data = data.encode()
+        request = urllib.request.Request(self.url + path, data=data, headers=headers, method=method)
+        try:
+            with urllib.request.urlopen(request) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as error:
+            return error.code, error.read()
+
+class Session:
+    def __init__(self, client, user_id, email, token):
+        self.client = client
+        self.user_id = user_id
+        self.email = email
+        self.headers = {'Authorization': f'Bearer {token}'}
+        self.password = PASSWORD
+
+def login(client, email, password=PASSWORD):
+    status, body = client.request('POST', '/login', json={'email': email, 'password': password})
+    if status != 200:
+        raise RuntimeError(f'Login as {email} failed ({status}): {body[:200]!r}')
+    return json.loads(body)['access_token']
+
+def open_session(client, email):
+    token = login(client, email)
+    headers = {'Authorization': f'Bearer {token}'}
+    status, body = client.request('GET', '/user', headers=headers)
+    if status != 200:
+        raise RuntimeError(f'GET /user failed ({status}): {body[:200]!r}')
+    return Session(client, json.loads(body)['id'], email, token)
+
+# Scenarios: name -> function(context, worker) returning the timed request as
+# (method, path, kwargs). Untimed setup a request needs happens inside the
+# function before it returns.
+
+def scenario(name, blueprint):
+    def register(fn):
+        SCENARIOS[name] = (blueprint, fn)
+        return fn
+    return register
+
+SCENARIOS = {}
+_unique = itertools.count()
+
+@scenario('register', 'auth')
+def register(ctx, worker):
+    n = next(_unique)
+    tag = f'{ctx.run_id}{n}'
+    return 'POST', '/register', {'json': {
+        'email': f'new{tag}@example.com',
+        'name': f'New User {n}',
+        'mobile': f'+9{int(tag) % 10 ** 12:012d}',
+        'password': PASSWORD
+    }}
+
+@scenario('login', 'auth')
+def login_scenario(ctx, worker):
+    session = ctx.pick()
+    return 'POST', '/login', {'json': {'email': session.email, 'password': session.password}}
+
+@scenario('logout', 'auth')
+def logout(ctx, worker):
+    # Every logout revokes its token, so each one needs a fresh login
+    session = worker.session
+    token = login(session.client, session.email, session.password)
+    return 'POST', '/logout', {'headers': {'Authorization': f'Bearer {token}'}}
+
+@scenario('add_expense', 'expenses')
+def add_expense(ctx, worker):
+    session = ctx.pick()
+    _, payload = ctx.population.expense(worker.rng, creator_id=session.user_id)
+    return 'POST', '/expense', {'headers': session.headers, 'json': payload}
+
+@scenario('add_expenses_bulk', 'expenses')
+def add_expenses_bulk(ctx, worker):
+    session = ctx.pick()
+    items = [ctx.population.expense(worker.rng, creator_id=session.user_id)[1]
+             for _ in range(ctx.args.bulk_items)]
+    return 'POST', '/expenses/bulk', {'headers': session.headers, 'json': items}
+
+@scenario('list_expenses', 'expenses')
+def list_expenses(ctx, worker):
+    return 'GET', '/expenses/user', {'headers': ctx.pick().headers}
+
+@scenario('expense_changes', 'expenses')
+def expense_changes(ctx, worker):
+    # A first sync page; later pages cost the same, bounded by the limit
+    return 'GET', '/expenses/changes?limit=50', {'headers': ctx.pick().headers}
+
+@scenario('balance_sheet_json', 'expenses')
+def balance_sheet_json(ctx, worker):
+    return 'GET', '/balance-sheet/download', {'headers': ctx.pick().headers}
+
+@scenario('balance_sheet_csv', 'expenses')
+def balance_sheet_csv(ctx, worker):
+    return 'GET', '/balance-sheet/download?format=csv', {'headers': ctx.pick().headers}
+
+@scenario('get_user', 'users')
+def get_user(ctx, worker):
+    return 'GET', '/user', {'headers': ctx.pick().headers}
+
+@scenario('update_user', 'users')
+def update_user(ctx, worker):
+    session = ctx.pick()
+    return 'PUT', '/user', {'headers': session.headers,
+                            'json': {'name': f'Bench User {session.user_id}'}}
+
+@scenario('change_password', 'users')
+def change_password(ctx, worker):
+    # Each worker owns its session, so the password toggles without races
+    session = worker.session
+    new = ALT_PASSWORD if session.password == PASSWORD else PASSWORD
+    current, session.password = session.password, new
+    return 'PUT', '/user/change-password', {'headers': session.headers, 'json': {
+        'current_password': current,
+        'new_password': new
+    }}
+
+@scenario('search_users', 'users')
+def search_users(ctx, worker):
+    term = worker.rng.choice(['bench', 'User 1', 'ser 4', f'bench{worker.rng.randint(1, ctx.users)}@'])
+    return 'GET', f'/users/search?q={urllib.request.quote(term)}', {'headers': ctx.pick().headers}
+
+@scenario('recent_contacts', 'users')
+def recent_contacts(ctx, worker):
+    return 'GET', '/users/recent-contacts', {'headers': ctx.pick().headers}
+
+@scenario('balance', 'users')
+def balance(ctx, worker):
+    return 'GET', '/user/balance', {'headers': ctx.pick().headers}
+
+@scenario('summary', 'users')
+def summary(ctx, worker):
+    bucket = worker.rng.choice(['day', 'month'])
+    return 'GET', f'/user/summary?bucket={bucket}', {'headers': ctx.pick().headers}
+
+@scenario('group_balances', 'users')
+def group_balances(ctx, worker):
+    shape = worker.rng.choice(['edges', 'matrix'])
+    return 'GET', f'/users/balances?shape={shape}', {'headers': ctx.pick().headers}
+
+@scenario('settlement', 'users')
+def settlement(ctx, worker):
+    return 'GET', '/users/settlement', {'headers': ctx.pick().headers}
+
+class Context:
+    def __init__(self, args, make_client, population, sessions):
+        self.args = args
+        self.make_client = make_client
+        self.population = population
+        self.users = population.users
+        self.sessions = sessions
+        # Keeps registered emails and mobiles unique across runs on one database
+        self.run_id = int(time.time()) % 10 ** 6
+        self._rng = random.Random(args.seed)
+        self._lock = threading.Lock()
+
+    def pick(self):
+        with self._lock:
+            return self._rng.choice(self.sessions)
+
+class Worker:
+    def __init__(self, ctx, index):
+        self.rng = random.Random(ctx.args.seed * 1000 + index)
+        self.client = ctx.make_client()
+        email = user_email(ctx.users - index)
+        self.session = open_session(self.client, email)
+
+def percentile(ordered, pct):
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+def run_scenario(ctx, workers, build):
+    latencies = []
+    statuses = {}
+    lock = threading.Lock()
+    stop = time.monotonic() + ctx.args.duration
+
+    def loop(worker):
+        local_latencies = []
+        local_statuses = {}
+        while time.monotonic() < stop:
+            method, path, kwargs = build(ctx, worker)
+            started = time.perf_counter()
+            status, _ = worker.client.request(method, path, **kwargs)
+            local_latencies.append(time.perf_counter() - started)
+            local_statuses[status] = local_statuses.get(status, 0) + 1
+        with lock:
+            latencies.extend(local_latencies)
+            for status, count in local_statuses.items():
+                statuses[status] = statuses.get(status, 0) + count
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=loop, args=(worker,)) for worker in workers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    errors = sum(count for status, count in statuses.items() if status >= 400)
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'statuses': {str(status): count for status, count in sorted(statuses.items())},
+        'throughput': len(latencies) / elapsed,
+        'mean_ms': 1000 * sum(latencies) / len(latencies) if latencies else 0.0,
+        'p50_ms': 1000 * percentile(latencies, 50),
+        'p95_ms': 1000 * percentile(latencies, 95),
+        'p99_ms': 1000 * percentile(latencies, 99),
+    }
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return None
+
+def compare(results, baseline):
+    print(f'\n{"scenario":<22}{"req/s":>10}{"change":>9}{"p95 ms":>10}{"change":>9}')
+    for name, result in results.items():
+        old = baseline.get('results', {}).get(name)
+        if old is None:
+            continue
+        def change(new, before):
+            return f'{100 * (new - before) / before:+8.1f}%' if before else '        -'
+        print(f'{name:<22}{result["throughput"]:>10.1f}{change(result["throughput"], old["throughput"])}'
+              f'{result["p95_ms"]:>10.2f}{change(result["p95_ms"], old["p95_ms"])}')
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0],
+                                     formatter_class=argparse.RawDescriptionHelpFormatter,
+                                     epilog='\n'.join(__doc__.splitlines()[2:]))
+    parser.add_argument('--url', help='benchmark a running server instead of the test client')
+    parser.add_argument('--db', help='SQLite file seeded by datagen.py (test client mode)')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--expenses', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--duration', type=float, default=5, help='seconds per scenario')
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--sessions', type=int, default=50, help='distinct users making requests')
+    parser.add_argument('--bulk-items', type=int, default=20)
+    parser.add_argument('--rounds', type=int, default=4, help='bcrypt work factor for new passwords')
+    parser.add_argument('--no-cache', action='store_true', help='disable the response cache')
+    parser.add_argument('--only', help='comma-separated scenarios or blueprints to run')
+    parser.add_argument('--out', help='write results to this JSON file')
+    parser.add_argument('--compare', help='JSON results of an earlier run to compare against')
+    args = parser.parse_args()
+
+    if args.concurrency + args.sessions > args.users:
+        parser.error('--users must exceed --concurrency + --sessions')
+
+    selected = SCENARIOS
+    if args.only:
+        wanted = set(args.only.split(','))
+        selected = {name: spec for name, spec in SCENARIOS.items()
+                    if name in wanted or spec[0] in wanted}
+        if not selected:
+            parser.error(f'No scenarios match {args.only!r}; choose from {", ".join(SCENARIOS)}')
+
+    if args.url:
+        make_client = lambda: HTTPClient(args.url)
+        population = Population(args.users, args.seed)
+        target = args.url
+    else:
+        from app import create_app
+        path = args.db or os.path.join(tempfile.mkdtemp(), 'bench.db')
+        app = create_app({
+            'SQLALCHEMY_DATABASE_URI': f'sqlite:///{os.path.abspath(path)}',
+            'BCRYPT_LOG_ROUNDS': args.rounds,
+            'RESPONSE_CACHE_ENABLED': not args.no_cache,
+        })
+        if args.db:
+            population = Population(args.users, args.seed)
+        else:
+            print(f'Seeding {args.users} users and {args.expenses} expenses...', file=sys.stderr)
+            population = seed(app, args.users, args.expenses, args.seed)
+        make_client = lambda: TestClient(app)
+        target = 'test-client'
+
+    client = make_client()
+    sessions = [open_session(client, user_email(index)) for index in range(1, args.sessions + 1)]
+    ctx = Context(args, make_client, population, sessions)
+    # Workers log in as the last users so their passwords can change freely
+    workers = [Worker(ctx, index) for index in range(args.concurrency)]
+
+    print(f'{"scenario":<22}{"blueprint":<10}{"requests":>9}{"errors":>7}{"req/s":>10}'
+          f'{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}')
+    results = {}
+    for name, (blueprint, build) in selected.items():
+        result = run_scenario(ctx, workers, build)
+        result['blueprint'] = blueprint
+        results[name] = result
+        print(f'{name:<22}{blueprint:<10}{result["requests"]:>9}{result["errors"]:>7}'
+              f'{result["throughput"]:>10.1f}{result["p50_ms"]:>9.2f}{result["p95_ms"]:>9.2f}'
+              f'{result["p99_ms"]:>9.2f}')
+
+    # Leave every worker with the seeded password for the next run
+    for worker in workers:
+        if worker.session.password != PASSWORD:
+            method, path, kwargs = change_password(ctx, worker)
+            worker.client.request(method, path, **kwargs)
+
+    report = {
+        'meta': {
+            'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'revision': git_revision(),
+            'target': target,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'args': vars(args),
+        },
+        'results': results
+    }
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f'\nResults written to {args.out}')
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+if __name__ == '__main__':
+    main()
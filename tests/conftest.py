@@ -0,0 +1,67 @@
+import os
+import sys
+import pytest
+from flask_jwt_extended import create_access_token
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app, db, identity_cache, ledger, response_cache, rollups
+from app.models import Balance, User
+
+def make_app(path, **config):
+    # The caches are per process, and every test database reuses user ids
+    identity_cache.clear()
+    response_cache.clear()
+    return create_app({
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}',
+        'TESTING': True,
+        'BCRYPT_LOG_ROUNDS': 4,
+        'EXPORT_DIR': os.path.join(os.path.dirname(path), 'exports'),
+        **config
+    })
+
+def expense(participants, split_type='equal', amount=10, **fields):
+    """An expense payload for POST /expense and /expenses/bulk"""
+    return {'description': 'Test', 'amount': amount, 'split_type': split_type,
+            'participants': participants, **fields}
+
+def assert_no_drift(app):
+    with app.app_context():
+        assert ledger.find_drift() == []
+        assert rollups.find_drift() == []
+
+def stored_balance(app, user_id, counterparty_id):
+    with app.app_context():
+        return db.session.get(Balance, (user_id, counterparty_id)).amount_cents
+
+@pytest.fixture
+def app(tmp_path):
+    app = make_app(tmp_path / 'test.db')
+    yield app
+    with app.app_context():
+        db.engine.dispose()
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+@pytest.fixture
+def users(app):
+    """Ids of four users"""
+    with app.app_context():
+        users = [
+            User(email=f'user{i}@example.com', name=f'User {i}', mobile=f'555000{i:04d}')
+            for i in range(1, 5)
+        ]
+        db.session.add_all(users)
+        db.session.commit()
+        return [user.id for user in users]
+
+@pytest.fixture
+def headers(app, users):
+    """Authorization headers by user id"""
+    with app.app_context():
+        return {
+            user_id: {'Authorization': f'Bearer {create_access_token(identity=str(user_id))}'}
+            for user_id in users
+        }
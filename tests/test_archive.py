@@ -0,0 +1,73 @@
+import datetime
+from app import db, response_cache, rollups
+from app.archive import archive_expenses, find_checkpoint_drift
+from app.models import Expense, ExpenseArchive
+from app.users import balance_query
+from conftest import assert_no_drift, expense
+
+CUTOFF = datetime.datetime(2023, 7, 1)
+
+def add_history(client, users, headers):
+    a, b, c, d = users
+    items = []
+    for day in range(1, 29):
+        members = users[day % 4:] + users[:day % 4]
+        items.append(expense(
+            [{'user_id': user_id} for user_id in members[:day % 3 + 2]],
+            amount=day * 3.17,
+            description=f'Day {day}',
+            date=f'2023-{day % 12 + 1:02d}-{day:02d}T12:00:00'
+        ))
+    for creator_id in (a, b, c):
+        response = client.post('/expenses/bulk', json=items, headers=headers[creator_id])
+        assert response.get_json()['failed'] == 0
+    # Expenses dated today stay live
+    client.post('/expense', json=expense([{'user_id': a}, {'user_id': d}], amount=12.34), headers=headers[b])
+
+def balances(users):
+    return {user_id: sorted(balance_query(user_id).all()) for user_id in users}
+
+def test_archiving_leaves_balances_unchanged(app, client, users, headers):
+    add_history(client, users, headers)
+
+    with app.app_context():
+        before = balances(users)
+        summaries = rollups.compute_rollups()
+        counts = archive_expenses(CUTOFF)
+        assert counts['expenses'] > 0 and counts['checkpoints'] > 0
+        assert db.session.query(ExpenseArchive).count() == counts['expenses']
+        assert db.session.query(Expense).filter(Expense.date < CUTOFF).count() == 0
+
+        assert balances(users) == before
+        assert rollups.compute_rollups() == summaries
+        assert find_checkpoint_drift() == []
+    assert_no_drift(app)
+
+def test_archived_expenses_are_still_listed(app, client, users, headers):
+    add_history(client, users, headers)
+    a = users[0]
+
+    def listing():
+        response = client.get('/expenses/user?include_archived=1&limit=200', headers=headers[a])
+        return response.get_json()
+
+    before = listing()
+    with app.app_context():
+        assert archive_expenses(CUTOFF)['expenses'] > 0
+    # Archiving leaves cached responses to expire
+    response_cache.invalidate({a})
+    assert listing() == before
+
+def test_cli_dry_run_and_verify(app, client, users, headers):
+    add_history(client, users, headers)
+    runner = app.test_cli_runner()
+
+    result = runner.invoke(args=['archive', 'run', '--before', '2023-07-01', '--dry-run'])
+    assert result.exit_code == 0 and result.output.startswith('Would archive')
+    with app.app_context():
+        assert db.session.query(ExpenseArchive).count() == 0
+
+    result = runner.invoke(args=['archive', 'run', '--before', '2023-07-01'])
+    assert result.exit_code == 0 and result.output.startswith('Archived')
+    result = runner.invoke(args=['archive', 'verify'])
+    assert result.exit_code == 0, result.output
@@ -0,0 +1,18 @@
+PASSWORD = 'Secret123!'
+
+def register(client, email='new@example.com', mobile='5559990000'):
+    return client.post('/register', json={
+        'email': email, 'name': 'New User', 'mobile': mobile, 'password': PASSWORD
+    })
+
+def test_tokens_from_register_and_login_are_accepted(client):
+    response = register(client)
+    assert response.status_code == 201
+    token = response.get_json()['access_token']
+    assert client.get('/user', headers={'Authorization': f'Bearer {token}'}).status_code == 200
+
+    response = client.post('/login', json={'email': 'new@example.com', 'password': PASSWORD})
+    token = response.get_json()['access_token']
+    response = client.get('/user', headers={'Authorization': f'Bearer {token}'})
+    assert response.status_code == 200
+    assert response.get_json()['email'] == 'new@example.com'
@@ -0,0 +1,36 @@
+import csv
+from io import StringIO
+from conftest import expense
+
+def seed(client, users, headers):
+    a, b, _, _ = users
+    items = [expense([{'user_id': a}, {'user_id': b}], amount=10, date=f'2024-01-{day:02d}T09:00:00')
+             for day in range(1, 11)]
+    client.post('/expenses/bulk', json=items, headers=headers[a])
+    client.post('/expenses/bulk', json=[expense([{'user_id': a}], amount=4, date='2024-02-01T09:00:00')],
+                headers=headers[b])
+
+def test_csv_stream_matches_the_json_report(client, users, headers):
+    seed(client, users, headers)
+    a = users[0]
+    response = client.get('/balance-sheet/download?format=csv', headers=headers[a])
+    assert response.status_code == 200 and response.mimetype == 'text/csv'
+    assert response.is_streamed
+    streamed = response.get_data(as_text=True)
+    wrapped = client.get('/balance-sheet/download', headers=headers[a]).get_json()['csv_content']
+    assert streamed == wrapped
+
+    rows = list(csv.reader(StringIO(streamed)))
+    assert rows[0] == ['Date', 'Description', 'Amount', 'Split Type', 'Your Share', 'Status']
+    assert rows[1] == ['2024-01-01', 'Test', '10.0', 'equal', '5.0', 'Paid']
+    assert rows[-1] == ['2024-02-01', 'Test', '4.0', 'equal', '4.0', 'Owe']
+    assert len(rows) == 12
+
+def test_date_range_is_inclusive(client, users, headers):
+    seed(client, users, headers)
+    response = client.get('/balance-sheet/download?format=csv&from=2024-01-03&to=2024-01-05',
+                          headers=headers[users[0]])
+    rows = list(csv.reader(StringIO(response.get_data(as_text=True))))[1:]
+    assert [row[0] for row in rows] == ['2024-01-03', '2024-01-04', '2024-01-05']
+    assert client.get('/balance-sheet/download?from=01/03/2024',
+                      headers=headers[users[0]]).status_code == 400
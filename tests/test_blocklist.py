@@ -0,0 +1,53 @@
+import time
+import pytest
+from app.blocklist import MemoryBlocklist, SQLiteBlocklist
+from conftest import make_app
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def blocklist(request, tmp_path):
+    if request.param == 'memory':
+        return MemoryBlocklist(purge_interval=3600)
+    return SQLiteBlocklist(str(tmp_path / 'blocklist.db'), purge_interval=3600)
+
+def test_revoked_until_expiry(blocklist):
+    now = time.time()
+    blocklist.add('live', now + 60)
+    blocklist.add('expired', now - 1)
+    assert blocklist.is_revoked('live')
+    assert not blocklist.is_revoked('expired')
+    assert not blocklist.is_revoked('unknown')
+
+def test_purge_drops_only_expired_entries(blocklist):
+    now = time.time()
+    for i in range(10):
+        blocklist.add(f'old{i}', now - 10 + i)
+    blocklist.add('new', now + 60)
+    # The first add already purged on its own schedule
+    assert blocklist.purge(now) == 9
+    assert blocklist.purge(now) == 0
+    assert len(blocklist) == 1
+    assert blocklist.is_revoked('new')
+
+def test_readding_a_jti_extends_it(blocklist):
+    now = time.time()
+    blocklist.add('jti', now - 5)
+    blocklist.add('jti', now + 60)
+    blocklist.purge(now)
+    assert blocklist.is_revoked('jti')
+
+def test_sqlite_blocklist_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / 'blocklist.db')
+    SQLiteBlocklist(path).add('jti', time.time() + 60)
+    assert SQLiteBlocklist(path).is_revoked('jti')
+
+@pytest.mark.parametrize('backend', ['memory', 'sqlite'])
+def test_logout_revokes_the_token(tmp_path, backend):
+    app = make_app(tmp_path / 'test.db', JWT_BLOCKLIST_BACKEND=backend,
+                   JWT_BLOCKLIST_PATH=str(tmp_path / 'blocklist.db'))
+    client = app.test_client()
+    token = client.post('/register', json={
+        'email': 'out@example.com', 'name': 'Out', 'mobile': '5551110000', 'password': 'Secret123!'
+    }).get_json()['access_token']
+    headers = {'Authorization': f'Bearer {token}'}
+    assert client.post('/logout', headers=headers).status_code == 200
+    assert client.get('/user', headers=headers).status_code == 401
@@ -0,0 +1,90 @@
+import datetime
+import json
+from app import db
+from app.models import Expense
+from conftest import assert_no_drift, expense, stored_balance
+
+def test_bulk_expenses_keep_ledger_and_rollups_in_step(app, client, users, headers):
+    a, b, c, d = users
+    items = [
+        expense([{'user_id': a}, {'user_id': b}, {'user_id': c}, {'user_id': d}], amount=100.01,
+                date=f'2024-{month:02d}-15T10:00:00')
+        for month in range(1, 13)
+    ]
+    items.append(expense([{'user_id': b}, {'user_id': c}], date='2024-03-01T23:30:00-02:00'))
+    items.append(expense([{'user_id': b}], split_type='percentage'))
+    response = client.post('/expenses/bulk', json=items, headers=headers[a])
+    body = response.get_json()
+    assert response.status_code == 200
+    assert body['created'] == 13 and body['failed'] == 1
+    assert_no_drift(app)
+
+def test_failing_bulk_item_fails_alone(app, client, users, headers):
+    a, b, _, _ = users
+    items = [expense([{'user_id': b}]), expense([{'user_id': b}], description={'not': 'text'}),
+             expense([{'user_id': b}])]
+    response = client.post('/expenses/bulk', json=items, headers=headers[a])
+    results = response.get_json()['results']
+    assert ['expense_id' in result for result in results] == [True, False, True]
+    assert stored_balance(app, a, b) == 2000
+    assert_no_drift(app)
+
+
+def test_dates_with_an_offset_are_stored_as_utc(app, client, users, headers):
+    a, b, _, _ = users
+    items = [expense([{'user_id': b}], date='2024-03-01T23:30:00-02:00'),
+             expense([{'user_id': b}], date='0001-01-01T00:00:00+01:00')]
+    results = client.post('/expenses/bulk', json=items, headers=headers[a]).get_json()['results']
+    assert results[1] == {'index': 1, 'error': 'Invalid date'}
+    with app.app_context():
+        assert db.session.get(Expense, results[0]['expense_id']).date == datetime.datetime(2024, 3, 2, 1, 30)
+
+def test_invalid_items_fail_alone_across_batches(app, client, users, headers):
+    a, b, _, _ = users
+    items = [expense([{'user_id': b}]) for _ in range(600)]
+    items.append(expense([{'user_id': b}], amount=1e30))
+    items.append(expense([{'user_id': b}]))
+    response = client.post('/expenses/bulk', json=items, headers=headers[a])
+    body = response.get_json()
+    assert response.status_code == 200
+    assert body['created'] == 601 and body['failed'] == 1
+    assert body['results'][600] == {'index': 600, 'error': 'Invalid split amounts'}
+    assert_no_drift(app)
+
+def test_unexpected_failure_still_reports_committed_items(app, client, users, headers, monkeypatch):
+    a, b, _, _ = users
+    from app import expenses
+    check_bulk_item = expenses.check_bulk_item
+
+    def failing_check(data):
+        if data['description'] == 'Boom':
+            raise RuntimeError('unexpected')
+        return check_bulk_item(data)
+    monkeypatch.setattr(expenses, 'check_bulk_item', failing_check)
+
+    lines = [expense([{'user_id': b}]) for _ in range(600)]
+    lines.append(expense([{'user_id': b}], description='Boom'))
+    lines.append(expense([{'user_id': b}]))
+    body = '\n'.join(json.dumps(line) for line in lines)
+    response = client.post('/expenses/bulk', data=body, content_type='application/x-ndjson',
+                           headers=headers[a])
+    body = response.get_json()
+    assert body['created'] == 600
+    assert body['results'][-1]['index'] == 600 and 'error' in body['results'][-1]
+    assert len(body['results']) == 601
+    assert stored_balance(app, a, b) == 600 * 1000
+    assert_no_drift(app)
+
+def test_body_must_be_an_array_or_ndjson(client, users, headers):
+    response = client.post('/expenses/bulk', json={'not': 'a list'}, headers=headers[users[0]])
+    assert response.status_code == 400
+
+def test_unknown_participants_are_rejected(app, client, users, headers):
+    a, b, _, _ = users
+    items = [expense([{'user_id': b}]), expense([{'user_id': b}, {'user_id': 999}]),
+             expense([{'user_id': str(b)}])]
+    results = client.post('/expenses/bulk', json=items, headers=headers[a]).get_json()['results']
+    assert results[1] == {'index': 1, 'error': 'Unknown participant user_id'}
+    assert 'expense_id' in results[0] and 'expense_id' in results[2]
+    assert stored_balance(app, a, b) == 2000
+    assert_no_drift(app)
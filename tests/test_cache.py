@@ -0,0 +1,56 @@
+from app.cache import CachedResponse, ResponseCache
+from conftest import expense
+
+def test_unchanged_responses_get_304(client, users, headers):
+    a = users[0]
+    first = client.get('/user/balance', headers=headers[a])
+    assert first.status_code == 200 and first.headers['ETag']
+    assert first.headers['Cache-Control'] == 'private, no-cache'
+    etag = first.headers['ETag']
+
+    again = client.get('/user/balance', headers={**headers[a], 'If-None-Match': etag})
+    assert again.status_code == 304
+    assert again.headers['ETag'] == etag
+
+def test_writes_invalidate_every_user_involved(client, users, headers):
+    a, b, c, _ = users
+    etags = {user_id: client.get('/user/balance', headers=headers[user_id]).headers['ETag']
+             for user_id in (a, b, c)}
+    client.post('/expense', json=expense([{'user_id': a}, {'user_id': b}]), headers=headers[a])
+
+    for user_id, expected in ((a, 200), (b, 200), (c, 304)):
+        response = client.get('/user/balance', headers={**headers[user_id], 'If-None-Match': etags[user_id]})
+        assert response.status_code == expected
+    body = client.get('/user/balance', headers=headers[b]).get_json()
+    assert body['total_balance'] == -5.0
+
+def make_cache(max_entries=2):
+    cache = ResponseCache()
+    cache.max_entries = max_entries
+    cache.ttl = 60
+    return cache
+
+def entry():
+    return CachedResponse('etag', b'body', 'application/json', {}, float('inf'))
+
+def test_reads_overtaken_by_an_invalidation_are_not_stored():
+    cache = make_cache()
+    generation = cache.generation()
+    cache.invalidate({1})
+    cache.set((1, '/user/balance', ''), entry(), generation)
+    assert cache.get((1, '/user/balance', '')) is None
+
+    cache.set((2, '/user/balance', ''), entry(), generation)
+    assert cache.get((2, '/user/balance', '')) is not None
+
+def test_invalidation_records_stay_bounded():
+    cache = make_cache()
+    generation = cache.generation()
+    for user_id in range(1, 1001):
+        cache.invalidate({user_id})
+    assert len(cache._invalidated) == 2
+    # A read that started before an evicted record is still refused
+    cache.set((1, '/user/balance', ''), entry(), generation)
+    assert cache.get((1, '/user/balance', '')) is None
+    cache.set((1, '/user/balance', ''), entry(), cache.generation())
+    assert cache.get((1, '/user/balance', '')) is not None
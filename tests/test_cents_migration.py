@@ -0,0 +1,70 @@
+import sqlite3
+from sqlalchemy import create_engine
+from app import db, ledger, rollups
+from app.migrations import MIGRATIONS, baseline_schema, current_version
+from app.models import Expense, ExpenseParticipant
+from conftest import make_app
+
+# (id, amount, split_type, creator_id, [(user_id, share_amount, share_percentage)])
+LEGACY_EXPENSES = [
+    (1, 10.0, 'equal', 1, [(1, 3.33, None), (2, 3.33, None), (3, 3.34, None)]),
+    (2, 0.1 + 0.2, 'exact', 2, [(1, 0.1, None), (2, 0.2, None)]),
+    (3, 1000.0, 'percentage', 1, [(1, 333.33, 33.333), (2, 333.33, 33.333), (3, 333.34, 33.334)]),
+    (4, 0.05, 'equal', 3, [(1, 0.025, None), (3, 0.025, None)]),
+    (5, 100.0, 'equal', 2, [(1, 33.333333, None), (3, 33.333333, None), (4, 33.333333, None)]),
+]
+
+def legacy_database(path):
+    """A database with float amounts, as created before migrations existed"""
+    engine = create_engine(f'sqlite:///{path}')
+    with engine.begin() as conn:
+        baseline_schema(conn)
+    engine.dispose()
+
+    conn = sqlite3.connect(path)
+    conn.executemany(
+        'INSERT INTO user (id, email, name, mobile) VALUES (?, ?, ?, ?)',
+        [(i, f'user{i}@example.com', f'User {i}', f'555000{i:04d}') for i in range(1, 5)]
+    )
+    for expense_id, amount, split_type, creator_id, participants in LEGACY_EXPENSES:
+        conn.execute(
+            'INSERT INTO expense (id, description, amount, date, split_type, creator_id) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            (expense_id, 'Legacy', amount, f'2024-01-0{expense_id} 12:00:00', split_type, creator_id)
+        )
+        conn.executemany(
+            'INSERT INTO expense_participant (expense_id, user_id, share_amount, share_percentage) '
+            'VALUES (?, ?, ?, ?)',
+            [(expense_id, *participant) for participant in participants]
+        )
+    conn.commit()
+    conn.close()
+
+def test_integer_cents_migration(tmp_path):
+    path = tmp_path / 'legacy.db'
+    legacy_database(path)
+
+    app = make_app(path)
+    with app.app_context():
+        with db.engine.connect() as conn:
+            assert current_version(conn) == max(version for version, _, _ in MIGRATIONS)
+
+        amounts = dict(db.session.query(Expense.id, Expense.amount_cents))
+        assert amounts == {1: 1000, 2: 30, 3: 100000, 4: 5, 5: 10000}
+
+        shares = {}
+        for expense_id, share_cents in db.session.query(
+            ExpenseParticipant.expense_id, ExpenseParticipant.share_cents
+        ).order_by(ExpenseParticipant.id):
+            shares.setdefault(expense_id, []).append(share_cents)
+        assert {expense_id: sum(cents) for expense_id, cents in shares.items()} == amounts
+        assert shares[1] == [333, 333, 334]
+        assert shares[2] == [10, 20]
+        assert shares[3] == [33333, 33333, 33334]
+        assert shares[4] == [3, 2]
+        assert shares[5] == [3334, 3333, 3333]
+
+        # The derived tables are seeded from the converted rows
+        assert ledger.find_drift() == []
+        assert rollups.find_drift() == []
+        db.engine.dispose()
@@ -0,0 +1,56 @@
+from app import db
+from app.changes import record_changes
+from app.models import Expense, ExpenseParticipant
+from conftest import expense
+
+def sync(client, headers, since=None, limit=2):
+    query = f'?limit={limit}' + (f'&since={since}' if since else '')
+    response = client.get(f'/expenses/changes{query}', headers=headers)
+    assert response.status_code == 200
+    return response.get_json()
+
+def test_cursor_pages_through_every_change_once(client, users, headers):
+    a, b, c, _ = users
+    for amount in range(1, 6):
+        client.post('/expense', json=expense([{'user_id': a}, {'user_id': b}], amount=amount),
+                    headers=headers[a])
+
+    seen = []
+    page = sync(client, headers[b])
+    while True:
+        seen.extend(item['amount'] for item in page['expenses'])
+        if not page['has_more']:
+            break
+        page = sync(client, headers[b], page['cursor'])
+    # Pages list expenses like /expenses/user, newest first
+    assert sorted(seen) == [1.0, 2.0, 3.0, 4.0, 5.0]
+
+    # Nothing new: same cursor back and an empty page
+    cursor = page['cursor']
+    page = sync(client, headers[b], cursor)
+    assert page == {'expenses': [], 'deleted': [], 'cursor': cursor, 'has_more': False}
+
+    client.post('/expense', json=expense([{'user_id': a}, {'user_id': b}], amount=6), headers=headers[a])
+    assert [item['amount'] for item in sync(client, headers[b], cursor)['expenses']] == [6.0]
+    assert sync(client, headers[c])['expenses'] == []
+
+def test_expenses_no_longer_involving_the_user_are_deleted(app, client, users, headers):
+    a, b, _, _ = users
+    client.post('/expense', json=expense([{'user_id': a}, {'user_id': b}]), headers=headers[a])
+    cursor = sync(client, headers[b])['cursor']
+
+    with app.app_context():
+        expense_id = db.session.query(Expense.id).scalar()
+        ExpenseParticipant.query.filter_by(expense_id=expense_id, user_id=b).delete()
+        record_changes([(expense_id, {a, b})], 'updated')
+        db.session.commit()
+
+    page = sync(client, headers[b], cursor)
+    assert page['expenses'] == [] and page['deleted'] == [expense_id]
+    assert [item['id'] for item in sync(client, headers[a], limit=10)['expenses']] == [expense_id]
+
+def test_invalid_cursor(client, users, headers):
+    a = users[0]
+    for cursor in ('!!!', 'LTE='):  # not base64, and -1
+        response = client.get(f'/expenses/changes?since={cursor}', headers=headers[a])
+        assert response.status_code == 400
@@ -0,0 +1,33 @@
+import pytest
+from app import db
+from app.config import Config, env_bool, env_int
+from conftest import make_app
+
+def test_pragmas_are_applied_to_new_connections(app):
+    with app.app_context(), db.engine.connect() as conn:
+        pragma = lambda name: conn.exec_driver_sql(f'PRAGMA {name}').scalar()
+        assert pragma('journal_mode') == 'wal'
+        assert pragma('busy_timeout') == Config.SQLITE_BUSY_TIMEOUT_MS
+        assert pragma('synchronous') == 1  # NORMAL
+
+def test_engine_options_size_the_pool(app):
+    options = app.config['SQLALCHEMY_ENGINE_OPTIONS']
+    assert options['pool_size'] == Config.DB_POOL_SIZE
+    assert options['max_overflow'] == Config.DB_MAX_OVERFLOW
+
+def test_only_sqlite_is_supported(tmp_path):
+    with pytest.raises(ValueError, match='Only SQLite'):
+        make_app(tmp_path / 'unused.db', SQLALCHEMY_DATABASE_URI='postgresql://localhost/expenses')
+
+def test_invalid_synchronous_setting_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        make_app(tmp_path / 'test.db', SQLITE_SYNCHRONOUS='sometimes')
+
+def test_environment_parsing(monkeypatch):
+    monkeypatch.setenv('FLAG', 'Yes')
+    monkeypatch.setenv('NUMBER', '42')
+    monkeypatch.setenv('EMPTY', '')
+    assert env_bool('FLAG', False) is True
+    assert env_bool('MISSING', True) is True
+    assert env_int('NUMBER', 1) == 42
+    assert env_int('EMPTY', 7) == 7
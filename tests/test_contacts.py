@@ -0,0 +1,33 @@
+from app import db
+from app.contacts import MAX_MESH_SIZE, contact_pairs
+from app.models import User
+from conftest import expense
+
+def test_recent_contacts_newest_first(app, client, users, headers):
+    a = users[0]
+    with app.app_context():
+        others = [User(email=f'friend{i}@example.com', name=f'Friend {i}', mobile=f'557{i:07d}')
+                  for i in range(7)]
+        db.session.add_all(others)
+        db.session.commit()
+        others = [user.id for user in others]
+    items = [expense([{'user_id': user_id}], date=f'2024-01-{day + 1:02d}T00:00:00')
+             for day, user_id in enumerate(others)]
+    # An older expense must not move its contact back
+    items.append(expense([{'user_id': others[-1]}], date='2023-01-01T00:00:00'))
+    client.post('/expenses/bulk', json=items, headers=headers[a])
+
+    contacts = client.get('/users/recent-contacts', headers=headers[a]).get_json()
+    assert [contact['id'] for contact in contacts] == others[::-1][:5]
+
+    # Participants are each other's contacts too
+    client.post('/expense', json=expense([{'user_id': users[1]}, {'user_id': users[2]}]),
+                headers=headers[a])
+    contacts = client.get('/users/recent-contacts', headers=headers[users[1]]).get_json()
+    assert sorted(contact['id'] for contact in contacts) == [a, users[2]]
+
+def test_huge_expenses_only_link_the_creator():
+    assert sorted(contact_pairs(1, [2, 3])) == [(1, 2), (1, 3), (2, 1), (2, 3), (3, 1), (3, 2)]
+    pairs = contact_pairs(1, range(2, MAX_MESH_SIZE + 2))
+    assert len(pairs) == 2 * MAX_MESH_SIZE
+    assert all(1 in pair for pair in pairs)
@@ -0,0 +1,38 @@
+import os
+import sys
+from app import db
+from app.models import Expense, ExpenseParticipant
+from conftest import assert_no_drift, make_app
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+
+import datagen
+
+def expense_rows(app):
+    with app.app_context():
+        expenses = db.session.query(Expense.creator_id, Expense.amount_cents, Expense.split_type).\
+            order_by(Expense.id).all()
+        participants = db.session.query(ExpenseParticipant.expense_id, ExpenseParticipant.user_id,
+                                        ExpenseParticipant.share_cents).\
+            order_by(ExpenseParticipant.id).all()
+        return expenses, participants
+
+def test_seeded_data_is_consistent_and_reproducible(tmp_path):
+    apps = [make_app(tmp_path / f'{name}.db', BCRYPT_LOG_ROUNDS=4) for name in ('first', 'second')]
+    try:
+        for app in apps:
+            datagen.seed(app, users=50, expenses=300, seed=7, batch_size=100)
+        assert_no_drift(apps[0])
+
+        first, second = (expense_rows(app) for app in apps)
+        assert len(first[0]) == 300
+        assert first == second
+        # Shares always add up to the amount
+        totals = {}
+        for expense_id, _, share_cents in first[1]:
+            totals[expense_id] = totals.get(expense_id, 0) + share_cents
+        assert list(totals.values()) == [amount for _, amount, _ in first[0]]
+    finally:
+        for app in apps:
+            with app.app_context():
+                db.engine.dispose()
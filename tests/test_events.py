@@ -0,0 +1,89 @@
+import json
+import threading
+import pytest
+from app import db, event_broker
+from conftest import expense, make_app
+
+@pytest.fixture
+def app(tmp_path):
+    # A short heartbeat lets a test read a stream up to where it goes quiet
+    app = make_app(tmp_path / 'test.db', EVENTS_HEARTBEAT=0.05)
+    yield app
+    with app.app_context():
+        db.engine.dispose()
+
+def read_until_quiet(chunks):
+    """Parse events from an SSE body iterator up to the next keepalive"""
+    events = []
+    for chunk in chunks:
+        text = chunk.decode('utf-8')
+        if text.startswith(': keepalive'):
+            return events
+        # A change's messages arrive together, separated by blank lines
+        for message in text.strip().split('\n\n'):
+            fields = dict(line.split(': ', 1) for line in message.splitlines())
+            if 'event' in fields:
+                events.append((fields.get('id'), fields['event'], json.loads(fields['data'])))
+    return events
+
+def open_stream(client, headers, **extra):
+    response = client.get('/user/events', headers={**headers, **extra}, buffered=False)
+    assert response.status_code == 200 and response.mimetype == 'text/event-stream'
+    return response, iter(response.response)
+
+def change_cursors(client, headers):
+    return [client.get(f'/expenses/changes?limit={n}', headers=headers).get_json()['cursor']
+            for n in (1, 2, 3)]
+
+def add_expenses(client, users, headers, amounts):
+    a, b, _, _ = users
+    for amount in amounts:
+        client.post('/expense', json=expense([{'user_id': a}, {'user_id': b}], amount=amount),
+                    headers=headers[a])
+
+def test_resume_from_last_event_id(client, users, headers):
+    a, b, _, _ = users
+    add_expenses(client, users, headers, [10, 20, 30])
+    first, second, third = change_cursors(client, headers[b])
+
+    response, chunks = open_stream(client, headers[b], **{'Last-Event-ID': first})
+    events = read_until_quiet(chunks)
+    response.close()
+
+    expenses = [data for _, name, data in events if name == 'expense']
+    assert [data['amount'] for data in expenses] == [20.0, 30.0]
+    assert [data['share'] for data in expenses] == [10.0, 15.0]
+    # Only the last message of a change carries its id
+    assert [event_id for event_id, _, _ in events] == [None, second, None, third]
+    assert events[1] == (second, 'balance', {'counterparty_id': a, 'delta': -10.0})
+
+def test_new_streams_start_from_now_and_get_pushed_events(client, users, headers):
+    b = users[1]
+    add_expenses(client, users, headers, [10])
+
+    response, chunks = open_stream(client, headers[b])
+    assert read_until_quiet(chunks) == []
+    # The open stream holds this thread's request context, as a server would
+    writer = threading.Thread(target=add_expenses, args=(client.application.test_client(), users, headers, [40]))
+    writer.start()
+    writer.join()
+    events = read_until_quiet(chunks)
+    response.close()
+
+    assert [(name, data.get('amount')) for _, name, data in events] == [('expense', 40.0), ('balance', None)]
+    assert events[-1][0] == change_cursors(client, headers[b])[1]
+
+def test_resync_when_too_much_was_missed(client, users, headers, monkeypatch):
+    b = users[1]
+    monkeypatch.setattr(event_broker, 'replay_limit', 1)
+    add_expenses(client, users, headers, [10, 20, 30])
+    first, _, third = change_cursors(client, headers[b])
+
+    response, chunks = open_stream(client, headers[b], **{'Last-Event-ID': first})
+    events = read_until_quiet(chunks)
+    response.close()
+    assert events == [(third, 'resync', {'since': first})]
+
+def test_invalid_event_id(client, users, headers):
+    response = client.get('/user/events', headers={**headers[users[0]], 'Last-Event-ID': 'nope!'})
+    assert response.status_code == 400
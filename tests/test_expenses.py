@@ -0,0 +1,29 @@
+import pytest
+from app import db
+from app.models import ExpenseChange, ExpenseParticipant
+from conftest import assert_no_drift, expense, stored_balance
+
+def test_unknown_participant_is_rejected(app, client, users, headers):
+    a, b, _, _ = users
+    response = client.post('/expense', json=expense([{'user_id': b}, {'user_id': 999}]),
+                           headers=headers[a])
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'Unknown participant user_id'}
+    with app.app_context():
+        assert db.session.query(ExpenseParticipant).count() == 0
+        assert db.session.query(ExpenseChange).count() == 0
+
+def test_numeric_string_user_ids_are_accepted(app, client, users, headers):
+    a, b, _, _ = users
+    response = client.post('/expense', json=expense([{'user_id': str(a)}, {'user_id': str(b)}]),
+                           headers=headers[a])
+    assert response.status_code == 201
+    assert stored_balance(app, a, b) == 500
+    assert_no_drift(app)
+
+@pytest.mark.parametrize('user_id', [None, 1.5, True, '2a', '-1', [2]])
+def test_participants_need_an_integer_user_id(client, users, headers, user_id):
+    a = users[0]
+    response = client.post('/expense', json=expense([{'user_id': a}, {'user_id': user_id}]),
+                           headers=headers[a])
+    assert response.status_code == 400
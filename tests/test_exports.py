@@ -0,0 +1,41 @@
+import json
+import os
+import time
+from app import export_jobs
+
+def write_job(job_id, status, age, finished=None):
+    now = time.time()
+    job = {'id': job_id, 'owner_id': 1, 'status': status, 'filename': 'export.csv',
+           'compressed': False, 'size': None, 'error': None, 'created_at': now - age,
+           'finished_at': now - finished if finished is not None else None,
+           'updated_at': now - (finished if finished is not None else age)}
+    with open(os.path.join(export_jobs.directory, job_id + '.json'), 'w') as f:
+        json.dump(job, f)
+    open(export_jobs.file_path(job_id), 'w').close()
+
+def test_purge_decides_from_the_saved_status(app):
+    ttl, stale = export_jobs.ttl, export_jobs.stale_after
+    # Another process's jobs, older than EXPORT_TTL but not stale
+    write_job('queued', 'queued', age=ttl + 10)
+    write_job('running', 'running', age=ttl + 10)
+    write_job('dead', 'running', age=stale + 10)
+    write_job('done', 'done', age=ttl + 20, finished=ttl + 10)
+    write_job('fresh', 'done', age=ttl + 20, finished=10)
+
+    export_jobs.purge()
+    left = {name.split('.')[0] for name in os.listdir(export_jobs.directory)}
+    assert left == {'queued', 'running', 'fresh'}
+
+def test_export_job_runs_to_completion(client, users, headers):
+    a = users[0]
+    response = client.post('/balance-sheet/exports', headers=headers[a])
+    assert response.status_code == 202, response.get_json()
+    location = response.headers['Location']
+    for _ in range(100):
+        status = client.get(location, headers=headers[a]).get_json()
+        if status['status'] in ('done', 'failed'):
+            break
+        time.sleep(0.05)
+    assert status['status'] == 'done'
+    assert client.get(status['download_url'], headers=headers[a]).status_code == 200
+    assert client.get(location, headers=headers[users[1]]).status_code == 404
@@ -0,0 +1,53 @@
+import json
+import pytest
+from app import serializers
+from conftest import expense
+
+def seed(client, users, headers):
+    a, b, _, _ = users
+    client.post('/expense', json=expense([{'user_id': a}, {'user_id': b}]), headers=headers[a])
+
+def test_json_is_the_default(client, users, headers):
+    seed(client, users, headers)
+    a = users[0]
+    for accept in (None, '*/*', 'application/json'):
+        request_headers = {**headers[a], 'Accept': accept} if accept else headers[a]
+        response = client.get('/expenses/user', headers=request_headers)
+        assert response.status_code == 200 and response.mimetype == 'application/json'
+        assert 'Accept' in response.vary
+        assert response.get_json()[0]['amount'] == 10.0
+
+def test_cached_responses_still_vary_on_accept(client, users, headers):
+    a = users[0]
+    client.get('/user/balance', headers=headers[a])
+    response = client.get('/user/balance', headers=headers[a])
+    assert {'Accept', 'Authorization'} <= set(response.vary)
+
+def test_unsupported_formats_get_406(client, users, headers):
+    a = users[0]
+    response = client.get('/user/balance', headers={**headers[a], 'Accept': 'text/csv'})
+    assert response.status_code == 406
+    assert response.get_json()['formats'] == serializers.offered_formats()
+
+def test_both_json_encoders_agree(monkeypatch):
+    data = {'b': [1, 2.5, None], 'a': {'name': 'Ünïcode', 'ok': True}}
+    encoded = serializers.encode_json(data)
+    monkeypatch.setattr(serializers, 'orjson', None)
+    assert serializers.encode_json(data) == encoded
+    assert json.loads(encoded) == data
+
+def test_msgpack_matches_json(client, users, headers):
+    msgpack = pytest.importorskip('msgpack')
+    seed(client, users, headers)
+    a = users[0]
+    for path in ('/expenses/user', '/user/balance'):
+        packed = client.get(path, headers={**headers[a], 'Accept': 'application/msgpack'})
+        assert packed.mimetype == 'application/msgpack'
+        assert msgpack.unpackb(packed.data) == client.get(path, headers=headers[a]).get_json()
+
+def test_msgpack_is_not_offered_without_the_package(client, users, headers, monkeypatch):
+    monkeypatch.setattr(serializers, 'msgpack', None)
+    a = users[0]
+    response = client.get('/user/balance', headers={**headers[a], 'Accept': 'application/msgpack'})
+    assert response.status_code == 406
+    assert response.get_json()['formats'] == ['application/json']
@@ -0,0 +1,51 @@
+from conftest import expense
+
+def shared_expenses(client, users, headers):
+    """a shares an expense with b and c; b and c share a private 500"""
+    a, b, c, _ = users
+    client.post('/expense', json=expense([{'user_id': a}, {'user_id': b}, {'user_id': c}], amount=3),
+                headers=headers[a])
+    client.post('/expense', json=expense([{'user_id': c}], amount=500), headers=headers[b])
+
+def test_balances_show_only_the_callers_pairs(client, users, headers):
+    a, b, c, _ = users
+    shared_expenses(client, users, headers)
+    body = client.get(f'/users/balances?user_ids={b},{c}', headers=headers[a]).get_json()
+    assert body['users'] == [a, b, c]
+    assert body['net'] == [2.0, -1.0, -1.0]
+    assert sorted((e['debtor'], e['creditor'], e['amount']) for e in body['edges']) == \
+        [(b, a, 1.0), (c, a, 1.0)]
+
+def test_balance_matrix(client, users, headers):
+    a, b, c, _ = users
+    shared_expenses(client, users, headers)
+    body = client.get('/users/balances?shape=matrix', headers=headers[b]).get_json()
+    assert body['users'] == [a, b, c]
+    # Row i, column j is what users[j] owes users[i]
+    assert body['matrix'] == [[0, 1.0, 0], [-1.0, 0, 500.0], [0, -500.0, 0]]
+
+def test_balances_group_must_be_contacts(client, users, headers):
+    a, _, _, d = users
+    shared_expenses(client, users, headers)
+    assert client.get(f'/users/balances?user_ids={d}', headers=headers[a]).status_code == 403
+    assert client.get('/users/balances?shape=list', headers=headers[a]).status_code == 400
+
+def test_implicit_group_is_paged(client, users, headers, monkeypatch):
+    a, b, c, d = users
+    monkeypatch.setattr('app.users.MAX_GROUP_SIZE', 3)
+    client.post('/expense', json=expense([{'user_id': b}, {'user_id': c}, {'user_id': d}], amount=3),
+                headers=headers[a])
+
+    first = client.get('/users/balances', headers=headers[a])
+    assert first.get_json()['users'] == [a, b, c]
+    cursor = first.headers['X-Next-Cursor']
+    second = client.get(f'/users/balances?cursor={cursor}', headers=headers[a])
+    assert second.get_json()['users'] == [a, d]
+    assert 'X-Next-Cursor' not in second.headers
+
+    plan = client.get(f'/users/settlement?cursor={cursor}', headers=headers[a])
+    assert plan.get_json()['transfer_count'] == 1
+    assert 'X-Next-Cursor' in client.get('/users/settlement', headers=headers[a]).headers
+
+    too_many = client.get(f'/users/balances?user_ids={b},{c},{d}', headers=headers[a])
+    assert too_many.status_code == 400
@@ -0,0 +1,36 @@
+import threading
+from app import password_hasher
+from conftest import make_app
+
+PASSWORD = 'Secret123!'
+
+def test_saturated_hasher_answers_503(tmp_path):
+    app = make_app(tmp_path / 'test.db', PASSWORD_HASH_WORKERS=1, PASSWORD_HASH_QUEUE=0)
+    client = app.test_client()
+    client.post('/register', json={
+        'email': 'busy@example.com', 'name': 'Busy', 'mobile': '5552220000', 'password': PASSWORD
+    })
+
+    started, release = threading.Event(), threading.Event()
+
+    def hold():
+        started.set()
+        release.wait(10)
+    holder = threading.Thread(target=password_hasher._run, args=(hold,))
+    holder.start()
+    started.wait(10)
+    try:
+        response = client.post('/login', json={'email': 'busy@example.com', 'password': PASSWORD})
+        assert response.status_code == 503
+        assert response.headers['Retry-After'] == '1'
+    finally:
+        release.set()
+        holder.join()
+
+    response = client.post('/login', json={'email': 'busy@example.com', 'password': PASSWORD})
+    assert response.status_code == 200
+
+def test_hashes_verify(app):
+    password_hash = password_hasher.hash(PASSWORD)
+    assert password_hasher.check(password_hash, PASSWORD)
+    assert not password_hasher.check(password_hash, PASSWORD + '!')
@@ -0,0 +1,37 @@
+from app import identity_cache
+from app.identity import IdentityCache
+
+def test_current_user_reflects_profile_updates(client, users, headers):
+    a = users[0]
+    assert client.get('/user', headers=headers[a]).get_json()['name'] == 'User 1'
+    client.put('/user', json={'name': 'Renamed'}, headers=headers[a])
+    assert client.get('/user', headers=headers[a]).get_json()['name'] == 'Renamed'
+
+def test_snapshots_are_cached(app, users):
+    with app.app_context():
+        assert identity_cache.get(users[0]) is identity_cache.get(users[0])
+        assert identity_cache.get(999) is None
+
+def test_invalidation_records_stay_bounded(app, users):
+    cache = IdentityCache(jwt=None)
+    cache.enabled = True
+    cache.max_entries = 2
+    cache.ttl = 60
+    for user_id in range(1, 1001):
+        cache.invalidate(user_id)
+    assert len(cache._invalidated) == 2
+
+    with app.app_context():
+        # A load overtaken by invalidations that are evicted again is not stored
+        load = cache._load
+
+        def slow_load(user_id):
+            cache.invalidate(user_id)
+            cache.invalidate(5000)
+            cache.invalidate(5001)
+            return load(user_id)
+        cache._load = slow_load
+        assert cache.get(users[0]) is not None
+        assert users[0] not in cache._invalidated and users[0] not in cache._entries
+        cache._load = load
+        assert cache.get(users[0]) is cache.get(users[0])
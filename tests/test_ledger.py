@@ -0,0 +1,63 @@
+from app import db, ledger
+from app.models import Balance
+from conftest import assert_no_drift, expense, stored_balance
+
+def test_single_expenses_keep_ledger_and_rollups_in_step(app, client, users, headers):
+    a, b, c, d = users
+    payloads = [
+        (a, expense([{'user_id': a}, {'user_id': b}, {'user_id': c}])),
+        (b, expense([{'user_id': a, 'share_amount': 7.5}, {'user_id': c, 'share_amount': 2.5}],
+                    'exact')),
+        (c, expense([{'user_id': a, 'share_percentage': 33.33}, {'user_id': b, 'share_percentage': 33.33},
+                     {'user_id': d, 'share_percentage': 33.34}], 'percentage', amount=99.99)),
+        (a, expense([{'user_id': b}, {'user_id': b}], amount=0.01)),
+    ]
+    for creator_id, payload in payloads:
+        response = client.post('/expense', json=payload, headers=headers[creator_id])
+        assert response.status_code == 201, response.get_json()
+        assert_no_drift(app)
+
+    # b owes a 3.33 of the first expense and the cent of the last; a owes
+    # b 7.50 of the second
+    assert stored_balance(app, a, b) == 333 + 1 - 750
+    assert stored_balance(app, b, a) == -stored_balance(app, a, b)
+
+def test_rebuild_matches_incremental_ledger(app, client, users, headers):
+    a, b, c, _ = users
+    for creator_id in (a, b, c, a):
+        client.post('/expense', json=expense([{'user_id': a}, {'user_id': b}, {'user_id': c}]),
+                    headers=headers[creator_id])
+    with app.app_context():
+        before = {(row.user_id, row.counterparty_id): row.amount_cents for row in Balance.query}
+        ledger.rebuild_ledger()
+        after = {(row.user_id, row.counterparty_id): row.amount_cents for row in Balance.query}
+    assert after == before
+
+def test_apply_deltas_adds_to_existing_rows(app, users):
+    a, b, c, _ = users
+    with app.app_context():
+        ledger.apply_deltas({(a, b): 100, (a, c): 50})
+        ledger.apply_deltas({(a, b): 25, (b, a): 10})
+        db.session.commit()
+        stored = {(row.user_id, row.counterparty_id): row.amount_cents for row in Balance.query}
+    assert stored == {(a, b): 115, (b, a): -115, (a, c): 50, (c, a): -50}
+
+def test_balance_endpoint_reads_the_ledger(client, users, headers):
+    a, b, c, _ = users
+    client.post('/expense', json=expense([{'user_id': a}, {'user_id': b}, {'user_id': c}], amount=30),
+                headers=headers[a])
+    body = client.get('/user/balance', headers=headers[a]).get_json()
+    assert sorted((row['user']['id'], row['amount']) for row in body['balances']) == [(b, 10.0), (c, 10.0)]
+    assert body['total_balance'] == 20.0
+
+def test_verify_and_rebuild_commands(app, client, users, headers):
+    a, b, _, _ = users
+    client.post('/expense', json=expense([{'user_id': b}]), headers=headers[a])
+    with app.app_context():
+        db.session.get(Balance, (a, b)).amount_cents += 1
+        db.session.commit()
+    runner = app.test_cli_runner()
+    assert runner.invoke(args=['ledger', 'verify']).exit_code == 1
+    assert runner.invoke(args=['ledger', 'rebuild']).exit_code == 0
+    assert runner.invoke(args=['ledger', 'verify']).exit_code == 0
+    assert stored_balance(app, a, b) == 1000
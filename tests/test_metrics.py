@@ -0,0 +1,48 @@
+import re
+from conftest import expense
+
+def sample(client, name, **labels):
+    """Value of one series in /metrics, 0 when it has not been recorded yet"""
+    text = client.get('/metrics').get_data(as_text=True)
+    wanted = ','.join(f'{key}="{value}"' for key, value in labels.items())
+    match = re.search(rf'^{re.escape(name)}\{{{re.escape(wanted)}\}} (\S+)$', text, re.MULTILINE)
+    return float(match.group(1)) if match else 0
+
+def test_requests_are_counted_by_route_and_status(client, users, headers):
+    a = users[0]
+    labels = {'method': 'GET', 'endpoint': '/user/balance'}
+    ok = sample(client, 'http_requests_total', **labels, status=200)
+    unauthorized = sample(client, 'http_requests_total', **labels, status=401)
+    count = sample(client, 'http_request_duration_seconds_count', **labels)
+
+    client.get('/user/balance', headers=headers[a])
+    client.get('/user/balance', headers=headers[a])
+    client.get('/user/balance')
+
+    assert sample(client, 'http_requests_total', **labels, status=200) == ok + 2
+    assert sample(client, 'http_requests_total', **labels, status=401) == unauthorized + 1
+    assert sample(client, 'http_request_duration_seconds_count', **labels) == count + 3
+
+def test_queries_are_attributed_to_the_request(client, users, headers):
+    a, b, _, _ = users
+    labels = {'method': 'POST', 'endpoint': '/expense'}
+    count = sample(client, 'db_queries_per_request_count', **labels)
+    total = sample(client, 'db_queries_per_request_sum', **labels)
+
+    response = client.post('/expense', json=expense([{'user_id': a}, {'user_id': b}]), headers=headers[a])
+    assert response.status_code == 201
+
+    assert sample(client, 'db_queries_per_request_count', **labels) == count + 1
+    assert sample(client, 'db_queries_per_request_sum', **labels) > total
+
+def test_streamed_responses_are_recorded_once(client, users, headers):
+    a = users[0]
+    labels = {'method': 'GET', 'endpoint': '/balance-sheet/download'}
+    before = sample(client, 'http_requests_total', **labels, status=200)
+
+    response = client.get('/balance-sheet/download?format=csv', headers=headers[a])
+    assert response.is_streamed
+    response.get_data()
+    response.close()
+
+    assert sample(client, 'http_requests_total', **labels, status=200) == before + 1
@@ -0,0 +1,61 @@
+import os
+import subprocess
+import sys
+import pytest
+from sqlalchemy.exc import OperationalError
+from app import db
+from app.migrations import MIGRATIONS, current_version, upgrade
+from conftest import make_app
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LATEST = max(version for version, _, _ in MIGRATIONS)
+
+def recorded_versions(app):
+    with app.app_context(), db.engine.connect() as conn:
+        return [version for (version,) in
+                conn.exec_driver_sql('SELECT version FROM schema_version ORDER BY version')]
+
+def test_upgrade_applies_each_migration_once(tmp_path):
+    path = tmp_path / 'test.db'
+    make_app(path)
+    app = make_app(path)
+    assert recorded_versions(app) == list(range(1, LATEST + 1))
+    with app.app_context():
+        assert upgrade() == []
+        db.engine.dispose()
+
+def test_workers_starting_together_migrate_once(tmp_path):
+    path = tmp_path / 'test.db'
+    script = (
+        'import sys; sys.path.insert(0, sys.argv[1]); from app import create_app; '
+        "create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + sys.argv[2], "
+        "'EXPORT_DIR': sys.argv[3]})"
+    )
+    workers = [
+        subprocess.Popen([sys.executable, '-c', script, ROOT, str(path), str(tmp_path / 'exports')])
+        for _ in range(4)
+    ]
+    assert [worker.wait(timeout=60) for worker in workers] == [0] * 4
+    assert recorded_versions(make_app(path)) == list(range(1, LATEST + 1))
+
+def test_failed_migration_leaves_no_trace(tmp_path, monkeypatch):
+    app = make_app(tmp_path / 'test.db')
+
+    def broken(conn):
+        conn.exec_driver_sql('CREATE TABLE half_done (id INTEGER PRIMARY KEY)')
+        conn.exec_driver_sql('SELECT * FROM no_such_table')
+    monkeypatch.setattr('app.migrations.MIGRATIONS', MIGRATIONS + [(LATEST + 1, 'Broken', broken)])
+
+    with app.app_context():
+        with pytest.raises(OperationalError):
+            upgrade()
+        with db.engine.connect() as conn:
+            assert current_version(conn) == LATEST
+            tables = {name for (name,) in conn.exec_driver_sql("SELECT name FROM sqlite_master")}
+        assert 'half_done' not in tables
+        db.engine.dispose()
+
+def test_request_queries_use_indexes(app):
+    result = app.test_cli_runner().invoke(args=['db', 'check-indexes'])
+    assert result.exit_code == 0, result.output
+    assert 'FAIL' not in result.output
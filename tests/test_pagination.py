@@ -0,0 +1,53 @@
+import pytest
+from conftest import expense
+
+TIED_DATE = '2024-05-01T12:00:00'
+
+def seed_ties(client, users, headers):
+    """Expenses of a's, many sharing one date, from every side of a listing"""
+    a, b, c, _ = users
+    items = [expense([{'user_id': b}], date=TIED_DATE) for _ in range(5)]
+    items += [expense([{'user_id': a}, {'user_id': b}], date=TIED_DATE) for _ in range(3)]
+    items += [expense([{'user_id': b}, {'user_id': b}], date='2024-04-01T00:00:00')]
+    items += [expense([{'user_id': b}], date=f'2024-0{month}-15T00:00:00') for month in (3, 6)]
+    client.post('/expenses/bulk', json=items, headers=headers[a])
+    # Expenses a only participates in, some tied with a's own
+    others = [expense([{'user_id': a}, {'user_id': c}], date=TIED_DATE) for _ in range(4)]
+    others += [expense([{'user_id': a}, {'user_id': a}], date='2024-04-01T00:00:00')]
+    client.post('/expenses/bulk', json=others, headers=headers[c])
+
+def read_pages(client, headers, limit, extra=''):
+    expenses, pages, cursor = [], 0, None
+    while True:
+        url = f'/expenses/user?limit={limit}{extra}' + (f'&cursor={cursor}' if cursor else '')
+        response = client.get(url, headers=headers)
+        assert response.status_code == 200
+        page = response.get_json()
+        assert len(page) <= limit
+        expenses += page
+        pages += 1
+        cursor = response.headers.get('X-Next-Cursor')
+        if not cursor:
+            return expenses, pages
+
+@pytest.mark.parametrize('limit', [1, 2, 3, 5, 50])
+def test_pages_cover_tied_dates_once_in_order(client, users, headers, limit):
+    seed_ties(client, users, headers)
+    expenses, pages = read_pages(client, headers[users[0]], limit)
+    everything = client.get('/expenses/user?limit=200', headers=headers[users[0]]).get_json()
+    assert len(everything) == 16
+    assert [e['id'] for e in expenses] == [e['id'] for e in everything]
+    keys = [(e['date'], e['id']) for e in everything]
+    assert keys == sorted(keys, reverse=True)
+    assert pages >= -(-16 // limit)
+
+def test_listing_shows_participants(client, users, headers):
+    a, b, _, _ = users
+    client.post('/expense', json=expense([{'user_id': a}, {'user_id': b}], amount=9.99), headers=headers[a])
+    [listed] = client.get('/expenses/user', headers=headers[b]).get_json()
+    assert listed['amount'] == 9.99 and listed['creator'] == 'User 1'
+    assert sorted(p['share_amount'] for p in listed['participants']) == [4.99, 5.0]
+
+@pytest.mark.parametrize('query', ['cursor=not-a-cursor', 'limit=0', 'limit=201', 'limit=x'])
+def test_invalid_paging_args_are_rejected(client, users, headers, query):
+    assert client.get(f'/expenses/user?{query}', headers=headers[users[0]]).status_code == 400
@@ -0,0 +1,56 @@
+import csv
+import json
+
+PASSWORD = 'Secret#123'
+
+def person(i, **fields):
+    return {'email': f'import{i}@example.com', 'name': f'Import {i}', 'mobile': f'555100{i:04d}',
+            'password': PASSWORD, **fields}
+
+def write_csv(path, rows):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, ['email', 'name', 'mobile', 'password'])
+        writer.writeheader()
+        writer.writerows(rows)
+
+def import_file(app, path, *args):
+    return app.test_cli_runner().invoke(args=['users', 'import', str(path), '--workers', '2', *args])
+
+def test_imported_users_can_log_in(app, client, tmp_path):
+    path = tmp_path / 'users.csv'
+    write_csv(path, [person(i) for i in range(5)])
+
+    result = import_file(app, path, '--batch-size', '2')
+    assert result.exit_code == 0, result.output
+    assert 'Imported 5 of 5 users' in result.output
+    assert not (tmp_path / 'users.csv.rejected.csv').exists()
+
+    response = client.post('/login', json={'email': 'import3@example.com', 'password': PASSWORD})
+    assert response.status_code == 200
+
+def test_invalid_and_duplicate_rows_are_rejected(app, users, tmp_path):
+    path = tmp_path / 'users.ndjson'
+    lines = [
+        json.dumps(person(1)),
+        json.dumps(person(2, email='import1@example.com')),
+        json.dumps(person(3, mobile='12')),
+        json.dumps(person(4, email='user1@example.com')),
+        'not json',
+        json.dumps(person(5)),
+    ]
+    path.write_text('\n'.join(lines) + '\n')
+
+    result = import_file(app, path)
+    assert result.exit_code == 0, result.output
+    assert 'Imported 2 of 6 users' in result.output
+
+    with open(tmp_path / 'users.ndjson.rejected.csv', newline='') as f:
+        rejected = list(csv.DictReader(f))
+    # Existing accounts are looked up after the in-file checks of a batch
+    assert sorted((int(row['line']), row['error']) for row in rejected) == [
+        (2, 'Duplicate email in file'),
+        (3, 'Invalid mobile number'),
+        (4, 'Email already registered'),
+        (5, 'Invalid JSON'),
+    ]
+    assert 'password' not in rejected[0]
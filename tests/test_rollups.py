@@ -0,0 +1,56 @@
+from app import db
+from app.models import SpendingRollup
+from conftest import assert_no_drift, expense
+
+def seed(client, users, headers):
+    a, b, _, _ = users
+    client.post('/expenses/bulk', json=[
+        expense([{'user_id': a}, {'user_id': b}], amount=10, date='2024-01-05T09:00:00'),
+        expense([{'user_id': a}, {'user_id': b}], amount=20, date='2024-01-20T09:00:00'),
+        expense([{'user_id': b}], amount=7, date='2024-02-01T09:00:00'),
+    ], headers=headers[a])
+    client.post('/expenses/bulk', json=[
+        expense([{'user_id': a}, {'user_id': b}], amount=8, date='2024-02-10T09:00:00'),
+    ], headers=headers[b])
+
+def test_month_buckets_add_up_paid_and_share(client, users, headers):
+    seed(client, users, headers)
+    a = users[0]
+    body = client.get('/user/summary', headers=headers[a]).get_json()
+    assert body['bucket'] == 'month'
+    assert body['periods'] == [
+        {'period': '2024-01-01', 'paid': 30.0, 'share': 15.0, 'net': 15.0, 'expense_count': 2},
+        {'period': '2024-02-01', 'paid': 7.0, 'share': 4.0, 'net': 3.0, 'expense_count': 2},
+    ]
+    assert body['total'] == {'paid': 37.0, 'share': 19.0, 'net': 18.0, 'expense_count': 4}
+
+def test_day_buckets_and_date_range(client, users, headers):
+    seed(client, users, headers)
+    b = users[1]
+    body = client.get('/user/summary?bucket=day&from=2024-01-20&to=2024-02-01',
+                      headers=headers[b]).get_json()
+    assert [(p['period'], p['share']) for p in body['periods']] == [('2024-01-20', 10.0), ('2024-02-01', 7.0)]
+
+    # 'from' is rounded down to the start of its month for month buckets
+    body = client.get('/user/summary?from=2024-01-20&to=2024-01-31', headers=headers[b]).get_json()
+    assert [p['period'] for p in body['periods']] == ['2024-01-01']
+
+def test_invalid_arguments(client, users, headers):
+    a = users[0]
+    assert client.get('/user/summary?bucket=week', headers=headers[a]).status_code == 400
+    assert client.get('/user/summary?from=01/01/2024', headers=headers[a]).status_code == 400
+
+def test_backfill_repairs_drift(app, client, users, headers):
+    seed(client, users, headers)
+    with app.app_context():
+        db.session.query(SpendingRollup).filter_by(user_id=users[0]).delete()
+        db.session.commit()
+
+    runner = app.test_cli_runner()
+    result = runner.invoke(args=['rollups', 'verify'])
+    assert result.exit_code == 1 and 'drifted' in result.output
+
+    result = runner.invoke(args=['rollups', 'backfill'])
+    assert result.exit_code == 0
+    assert_no_drift(app)
+    assert runner.invoke(args=['rollups', 'verify']).exit_code == 0
@@ -0,0 +1,44 @@
+from app import db
+from app.models import User
+
+def add_users(app, *people):
+    with app.app_context():
+        rows = [User(email=email, name=name, mobile=f'556{i:07d}') for i, (name, email) in enumerate(people)]
+        db.session.add_all(rows)
+        db.session.commit()
+        return [row.id for row in rows]
+
+def search(client, headers, query, **params):
+    response = client.get('/users/search', query_string={'q': query, **params}, headers=headers)
+    assert response.status_code == 200
+    return [user['name'] for user in response.get_json()]
+
+def test_exact_email_then_name_prefix_then_substring(app, client, users, headers):
+    add_users(app,
+              ('Bob Alison', 'bob@example.com'),
+              ('alice', 'alice@example.com'),
+              ('Alicia', 'alicia@example.com'),
+              ('Zed', 'ali@example.com'),
+              ('Carol', 'carol.ali@example.com'))
+    h = headers[users[0]]
+    assert search(client, h, 'ali') == ['alice', 'Alicia', 'Bob Alison', 'Carol', 'Zed']
+    assert search(client, h, 'ALI')[:2] == ['alice', 'Alicia']
+    assert search(client, h, 'ali@example.com')[0] == 'Zed'
+    assert search(client, h, 'nobody') == []
+
+def test_every_prefix_match_is_paged(app, client, users, headers, monkeypatch):
+    # Far fewer substring candidates than prefix matches
+    monkeypatch.setattr('app.users.SEARCH_CANDIDATES', 3)
+    add_users(app, *[(f'Dana {i:02d}', f'dana{i}@example.com') for i in range(12)],
+              ('Edana', 'edana@example.com'))
+    h = headers[users[0]]
+    names = []
+    for page in range(1, 5):
+        names += search(client, h, 'dana', page=page, limit=5)
+    assert names[:12] == [f'Dana {i:02d}' for i in range(12)]
+
+def test_short_queries_and_bad_pages_are_rejected(client, users, headers):
+    h = headers[users[0]]
+    assert client.get('/users/search?q=al', headers=h).status_code == 400
+    assert client.get('/users/search?q=ali&limit=51', headers=h).status_code == 400
+    assert client.get('/users/search?q=ali&page=0', headers=h).status_code == 400
@@ -0,0 +1,53 @@
+import pytest
+from app.settlement import pairwise_transfers, simplify_debts
+from conftest import expense
+
+def settle(transfers):
+    net = {}
+    for from_id, to_id, cents in transfers:
+        net[from_id] = net.get(from_id, 0) + cents
+        net[to_id] = net.get(to_id, 0) - cents
+    return {user_id: cents for user_id, cents in net.items() if cents}
+
+@pytest.mark.parametrize('net', [
+    {1: 500, 2: -300, 3: -200},
+    {1: 100, 2: 100, 3: -50, 4: -150},
+    {1: 0, 2: 0},
+    {i: (i - 5) * 100 for i in range(11) if i != 5},
+])
+def test_simplified_transfers_settle_every_balance(net):
+    transfers = simplify_debts(net)
+    assert all(cents > 0 for _, _, cents in transfers)
+    assert settle(transfers) == {user_id: -cents for user_id, cents in net.items() if cents}
+    assert len(transfers) <= max(len([c for c in net.values() if c]) - 1, 0)
+
+def test_simplification_beats_pairwise_settlement():
+    # 2 owes 1, 3 owes 2: 3 can pay 1 directly
+    pairs = {(1, 2): 100, (2, 1): -100, (2, 3): 100, (3, 2): -100}
+    assert len(pairwise_transfers(pairs)) == 2
+    assert simplify_debts({1: 100, 2: 0, 3: -100}) == [(3, 1, 100)]
+
+def private_debt(client, users, headers):
+    """a shares an expense with b and c; b and c share a private 500"""
+    a, b, c, _ = users
+    client.post('/expense', json=expense([{'user_id': a}, {'user_id': b}, {'user_id': c}], amount=3),
+                headers=headers[a])
+    client.post('/expense', json=expense([{'user_id': c}], amount=500), headers=headers[b])
+
+def test_settlement_covers_only_the_callers_balances(client, users, headers):
+    a, b, c, _ = users
+    private_debt(client, users, headers)
+    plan = client.get('/users/settlement', headers=headers[a]).get_json()
+    transfers = {(t['from']['id'], t['to']['id'], t['amount']) for t in plan['transfers']}
+    assert transfers == {(b, a, 1.0), (c, a, 1.0)}
+
+    plan = client.get(f'/users/settlement?user_ids={b},{c}', headers=headers[a]).get_json()
+    assert plan['transfer_count'] == 2
+
+def test_settlement_group_must_be_contacts(client, users, headers):
+    a, _, _, d = users
+    private_debt(client, users, headers)
+    response = client.get(f'/users/settlement?user_ids={d}', headers=headers[a])
+    assert response.status_code == 403
+    response = client.get('/users/settlement?user_ids=x', headers=headers[a])
+    assert response.status_code == 400
@@ -0,0 +1,83 @@
+from decimal import Decimal
+import pytest
+from app.splits import allocate, split_cents, to_cents
+
+@pytest.mark.parametrize('total, weights', [
+    (100, [1, 1, 1]),
+    (1, [1, 1, 1]),
+    (99999, [3, 7, 11, 13]),
+    (1000, ['33.333', '33.333', '33.334']),
+    (-100, [1, 1, 1]),
+    (-12345, [1, 2, 3]),
+    (0, [1, 2]),
+])
+def test_allocate_sums_to_total(total, weights):
+    shares = allocate(total, weights)
+    assert sum(shares) == total
+    weight_total = sum(Decimal(str(weight)) for weight in weights)
+    for share, weight in zip(shares, weights):
+        # Never more than a cent away from the exact proportional share
+        assert abs(share - total * Decimal(str(weight)) / weight_total) < 1
+
+def test_allocate_gives_leftover_cents_to_largest_remainders():
+    assert allocate(10, [1, 2]) == [3, 7]
+    assert allocate(200, [1, 1, 1]) == [67, 67, 66]
+
+def test_allocate_breaks_ties_in_participant_order():
+    assert allocate(100, [1, 1, 1]) == [34, 33, 33]
+    assert allocate(101, [1, 1, 1, 1]) == [26, 25, 25, 25]
+
+def test_allocate_negative_total():
+    assert allocate(-100, [1, 1, 1]) == [-33, -33, -34]
+
+@pytest.mark.parametrize('weights', [[1, -1], [0, 0]])
+def test_allocate_rejects_invalid_weights(weights):
+    with pytest.raises(ValueError):
+        allocate(100, weights)
+
+def test_equal_split():
+    assert split_cents([{}, {}, {}], 'equal', to_cents(10)) == [334, 333, 333]
+    assert split_cents([{}, {}], 'equal', to_cents(-0.01)) == [0, -1]
+
+def test_exact_split_must_add_up():
+    participants = [{'share_amount': 0.1}, {'share_amount': 0.2}]
+    assert split_cents(participants, 'exact', to_cents(0.3)) == [10, 20]
+    assert split_cents(participants, 'exact', to_cents(0.31)) is None
+
+@pytest.mark.parametrize('percentages', [
+    [33.33, 33.33, 33.33],
+    [33.34, 33.34, 33.33],
+    [50, 50],
+])
+def test_percentages_within_a_hundredth_are_accepted(percentages):
+    participants = [{'share_percentage': percentage} for percentage in percentages]
+    shares = split_cents(participants, 'percentage', 1000)
+    assert shares is not None
+    assert sum(shares) == 1000
+
+@pytest.mark.parametrize('percentages', [[33.33, 33.33, 33.32], [50, 50.02]])
+def test_percentages_further_off_are_rejected(percentages):
+    participants = [{'share_percentage': percentage} for percentage in percentages]
+    assert split_cents(participants, 'percentage', 1000) is None
+
+def test_to_cents_rounds_half_up_from_the_decimal_string():
+    assert to_cents(0.1 + 0.2) == 30
+    assert to_cents('1.005') == 101
+    assert to_cents(-1.005) == -101
+
+@pytest.mark.parametrize('amount', [1e30, '1e26', 2 ** 63 / 100, -(2 ** 63) / 100])
+def test_to_cents_rejects_amounts_out_of_range(amount):
+    with pytest.raises(ValueError):
+        to_cents(amount)
+
+def test_to_cents_accepts_the_largest_amount():
+    assert to_cents('92233720368547758.07') == 2 ** 63 - 1
+
+def test_expense_with_an_amount_out_of_range_is_rejected(client, users, headers):
+    a, b, _, _ = users
+    response = client.post('/expense', json={
+        'description': 'Too much', 'amount': 1e30, 'split_type': 'equal',
+        'participants': [{'user_id': a}, {'user_id': b}]
+    }, headers=headers[a])
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'Invalid split amounts'}